@@ -0,0 +1,245 @@
+"""Admission control for the bet endpoints.
+
+AdmissionMiddleware sits outside Flask. An over-limit request is answered with
+429 (or 503 when shedding) before its session is decoded or the users and
+ledger stores are touched. For requests to ADMISSION_PATHS it checks, in order:
+
+  queue     time since the proxy accepted the request (X-Request-Start, when set)
+            exceeds ADMISSION_MAX_QUEUE_MS; the client has likely given up already
+  inflight  more than ADMISSION_MAX_INFLIGHT bet requests already running in this
+            worker, so threads stay free for /metrics and the pages
+  ip        the client address's token bucket is empty. Off unless ADMISSION_IP_RATE
+            is set: behind a proxy every request comes from the proxy's address,
+            so the bucket only works with ADMISSION_TRUST_PROXY=1 and a proxy
+            that sets X-Forwarded-For, like the k8s ingress
+  user      the player's bucket is empty. With server-side sessions the player
+            is the session ID, once the store confirms it is live, so made-up
+            IDs get no bucket of their own. Cookie sessions have no server ID,
+            and Flask re-signs the cookie whenever the session changes, so
+            those players are bound by the IP bucket alone. API calls are
+            charged to the username in their bearer token once its signature
+            checks out, ahead of any cookie, so logging in again for a fresh
+            token does not reset the bucket
+
+Buckets live in process memory or, with ADMISSION_BACKEND=redis, in Redis so
+limits hold across workers and nodes. If Redis is unreachable, requests are
+let through.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Gauge
+
+from app.tokens import bearer_token
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_BACKEND = os.environ.get("ADMISSION_BACKEND", "memory")
+ADMISSION_REDIS_URL = os.environ.get("ADMISSION_REDIS_URL", os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+ADMISSION_PATHS = os.environ.get("ADMISSION_PATHS", "/slots,/roulette,/blackjack_bet,/api/v1/slots,/api/v1/roulette,"
+                                                     "/api/v1/blackjack,/api/v1/blackjack/action")
+ADMISSION_USER_RATE = float(os.environ.get("ADMISSION_USER_RATE", "5"))
+ADMISSION_USER_BURST = float(os.environ.get("ADMISSION_USER_BURST", "20"))
+ADMISSION_IP_RATE = float(os.environ.get("ADMISSION_IP_RATE", "0"))  # 0 = off
+ADMISSION_IP_BURST = float(os.environ.get("ADMISSION_IP_BURST", "60"))
+ADMISSION_MAX_INFLIGHT = int(os.environ.get("ADMISSION_MAX_INFLIGHT", "6"))  # 0 = no limit
+ADMISSION_MAX_QUEUE_MS = float(os.environ.get("ADMISSION_MAX_QUEUE_MS", "0"))  # 0 = off
+ADMISSION_TRUST_PROXY = os.environ.get("ADMISSION_TRUST_PROXY", "0") == "1"
+
+ADMISSION_REJECTED = Counter("casino_admission_rejected_total", "Requests rejected by admission control", ["reason"])
+ADMISSION_INFLIGHT = Gauge("casino_admission_inflight", "Bet requests currently running in this worker")
+
+log = logging.getLogger(__name__)
+
+class MemoryBuckets:
+    """Token buckets keyed by string, oldest idle keys dropped past `max_keys`."""
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """Spend one token. Returns (allowed, seconds until a token is available)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / self.rate
+
+class RedisBuckets:
+    """The same token bucket, updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, rate, burst, client, prefix):
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._script = client.register_script(self.SCRIPT)
+
+    def take(self, key, now=None):
+        now = time.time() if now is None else now
+        try:
+            allowed, tokens = self._script(keys=[self.prefix + key], args=[self.rate, self.burst, now])
+        except Exception as e:
+            log.warning("Admission check skipped, Redis unavailable: %s", e)
+            return True, 0.0
+        return bool(allowed), 0.0 if allowed else (1 - float(tokens)) / self.rate
+
+def make_buckets(backend=ADMISSION_BACKEND):
+    """(user buckets, ip buckets) for the configured backend; ip buckets are None when off."""
+    if backend == "redis":
+        import redis  # optional dependency, only needed for this backend
+        client = redis.Redis.from_url(ADMISSION_REDIS_URL)
+        return (RedisBuckets(ADMISSION_USER_RATE, ADMISSION_USER_BURST, client, "casino:admit:user:"),
+                RedisBuckets(ADMISSION_IP_RATE, ADMISSION_IP_BURST, client, "casino:admit:ip:")
+                if ADMISSION_IP_RATE else None)
+    if backend != "memory":
+        raise ValueError(f"Unknown ADMISSION_BACKEND: {backend}")
+    return (MemoryBuckets(ADMISSION_USER_RATE, ADMISSION_USER_BURST),
+            MemoryBuckets(ADMISSION_IP_RATE, ADMISSION_IP_BURST) if ADMISSION_IP_RATE else None)
+
+def queue_ms(environ, now=None):
+    """Milliseconds since the proxy's X-Request-Start ("t=<seconds or microseconds>"), or None."""
+    header = environ.get("HTTP_X_REQUEST_START")
+    if not header:
+        return None
+    try:
+        started = float(header.removeprefix("t="))
+    except ValueError:
+        return None
+    if started > 1e14:  # microseconds
+        started /= 1e6
+    elif started > 1e11:  # milliseconds
+        started /= 1e3
+    return max(0.0, ((time.time() if now is None else now) - started) * 1000)
+
+def digest(value):
+    return hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+class AdmissionMiddleware:
+    def __init__(self, wsgi_app, user_buckets, ip_buckets, paths=ADMISSION_PATHS, cookie_name="session",
+                 sessions=None, tokens=None, max_inflight=ADMISSION_MAX_INFLIGHT, max_queue_ms=ADMISSION_MAX_QUEUE_MS,
+                 trust_proxy=ADMISSION_TRUST_PROXY):
+        self.wsgi_app = wsgi_app
+        self.user_buckets = user_buckets
+        self.ip_buckets = ip_buckets  # None when the IP bucket is off
+        self.paths = {p.strip() for p in paths.split(",") if p.strip()}
+        self.cookie_name = cookie_name
+        self.sessions = sessions  # the server-side session store, None for cookie sessions
+        self.tokens = tokens  # the API's TokenSigner
+        self.max_inflight = max_inflight
+        self.max_queue_ms = max_queue_ms
+        self.trust_proxy = trust_proxy
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") not in self.paths:
+            return self.wsgi_app(environ, start_response)
+
+        if self.max_queue_ms:
+            waited = queue_ms(environ)
+            if waited is not None and waited > self.max_queue_ms:
+                return self.reject(start_response, "queue", 1.0)
+
+        with self._lock:
+            if self.max_inflight and self._inflight >= self.max_inflight:
+                shed = True
+            else:
+                shed = False
+                self._inflight += 1
+                ADMISSION_INFLIGHT.set(self._inflight)
+        if shed:
+            return self.reject(start_response, "inflight", 1.0)
+
+        try:
+            if self.ip_buckets is not None:
+                allowed, retry_after = self.ip_buckets.take(self.client_ip(environ))
+                if not allowed:
+                    return self.reject(start_response, "ip", retry_after)
+            key = self.user_key(environ)
+            if key:
+                allowed, retry_after = self.user_buckets.take(key)
+                if not allowed:
+                    return self.reject(start_response, "user", retry_after)
+            return self.wsgi_app(environ, start_response)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                ADMISSION_INFLIGHT.set(self._inflight)
+
+    def client_ip(self, environ):
+        if self.trust_proxy:
+            forwarded = environ.get("HTTP_X_FORWARDED_FOR")
+            if forwarded:
+                return forwarded.split(",", 1)[0].strip()
+        return environ.get("REMOTE_ADDR", "")
+
+    def user_key(self, environ):
+        """The user bucket a request is charged to, or None for the IP bucket only."""
+        token = bearer_token(environ.get("HTTP_AUTHORIZATION"))
+        if token and self.tokens is not None:
+            identity = self.tokens.identity(token)
+            if identity is not None:
+                return "user:" + identity[0]
+        sid = self.session_cookie(environ)
+        if sid and self.sessions is not None:
+            try:
+                live = self.sessions.get(sid) is not None
+            except Exception as e:
+                log.warning("Session store unavailable for admission: %s", e)
+                live = False
+            if live:
+                return "session:" + digest(sid)
+        return None
+
+    def session_cookie(self, environ):
+        prefix = self.cookie_name + "="
+        for part in environ.get("HTTP_COOKIE", "").split(";"):
+            part = part.strip()
+            if part.startswith(prefix):
+                return part[len(prefix):]
+        return None
+
+    def reject(self, start_response, reason, retry_after):
+        ADMISSION_REJECTED.labels(reason=reason).inc()
+        status = "429 Too Many Requests" if reason in ("ip", "user") else "503 Service Unavailable"
+        body = b"Too many requests, slow down.\n" if status.startswith("429") else b"Server busy, try again shortly.\n"
+        start_response(status, [("Content-Type", "text/plain; charset=utf-8"),
+                                ("Content-Length", str(len(body))),
+                                ("Retry-After", str(max(1, math.ceil(retry_after))))])
+        return [body]
@@ -0,0 +1,294 @@
+"""Finance reports over the transaction ledger, streamed and folded in parallel.
+
+A Summary folds ledger records into four reports:
+
+  rtp        per game: bets, coins wagered and returned, realized RTP
+  daily_ggr  per day: bets, wagered and gross gaming revenue (what players lost)
+  user_ltv   per user: bets, wagered, lifetime value (the GGR the user produced),
+             tips sent and received, admin adjustments, first and last activity
+  tip_flows  per (sender, recipient): tips and coins
+
+Summaries are mergeable. Merging the summaries of any partition of the ledger
+gives the summary of the whole ledger, in any order. analyze() uses this to
+spread the work over a process pool:
+
+  - balance_history.json as written by the app keeps one user per line. The
+    parent only cuts it into byte ranges of about ANALYTICS_RANGE_BYTES at
+    line starts. Each worker reads and parses its own range, so decoding, the
+    expensive part, runs on every core. A file in another layout, like the
+    indented one written before snapshots, is read with JsonStream in the
+    parent instead, and batches of users go to the workers.
+  - Each cold segment written by app/retention.py is one task, and the worker
+    reads it itself.
+
+Tasks go out with a bounded number in flight. Memory grows with the number
+of games, days, users and tip pairs, not with the number of records. The
+largest single entry held is one byte range, or one user's hot history.
+Records archived in cold segments that were already pruned are not counted.
+"""
+import gzip
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.jsonstream import JsonStream
+from app.retention import BET_TYPES, COLD_DIR, record_wager, segment_days, segment_path
+
+ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", "0")) or None  # default: CPU count
+ANALYTICS_BATCH_RECORDS = int(os.environ.get("ANALYTICS_BATCH_RECORDS", "50000"))
+ANALYTICS_RANGE_BYTES = int(os.environ.get("ANALYTICS_RANGE_BYTES", str(16 << 20)))
+
+REPORT_VERSION = 1
+PROGRESS_INTERVAL = 5  # seconds between progress callbacks
+
+TIP_RECIPIENT = re.compile(r"Tip sent to (.+)$")
+
+class Summary:
+    __slots__ = ("records", "games", "days", "users", "tips")
+
+    def __init__(self):
+        self.records = 0
+        self.games = {}  # game -> [bets, wagered, net]
+        self.days = {}  # day -> [bets, wagered, net]
+        self.users = {}  # username -> [bets, wagered, net, tips sent, tips received, adjustments, first, last]
+        self.tips = {}  # (sender, recipient) -> [tips, coins]
+
+    def add(self, username, record):
+        self.records += 1
+        kind = record.get("type")
+        amount = record.get("amount")
+        amount = amount if isinstance(amount, (int, float)) else 0
+        timestamp = record.get("timestamp") or ""
+
+        user = self.users.get(username)
+        if user is None:
+            user = self.users[username] = [0, 0, 0, 0, 0, 0, timestamp, timestamp]
+        elif timestamp:
+            if not user[6] or timestamp < user[6]:
+                user[6] = timestamp
+            if timestamp > user[7]:
+                user[7] = timestamp
+
+        if kind in BET_TYPES:
+            wager = record_wager(record)
+            game = self.games.get(kind) or self.games.setdefault(kind, [0, 0, 0])
+            day = timestamp[:10] or "unknown"
+            daily = self.days.get(day) or self.days.setdefault(day, [0, 0, 0])
+            for bucket in (game, daily, user):
+                bucket[0] += 1
+                bucket[1] += wager
+                bucket[2] += amount
+        elif kind == "tip_sent":
+            user[3] -= amount
+            match = TIP_RECIPIENT.match(record.get("details") or "")
+            edge = self.tips.setdefault((username, match.group(1) if match else "unknown"), [0, 0])
+            edge[0] += 1
+            edge[1] -= amount
+        elif kind == "tip_received":
+            user[4] += amount
+        elif kind and kind.startswith("admin_"):
+            user[5] += amount
+
+    def merge(self, other):
+        """Fold `other` into this summary, sharing its lists; `other` is not used afterwards."""
+        self.records += other.records
+        for mine, theirs in ((self.games, other.games), (self.days, other.days), (self.tips, other.tips)):
+            for key, values in theirs.items():
+                bucket = mine.get(key)
+                if bucket is None:
+                    mine[key] = values
+                else:
+                    for i, value in enumerate(values):
+                        bucket[i] += value
+        for username, values in other.users.items():
+            user = self.users.get(username)
+            if user is None:
+                self.users[username] = values
+                continue
+            for i in range(6):
+                user[i] += values[i]
+            if values[6] and (not user[6] or values[6] < user[6]):
+                user[6] = values[6]
+            if values[7] > user[7]:
+                user[7] = values[7]
+        return self
+
+    def reports(self):
+        """{report name: {column: list of values}}, rows in a stable order."""
+        games = sorted(self.games.items())
+        days = sorted(self.days.items())
+        users = sorted(self.users.items())
+        tips = sorted(self.tips.items(), key=lambda item: (-item[1][1], item[0]))
+        return {
+            "rtp": {
+                "game": [g for g, _ in games],
+                "bets": [v[0] for _, v in games],
+                "wagered": [v[1] for _, v in games],
+                "returned": [v[1] + v[2] for _, v in games],
+                "rtp": [round((v[1] + v[2]) / v[1], 6) if v[1] else None for _, v in games],
+            },
+            "daily_ggr": {
+                "day": [d for d, _ in days],
+                "bets": [v[0] for _, v in days],
+                "wagered": [v[1] for _, v in days],
+                "ggr": [-v[2] for _, v in days],
+            },
+            "user_ltv": {
+                "username": [u for u, _ in users],
+                "bets": [v[0] for _, v in users],
+                "wagered": [v[1] for _, v in users],
+                "ltv": [-v[2] for _, v in users],
+                "tips_sent": [v[3] for _, v in users],
+                "tips_received": [v[4] for _, v in users],
+                "adjustments": [v[5] for _, v in users],
+                "first_seen": [v[6] for _, v in users],
+                "last_seen": [v[7] for _, v in users],
+            },
+            "tip_flows": {
+                "sender": [s for (s, _), _ in tips],
+                "recipient": [r for (_, r), _ in tips],
+                "tips": [v[0] for _, v in tips],
+                "coins": [v[1] for _, v in tips],
+            },
+        }
+
+# Pool tasks
+
+def fold_batch(batch):
+    """Summary of [(username, records)] from the hot history."""
+    summary = Summary()
+    for username, records in batch:
+        for record in records:
+            summary.add(username, record)
+    return summary
+
+def fold_range(task):
+    """Summary of the users in one byte range (path, start, end) of a one-user-per-line history file."""
+    path, start, end = task
+    with open(path, "rb") as f:
+        f.seek(start)
+        # Not splitlines(): strings may hold raw U+2028 and other line breaks
+        lines = f.read(end - start).decode("utf-8").split("\n")
+    summary = Summary()
+    for line in lines:
+        line = line.rstrip(",")
+        if line in ("", "{", "}"):
+            continue
+        for username, records in json.loads("{" + line + "}").items():
+            for record in records:
+                summary.add(username, record)
+    return summary
+
+def fold_segment(path):
+    """Summary of one gzip NDJSON cold segment, read line by line."""
+    summary = Summary()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            summary.add(record.pop("username"), record)
+    return summary
+
+def iter_batches(stream, batch_records):
+    """Group a history stream's users into batches of about `batch_records` records."""
+    batch = []
+    size = 0
+    for username, records in stream:
+        batch.append((username, records))
+        size += len(records)
+        if size >= batch_records:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+def is_line_per_user(path):
+    """True if `path` starts the way write_store writes a history: "{", a newline, then a key or "}"."""
+    with open(path, "rb") as f:
+        return f.read(3) in (b'{\n"', b"{\n}")
+
+def iter_ranges(path, range_bytes):
+    """Yield (start, end) byte ranges of about `range_bytes` that each hold whole lines.
+
+    Every range but the first starts at a line beginning with a key. Compact
+    JSON never contains a raw newline, so these are the only places one
+    user's entry ends and the next begins.
+    """
+    size = os.path.getsize(path)
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(start + range_bytes)
+            end = None
+            while end is None:
+                offset = f.tell()
+                chunk = f.read(1 << 16)
+                if len(chunk) < 2:
+                    end = size
+                else:
+                    found = chunk.find(b'\n"')
+                    if found >= 0:
+                        end = offset + found + 1
+                    else:
+                        f.seek(-1, os.SEEK_CUR)  # a newline at the end may be followed by a key
+            yield start, end
+            start = end
+
+def analyze(history_file, cold_dir=COLD_DIR, workers=ANALYTICS_WORKERS, batch_records=ANALYTICS_BATCH_RECORDS,
+            progress=None, range_bytes=ANALYTICS_RANGE_BYTES):
+    """Summary of the hot history in `history_file` plus the cold segments in `cold_dir` (None to skip).
+
+    `progress(records, fraction of the hot file read)` is called every
+    PROGRESS_INTERVAL seconds.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    total = Summary()
+    total_bytes = os.path.getsize(history_file) if os.path.exists(history_file) else 0
+    last_report = time.monotonic()
+    bytes_done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+
+        def collect(future):
+            nonlocal last_report
+            total.merge(future.result())
+            now = time.monotonic()
+            if progress and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                progress(total.records, bytes_done / total_bytes if total_bytes else 0)
+
+        def submit(fn, arg):
+            in_flight.append(pool.submit(fn, arg))
+            if len(in_flight) >= max_in_flight:
+                collect(in_flight.popleft())
+
+        if cold_dir is not None:
+            for day in segment_days(cold_dir):
+                submit(fold_segment, segment_path(day, cold_dir))
+        if total_bytes and is_line_per_user(history_file):
+            for start, end in iter_ranges(history_file, range_bytes):
+                submit(fold_range, (history_file, start, end))
+                bytes_done = start
+        elif total_bytes:
+            with open(history_file, "rb") as f:
+                stream = JsonStream(f)
+                for batch in iter_batches(stream, batch_records):
+                    submit(fold_batch, batch)
+                    bytes_done = stream.bytes_read
+        while in_flight:
+            collect(in_flight.popleft())
+    return total
+
+def write_report(path, columns):
+    """Write one report as compact JSON columns: {"version", "rows", "columns": {name: values}}."""
+    rows = len(next(iter(columns.values()), ()))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": REPORT_VERSION, "rows": rows, "columns": columns}, f,
+                  separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -1,22 +1,80 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, Response
+from flask import Flask, Blueprint, request, redirect, url_for, session, flash, Response
 import random
 import json
 import os
 import time
 import functools
+import itertools
+import threading
+import logging
+import secrets
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from dotenv import load_dotenv
+from app.history import page, decode_cursor, clamp_page_size, iter_ledger, EXPORT_FORMATS
+from app.retention import expiry_cutoff, expired_records, archive, drop_expired, prune_cold, iter_cold, COMPACT_INTERVAL
+from app.hashing import hash_password, verify_password, needs_rehash, HashingBusy
+from app.concurrency import user_locks, store_lock
+from app.snapshot import LazyMap, open_snapshot, write_store
+from app.usertable import UserTable
+from app.profiler import ProfilerMiddleware, from_env as profiler_from_env
+from app.timing import span, timed, render_template, TimedSessionInterface, TimingMiddleware
+from app.logs import configure_logging
+from app.sessions import session_interface_from_env
+from app.caching import render_cached, static_url, finalize_response
+from app.admission import AdmissionMiddleware, make_buckets, ADMISSION_ENABLED
+from app.events import hub_from_env
+from app.lifecycle import Lifecycle, LifecycleMiddleware
+from app.blackjack import BlackjackRound, BETTING, PLAYING, FINISHED
+from app.strategy import StrategyTable
+from app.tokens import TokenSigner, bearer_token
+from app.bulk import BulkFileError, detect_format, parse_operations, plan_operations, summarize
 
 # Load environment variables from .env file
 load_dotenv()
+configure_logging()
+log = logging.getLogger(__name__)
+admin_log = logging.getLogger("app.admin")
+blackjack_log = logging.getLogger("app.blackjack")
+
 app = Flask(__name__)
 # Use environment variable for secret key, fallback to a secure default
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-production')
 
+# Sampling profiler, off unless PROFILER_ENABLED=1 or switched on from /admin/profiler
+profiler = profiler_from_env()
+app.wsgi_app = ProfilerMiddleware(app.wsgi_app, profiler, app.url_map)
+
+# ETags, compression and immutable static caching on every response
+app.after_request(finalize_response)
+app.jinja_env.globals["static_url"] = static_url
+
+# Server-side sessions when SESSION_BACKEND is memory or redis; the cookie then holds only an ID
+server_sessions = session_interface_from_env()
+if server_sessions:
+    app.session_interface = server_sessions
+
+# Server-Timing header with per-phase durations (SERVER_TIMING, SERVER_TIMING_LOG)
+app.session_interface = TimedSessionInterface(app.session_interface)
+app.wsgi_app = TimingMiddleware(app.wsgi_app)
+
+# Bearer tokens for the JSON API under /api/v1
+api_tokens = TokenSigner(app.secret_key)
+
+# Rate limits and load shedding for the bet endpoints, outermost so rejects skip all other work
+if ADMISSION_ENABLED:
+    app.wsgi_app = AdmissionMiddleware(app.wsgi_app, *make_buckets(), cookie_name=app.config["SESSION_COOKIE_NAME"],
+                                       sessions=server_sessions.store if server_sessions else None,
+                                       tokens=api_tokens)
+
+# /healthz, /readyz and the SIGTERM drain, outermost so probes never touch sessions or the store
+lifecycle = Lifecycle()
+app.wsgi_app = LifecycleMiddleware(app.wsgi_app, lifecycle)
+
 # Use environment variable for admin password - never hardcode passwords!
 ADMIN_PASS = os.environ.get('ADMIN_PASSWORD', 'change-this-default-password-immediately')
+# Richest users listed in the /admin table; only these are ranked, not every account
+ADMIN_TABLE_USERS = int(os.environ.get('ADMIN_TABLE_USERS', '500'))
 
 # Prometheus metrics
 REQUEST_COUNT = Counter('casino_requests_total', 'Total casino requests', ['method', 'endpoint', 'status'])
@@ -25,11 +83,27 @@ ACTIVE_USERS = Gauge('casino_active_users', 'Number of active users')
 GAMES_PLAYED = Counter('casino_games_played_total', 'Total games played', ['game_type', 'result'])
 USER_BALANCE = Gauge('casino_user_balance', 'User balance', ['username'])
 
-USERS_FILE = "users.json"
-BALANCE_HISTORY_FILE = "balance_history.json"
+# Blackjack EVs for /blackjack/hint, from the table at STRATEGY_TABLE (built on first use if missing)
+strategy_table = StrategyTable()
+
+# Live balance updates over Server-Sent Events (EVENTS_BACKEND=redis relays across workers)
+event_hub = hub_from_env()
+
+USERS_FILE = os.environ.get("USERS_FILE", "users.json")
+BALANCE_HISTORY_FILE = os.environ.get("BALANCE_HISTORY_FILE", "balance_history.json")
 
-# Load users from JSON file
+# Load users, from the binary snapshot when it is current, otherwise from JSON
 def load_users():
+    snap = open_snapshot(USERS_FILE)
+    if snap and snap.column_count == 3:
+        return UserTable(snap)
+    store = UserTable.from_dicts(load_users_json())
+    if os.path.exists(USERS_FILE):
+        write_store(store, USERS_FILE, as_list=True, columns=store.columns())
+        store.forget_records()
+    return store
+
+def load_users_json():
     if os.path.exists(USERS_FILE):
         try:
             with open(USERS_FILE, "r") as f:
@@ -49,12 +123,38 @@ def load_users():
             return []
     return []
 
-# Save users to JSON file
+# Save users to JSON file and its snapshot
+@timed("save-users")
 def save_users():
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=4)
+    global users_dirty
+    with store_lock:
+        # Cleared before writing, so a touch during the write is saved next time
+        users_dirty = False
+        write_store(users, USERS_FILE, as_list=True, columns=users.columns())
+
+# Set by touch(): the users table has changes that no save has written yet
+users_dirty = False
+
+def touch(user):
+    """Update a user's last-active time, saved with the next write of the users table."""
+    global users_dirty
+    user["last_active"] = time.time()
+    users_dirty = True
+
+@timed("lookup")
+def find_user(username):
+    return users.get(username)
 
 def load_balance_history():
+    snap = open_snapshot(BALANCE_HISTORY_FILE)
+    if snap:
+        return LazyMap(snap)
+    history = LazyMap(items=load_balance_history_json().items())
+    if os.path.exists(BALANCE_HISTORY_FILE):
+        write_store(history, BALANCE_HISTORY_FILE, as_list=False)
+    return history
+
+def load_balance_history_json():
     if os.path.exists(BALANCE_HISTORY_FILE):
         try:
             with open(BALANCE_HISTORY_FILE, "r") as f:
@@ -64,28 +164,94 @@ def load_balance_history():
     return {}
 
 def save_balance_history():
-    with open(BALANCE_HISTORY_FILE, "w") as f:
-        json.dump(balance_history, f, indent=4)
-
-def log_transaction(username, transaction_type, amount, details, result=None):
-    if username not in balance_history:
-        balance_history[username] = []
-    
-    user = next((u for u in users if u["username"] == username), None)
-    balance_after = user['balance'] if user else 'N/A'
-
-    balance_history[username].append({
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    with store_lock:
+        write_store(balance_history, BALANCE_HISTORY_FILE, as_list=False)
+
+def compact_history():
+    """Move expired transactions into rollups and cold segments, then save the history.
+
+    store_lock is held only to copy out the expired records and to swap in the
+    trimmed lists, so saves are not stalled behind the gzip writes.
+    """
+    cutoff = expiry_cutoff()
+    with store_lock:
+        expired = expired_records(balance_history, cutoff)
+    if expired:
+        archive(expired)
+        with store_lock:
+            drop_expired(balance_history, expired)
+            save_balance_history()
+        log.info("Compacted %d history records for %d users", sum(map(len, expired.values())), len(expired))
+    prune_cold(datetime.now())
+
+def compaction_loop():
+    """Compact the history every COMPACT_INTERVAL seconds, off the request path."""
+    while True:
+        time.sleep(COMPACT_INTERVAL)
+        try:
+            compact_history()
+        except Exception:
+            log.exception("History compaction failed")
+
+compaction_thread = None
+
+def append_ledger(entries):
+    """Append (username, record) pairs to the history and save it once."""
+    global compaction_thread
+    with store_lock:
+        for username, record in entries:
+            if username not in balance_history:
+                balance_history[username] = []
+            balance_history[username].append(record)
+        save_balance_history()
+        # Started by the first bet so each gunicorn worker gets its own, after the fork
+        if compaction_thread is None:
+            compaction_thread = threading.Thread(target=compaction_loop, name="history-compaction", daemon=True)
+            compaction_thread.start()
+
+def ledger_record(transaction_type, amount, details, balance_after, result=None, wager=None, timestamp=None):
+    return {
+        "timestamp": timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "type": transaction_type,
         "details": details,
         "amount": amount,
         "result": result,
-        "balance_after": balance_after
-    })
-    save_balance_history()
+        "balance_after": balance_after,
+        "wager": wager
+    }
+
+@timed("log-transaction")
+def log_transaction(username, transaction_type, amount, details, result=None, wager=None):
+    user = find_user(username)
+    balance_after = user['balance'] if user else 'N/A'
+
+    append_ledger([(username, ledger_record(transaction_type, amount, details, balance_after, result, wager))])
+
+    if user:
+        event_hub.publish(username, "balance", {"balance": balance_after, "type": transaction_type,
+                                                "amount": amount, "details": details})
 
+history_snapshot_current = open_snapshot(BALANCE_HISTORY_FILE) is not None
 users = load_users()
 balance_history = load_balance_history()
+# Compaction walks every user's history, so a snapshot start leaves it to the background thread
+if not history_snapshot_current:
+    compact_history()
+
+def flush_stores():
+    """Write last-active times not saved by any bet; the ledger is saved on every append.
+
+    Workers with nothing unsaved skip the write, so an idle worker cannot
+    replace users.json with its stale copy on shutdown.
+    """
+    if users_dirty:
+        save_users()
+
+lifecycle.on_shutdown(flush_stores)
+lifecycle.add_check("storage", lambda: os.access(os.path.dirname(os.path.abspath(USERS_FILE)), os.W_OK))
+if server_sessions and hasattr(server_sessions.store, "client"):
+    lifecycle.add_check("sessions", lambda: server_sessions.store.client.ping())
+lifecycle.mark_ready()
 
 # Metrics tracking decorator
 import time
@@ -96,7 +262,8 @@ def track_metrics(f):
     def decorated_function(*args, **kwargs):
         start_time = time.time()
         try:
-            response = f(*args, **kwargs)
+            with span("logic"):
+                response = f(*args, **kwargs)
             status = getattr(response, 'status_code', 200) if hasattr(response, 'status_code') else 200
             REQUEST_COUNT.labels(method=request.method, endpoint=request.endpoint, status=status).inc()
             return response
@@ -108,47 +275,98 @@ def track_metrics(f):
             REQUEST_DURATION.observe(time.time() - start_time)
     return decorated_function
 
+def locks_user(f):
+    """Run the route under the logged-in user's balance lock."""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        username = session.get("username")
+        if username is None:
+            return f(*args, **kwargs)
+        with user_locks.hold(username):
+            return f(*args, **kwargs)
+    return decorated_function
+
 def current_user():
     if "username" in session:
-        user = next((u for u in users if u["username"] == session["username"]), None)
+        user = find_user(session["username"])
         if user:
-            # Update last active timestamp
-            user["last_active"] = time.time()
+            touch(user)
         return user
     return None
 
+def regenerate_session():
+    """New session ID before login or admin access, against session fixation.
+
+    Server-side sessions move to a fresh ID. Cookie sessions carry no server
+    ID to fix, and the changed cookie is re-signed anyway.
+    """
+    if server_sessions:
+        session.regenerate()
+
 def require_login():
     if "username" not in session:
         return redirect(url_for("login"))
 
+def sign_in(username, password):
+    """Check a login, registering unknown usernames with 1000 coins.
+
+    Returns (user, created); user is None for a wrong password. Raises HashingBusy.
+    Hashing runs outside the user's lock, which is held only to store the result.
+    """
+    user = find_user(username)
+    created = False
+    if user:
+        pwhash = user["password"]
+        if not verify_password(pwhash, password):
+            return None, False
+        if needs_rehash(pwhash):
+            # Upgrade hashes made with outdated parameters while we have the plaintext
+            new_hash = hash_password(password)
+            with user_locks.hold(username):
+                if user["password"] == pwhash:
+                    user["password"] = new_hash
+    else:
+        new_hash = hash_password(password)
+        # Under the user's lock so two concurrent sign-ups cannot both register the name
+        with user_locks.hold(username):
+            user = find_user(username)
+            if user is None:
+                # Register new user with 1000 coins
+                new_user = {"username": username, "password": new_hash, "balance": 1000, "is_admin": False}
+                with store_lock:
+                    user = users.append(new_user)
+                created = True
+        if not created:
+            # Registered by another request while we hashed: check against that password
+            return sign_in(username, password)
+
+    touch(user)
+    save_users()
+    return user, created
+
 @app.route("/", methods=["GET", "POST"])
 @track_metrics
 def login():
     if request.method == "POST":
         username = request.form["username"].strip()
         password = request.form["password"]
-        
-        user = next((u for u in users if u["username"] == username), None)
 
-        if user:
-            if not check_password_hash(user["password"], password):
-                flash("Incorrect password")
-                return redirect(url_for("login"))
-        else:
-            # Register new user with 1000 coins
-            user = {"username": username, "password": generate_password_hash(password), "balance": 1000, "is_admin": False}
-            users.append(user)
-            save_users()
+        try:
+            user, created = sign_in(username, password)
+        except HashingBusy:
+            flash("The server is busy, please try logging in again in a moment")
+            return render_template("login.html"), 503
+        if user is None:
+            flash("Incorrect password")
+            return redirect(url_for("login"))
+        if created:
             flash(f"Account created for {username} with 1000 coins")
-        
-        # Update last active timestamp
-        user["last_active"] = time.time()
-        save_users()
-        
+
+        regenerate_session()
         session["username"] = username
         session["is_admin"] = user["is_admin"]
         return redirect(url_for("menu"))
-    return render_template("login.html")
+    return render_cached("login.html")
 
 @app.route("/logout")
 def logout():
@@ -160,7 +378,7 @@ def logout():
 def menu():
     if not current_user():
         return redirect(url_for("login"))
-    return render_template("menu.html", balance=current_user()["balance"], username=session["username"])
+    return render_cached("menu.html", balance=current_user()["balance"], username=session["username"])
 
 @app.route("/balance")
 def check_balance():
@@ -169,43 +387,83 @@ def check_balance():
         return redirect(url_for("login"))
     return render_template("balance.html", balance=user["balance"])
 
-@app.route("/tip", methods=["GET", "POST"])
-def tip():
+def export_response(rows, fmt, filename):
+    render_lines, mimetype = EXPORT_FORMATS[fmt]
+    return Response(render_lines(rows), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"})
+
+@app.route("/history")
+@track_metrics
+def history():
     user = current_user()
     if not user:
         return redirect(url_for("login"))
 
-    if request.method == "POST":
-        to_username = request.form.get("username", "").strip()
-        amount = request.form.get("amount", "0").strip()
-        
-        to_user = next((u for u in users if u["username"] == to_username), None)
-
-        if not to_user:
-            flash("User does not exist")
-            return redirect(url_for("tip"))
-        try:
-            amount = int(amount)
-            if amount <= 0:
-                raise ValueError()
-        except ValueError:
-            flash("Invalid amount")
-            return redirect(url_for("tip"))
+    username = user["username"]
+    fmt = request.args.get("format", "html")
+    if fmt in EXPORT_FORMATS:
+        return export_response(iter_ledger(balance_history, username), fmt, f"{username}-history")
+
+    cursor = request.args.get("cursor")
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            if fmt == "json":
+                return {"error": "Invalid cursor"}, 400
+            flash("Invalid history cursor")
+            return redirect(url_for("history"))
+
+    limit = clamp_page_size(request.args.get("limit"))
+    items, next_cursor = page(balance_history.get(username, []), position, limit)
+    if fmt == "json":
+        return {"items": items, "next_cursor": next_cursor}
+    return render_template("balance.html", balance=user["balance"], history=items,
+                           next_cursor=next_cursor, limit=limit)
+
+def send_tip(user, to_username, amount):
+    """Move `amount` coins (form or JSON input) from `user` to `to_username`.
+
+    Returns (coins sent, None), or (None, error message) with nothing changed.
+    """
+    to_user = find_user(to_username)
+
+    if not to_user:
+        return None, "User does not exist"
+    try:
+        amount = int(str(amount).strip())
+        if amount <= 0:
+            raise ValueError()
+    except ValueError:
+        return None, "Invalid amount"
+    if to_username == user["username"]:
+        return None, "Cannot tip yourself"
+    # Lock both parties (in stripe order) so the balance check and transfer are atomic
+    with user_locks.hold(user["username"], to_username):
         if amount > user["balance"]:
-            flash("Insufficient balance")
-            return redirect(url_for("tip"))
-        if to_username == session["username"]:
-            flash("Cannot tip yourself")
-            return redirect(url_for("tip"))
+            return None, "Insufficient balance"
         # Transfer coins
         user["balance"] -= amount
         to_user["balance"] += amount
         save_users()
-        
+
         # Log the transactions
         log_transaction(user["username"], "tip_sent", -amount, f"Tip sent to {to_username}", "sent")
         log_transaction(to_user["username"], "tip_received", amount, f"Tip received from {user['username']}", "received")
-        
+    return amount, None
+
+@app.route("/tip", methods=["GET", "POST"])
+def tip():
+    user = current_user()
+    if not user:
+        return redirect(url_for("login"))
+
+    if request.method == "POST":
+        to_username = request.form.get("username", "").strip()
+        amount, error = send_tip(user, to_username, request.form.get("amount", "0"))
+        if error:
+            flash(error)
+            return redirect(url_for("tip"))
         flash(f"Tipped {amount} coins to {to_username}")
         return redirect(url_for("menu"))
     return render_template("tip.html", balance=user["balance"])
@@ -215,6 +473,7 @@ def admin_auth():
     if request.method == "POST":
         password = request.form.get("password")
         if password == ADMIN_PASS:
+            regenerate_session()
             session["admin_authenticated"] = True
             flash("Admin access granted!", "success")
             return redirect(url_for("admin"))
@@ -234,9 +493,8 @@ def admin():
         action = request.form.get("action")
         amount_str = request.form.get("amount", "0")
         
-        # Debug logging
-        print(f"DEBUG Admin Form Data: username={username}, action={action}, amount={amount_str}")
-        print(f"DEBUG Form keys: {list(request.form.keys())}")
+        admin_log.debug("Admin form data: username=%s action=%s amount=%s keys=%s",
+                        username, action, amount_str, list(request.form.keys()))
         
         try:
             amount = int(amount_str)
@@ -244,7 +502,7 @@ def admin():
             flash("Invalid amount provided.", "error")
             return redirect(url_for("admin"))
         
-        user = next((u for u in users if u["username"] == username), None)
+        user = find_user(username)
 
         if not user:
             flash(f"User '{username}' not found.", "error")
@@ -254,38 +512,89 @@ def admin():
             flash("No action specified.", "error")
             return redirect(url_for("admin"))
             
-        old_balance = user["balance"]
-        print(f"DEBUG: User {username} old balance: {old_balance}")
+        with user_locks.hold(username):
+            old_balance = user["balance"]
         
-        if action == "add":
-            user["balance"] += amount
-            log_transaction(username, "admin_add", amount, f"Admin added {amount} coins")
-            flash(f"✅ Successfully added {amount:,} coins to {username}'s balance. New balance: {user['balance']:,}", "success")
-        elif action == "subtract":
-            if user["balance"] < amount:
-                flash(f"⚠️ Cannot subtract {amount:,} coins. {username} only has {user['balance']:,} coins.", "warning")
-                return redirect(url_for("admin"))
-            user["balance"] -= amount
-            log_transaction(username, "admin_subtract", -amount, f"Admin subtracted {amount} coins")
-            flash(f"✅ Successfully removed {amount:,} coins from {username}'s balance. New balance: {user['balance']:,}", "success")
-        elif action == "set":
-            if amount < 0:
-                flash("Balance cannot be negative.", "error")
+            if action == "add":
+                user["balance"] += amount
+                log_transaction(username, "admin_add", amount, f"Admin added {amount} coins")
+                flash(f"✅ Successfully added {amount:,} coins to {username}'s balance. New balance: {user['balance']:,}", "success")
+            elif action == "subtract":
+                if user["balance"] < amount:
+                    flash(f"⚠️ Cannot subtract {amount:,} coins. {username} only has {user['balance']:,} coins.", "warning")
+                    return redirect(url_for("admin"))
+                user["balance"] -= amount
+                log_transaction(username, "admin_subtract", -amount, f"Admin subtracted {amount} coins")
+                flash(f"✅ Successfully removed {amount:,} coins from {username}'s balance. New balance: {user['balance']:,}", "success")
+            elif action == "set":
+                if amount < 0:
+                    flash("Balance cannot be negative.", "error")
+                    return redirect(url_for("admin"))
+                user["balance"] = amount
+                balance_change = amount - old_balance
+                log_transaction(username, "admin_set", balance_change, f"Admin set balance to {amount} coins")
+                flash(f"✅ Successfully set {username}'s balance to {amount:,} coins.", "success")
+            else:
+                flash(f"Unknown action: {action}", "error")
                 return redirect(url_for("admin"))
-            user["balance"] = amount
-            balance_change = amount - old_balance
-            log_transaction(username, "admin_set", balance_change, f"Admin set balance to {amount} coins")
-            flash(f"✅ Successfully set {username}'s balance to {amount:,} coins.", "success")
-        else:
-            flash(f"Unknown action: {action}", "error")
-            return redirect(url_for("admin"))
             
-        print(f"DEBUG: User {username} new balance: {user['balance']}")
-        save_users()
-        print("DEBUG: Users saved successfully")
+            save_users()
+            admin_log.info("Admin %s for %s: %s -> %s", action, username, old_balance, user["balance"])
         return redirect(url_for("admin"))
 
-    return render_template("admin.html", users=users)
+    stats = {"count": len(users), "total_balance": users.total_balance(), "admins": users.admin_count()}
+    return render_template("admin.html", stats=stats, usernames=users.usernames(), ranked=users.ranked(ADMIN_TABLE_USERS))
+
+@app.route("/admin/bulk", methods=["POST"])
+def admin_bulk():
+    """Apply a CSV or NDJSON file of add/subtract/set operations in one pass.
+
+    The file comes as the `file` upload or the raw request body. `format`
+    overrides detection from the file name or content type, and `atomic=1`
+    applies nothing unless every row is valid.
+    """
+    if not session.get("admin_authenticated"):
+        return {"error": "Admin authentication required"}, 401
+
+    upload = request.files.get("file")
+    data = upload.read() if upload else request.get_data()
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return {"error": "Bulk file must be UTF-8"}, 400
+    fmt = request.values.get("format") or detect_format(
+        text, upload.filename if upload else None, upload.mimetype if upload else request.mimetype)
+    atomic = request.values.get("atomic") in ("1", "true", "yes")
+    try:
+        results = parse_operations(text, fmt)
+    except BulkFileError as e:
+        return {"error": str(e)}, 400
+
+    usernames = {r["op"]["username"] for r in results if "op" in r}
+    with user_locks.hold(*usernames):
+        def balance_of(username):
+            user = find_user(username)
+            return user["balance"] if user else None
+
+        balances = plan_operations(results, balance_of, atomic)
+        if balances:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for username, balance in balances.items():
+                find_user(username)["balance"] = balance
+            append_ledger([(r["username"], ledger_record(f"admin_{r['action']}", r["change"],
+                                                         f"Admin bulk {r['action']} {r['amount']} coins",
+                                                         r["balance"], timestamp=timestamp))
+                           for r in results if r["status"] == "ok"])
+            save_users()
+    for username, balance in balances.items():
+        event_hub.publish(username, "balance", {"balance": balance, "type": "admin_bulk", "amount": None,
+                                                "details": "Admin bulk update"})
+
+    report = summarize(results)
+    admin_log.info("Admin bulk %s: %d applied, %d failed, %d skipped, %d users changed",
+                   fmt, report["applied"], report["failed"], report["skipped"], len(balances))
+    status = 422 if atomic and report["failed"] else 200
+    return report, status
 
 @app.route("/admin_logout")
 def admin_logout():
@@ -293,454 +602,271 @@ def admin_logout():
     flash("Admin session ended.", "info")
     return redirect(url_for("menu"))
 
+@app.route("/admin/history/export")
+def admin_history_export():
+    if not session.get("admin_authenticated"):
+        return redirect(url_for("admin_auth"))
+
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        return {"error": f"Unknown export format: {fmt}"}, 400
+
+    username = request.args.get("username") or None
+    rows = iter_ledger(balance_history, username)
+    if request.args.get("archived") == "1":
+        # Archived records are older, so they go first to keep the export in time order
+        rows = itertools.chain(iter_cold(username), rows)
+    elif username is not None and username not in balance_history:
+        return {"error": f"No history for user '{username}'"}, 404
+    return export_response(rows, fmt, username or "ledger")
+
+@app.route("/admin/profiler", methods=["GET", "POST"])
+def admin_profiler():
+    if not session.get("admin_authenticated"):
+        return redirect(url_for("admin_auth"))
+
+    if request.method == "POST":
+        data = request.get_json(silent=True) or request.form
+        endpoints = data.get("endpoints")
+        if isinstance(endpoints, str):
+            endpoints = endpoints.split(",")
+        enabled = data.get("enabled")
+        if isinstance(enabled, str):
+            enabled = enabled.lower() in ("1", "true", "on", "yes")
+        try:
+            profiler.configure(enabled=enabled, rate=data.get("rate"), endpoints=endpoints,
+                               interval_ms=data.get("interval_ms"), reset=bool(data.get("reset")))
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid profiler setting: {e}"}, 400
+
+    limit = request.args.get("limit", 25, type=int)
+    return {**profiler.status(), "top": profiler.top(limit)}
+
+@app.route("/admin/profiler/collapsed")
+def admin_profiler_collapsed():
+    if not session.get("admin_authenticated"):
+        return redirect(url_for("admin_auth"))
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
+@app.route("/events")
+def events():
+    username = session.get("username")
+    if not username:
+        return Response("Login required.\n", status=401, mimetype="text/plain")
+    subscriber = event_hub.subscribe(username)
+    if subscriber is None:
+        return Response("Too many live connections, reload the page for updates.\n", status=503,
+                        mimetype="text/plain", headers={"Retry-After": "30"})
+    response = Response(event_hub.stream(subscriber), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # The generator's finally never runs if the client leaves before the body starts
+    response.call_on_close(functools.partial(event_hub.unsubscribe, subscriber))
+    return response
+
 @app.route("/metrics")
 def metrics():
     # Update active users gauge
-    ACTIVE_USERS.set(len([u for u in users if u.get('last_active', 0) > time.time() - 3600]))
+    ACTIVE_USERS.set(users.active_since(time.time() - 3600))
     
     # Update user balance metrics
-    for user in users:
-        USER_BALANCE.labels(username=user['username']).set(user['balance'])
+    for username, balance in users.balances_by_username():
+        USER_BALANCE.labels(username=username).set(balance)
     
     return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
-##############################
-# Blackjack helper functions #
-##############################
-
-suits = ['♠', '♥', '♦', '♣']
-values = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-
-def create_deck():
-    return [v + s for s in suits for v in values]
-
-def card_value(card):
-    val = card[:-1]
-    if val in ['J', 'Q', 'K']:
-        return 10
-    if val == 'A':
-        return 11
-    return int(val)
-
-def hand_value(hand):
-    total = 0
-    aces = 0
-    for card in hand:
-        v = card_value(card)
-        total += v
-        if card[:-1] == 'A':
-            aces += 1
-    while total > 21 and aces:
-        total -= 10
-        aces -= 1
-    return total
+#########################
+# Blackjack implementation
+#########################
+
+# The page round lives in the session, which is the client's cookie by default.
+# Its id is also kept on the user record from the bet until the payout, so a
+# replayed cookie holding an already settled round is refused.
+OPEN_ROUND_KEY = "blackjack_round"
 
 @app.route("/blackjack_bet", methods=["GET", "POST"])
 @track_metrics
+@locks_user
 def blackjack_bet():
     user = current_user()
     if not user:
         return redirect(url_for("login"))
 
     if "blackjack" not in session:
-        # Start a new game
-        deck = create_deck()
-        random.shuffle(deck)
-        session["blackjack"] = {
-            "deck": deck,
-            "player_hand": [deck.pop(), deck.pop()],
-            "dealer_hand": [deck.pop(), deck.pop()],
-            "bet": 0,
-            "balance": user["balance"],
-            "state": "betting",  # betting, playing, dealer_turn, finished
-        }
+        # Deal a new round; the cards stay hidden until the bet is placed
+        session["blackjack"] = BlackjackRound.deal(user["balance"]).to_session()
         return render_template("blackjack_bet.html", balance=user["balance"])
 
-    bj = session["blackjack"]
+    rnd = BlackjackRound.from_session(session["blackjack"])
+    round_id = session.get("blackjack_id")
+    if rnd is None or rnd.state != BETTING and (round_id is None or round_id != user.get(OPEN_ROUND_KEY)):
+        session.pop("blackjack")
+        session.pop("blackjack_id", None)
+        flash("That round is already over")
+        return redirect(url_for("blackjack_bet"))
 
-    if bj["state"] == "betting":
+    if rnd.state == BETTING:
         if request.method == "POST":
-            bet = request.form.get("bet", "0")
+            if lifecycle.draining:
+                # Rounds already in play are finished here, but new ones go to another worker
+                flash("The server is restarting, please place your bet again in a moment")
+                return render_template("blackjack_bet.html", balance=user["balance"]), 503, {"Retry-After": "1"}
             try:
-                bet = int(bet)
-                if bet <= 0 or bet > user["balance"]:
-                    flash("Invalid bet amount")
-                    return render_template("blackjack_bet.html", balance=user["balance"])
+                bet = int(request.form.get("bet", "0"))
             except ValueError:
+                bet = 0
+            if bet <= 0 or bet > user["balance"]:
                 flash("Invalid bet amount")
                 return render_template("blackjack_bet.html", balance=user["balance"])
 
-            bj["bet"] = bet
-            bj["balance"] = user["balance"] - bet
-            bj["state"] = "playing"
-            session["blackjack"] = bj
+            # Take the stake now so it cannot be spent in another game mid-round
+            user["balance"] -= bet
+            user[OPEN_ROUND_KEY] = session["blackjack_id"] = secrets.token_hex(8)
+            save_users()
+            rnd.place_bet(bet, user["balance"])
+            session["blackjack"] = rnd.to_session()
             return redirect(url_for("blackjack_bet"))
         return render_template("blackjack_bet.html", balance=user["balance"])
 
-    if bj["state"] == "playing":
-        deck = bj["deck"]
-        dealer_hand = bj["dealer_hand"]
-        
-        # Handle split vs normal hands
-        is_split = "is_split" in bj and bj["is_split"]
-        if is_split:
-            # Always get a fresh copy of the current hand to avoid reference issues
-            player_hand = bj["player_hands"][bj["current_hand"]].copy()
-            print(f"DEBUG: Loading hand {bj['current_hand']}: {player_hand}")
-            print(f"DEBUG: All hands in session: {bj['player_hands']}")
-        else:
-            player_hand = bj["player_hand"]
-
-        if request.method == "POST":
-            action = request.form.get("action")
-            if action == "hit":
-                new_card = deck.pop()
-                player_hand.append(new_card)
-                player_val = hand_value(player_hand)
-                
-                # Debug logging for hits
-                if is_split:
-                    print(f"DEBUG: Hit - Current hand {bj['current_hand']}: added {new_card}")
-                    print(f"DEBUG: Hit - Hand after hit: {player_hand}")
-                    print(f"DEBUG: Hit - All hands: {bj['player_hands']}")
-                else:
-                    print(f"DEBUG: Hit - Single hand: added {new_card}, hand: {player_hand}")
-                if player_val > 21:
-                    # Handle bust for split hands
-                    if is_split:
-                        bj["player_hands"][bj["current_hand"]] = player_hand.copy()
-                        print(f"DEBUG: Bust - Hand {bj['current_hand']} busted with: {player_hand}")
-                        print(f"DEBUG: Bust - All hands before transition: {bj['player_hands']}")
-                        # Move to next hand or finish
-                        if bj["current_hand"] < len(bj["player_hands"]) - 1:
-                            bj["current_hand"] += 1
-                            print(f"DEBUG: Bust - Moved to hand {bj['current_hand']}")
-                            # Update session immediately and redirect to reload the new hand
-                            bj["deck"] = deck
-                            session["blackjack"] = bj
-                            return redirect(url_for("blackjack_bet"))
-                        else:
-                            bj["state"] = "dealer_turn"
-                    else:
-                        bj["state"] = "finished"  # Bust - automatic loss
-                elif player_val == 21:
-                    # Handle 21 for split hands
-                    if is_split:
-                        bj["player_hands"][bj["current_hand"]] = player_hand.copy()
-                        print(f"DEBUG: 21 - Hand {bj['current_hand']} got 21 with: {player_hand}")
-                        # Move to next hand or go to dealer turn
-                        if bj["current_hand"] < len(bj["player_hands"]) - 1:
-                            bj["current_hand"] += 1
-                            print(f"DEBUG: 21 - Moved to hand {bj['current_hand']}")
-                            # Update session immediately and redirect to reload the new hand
-                            bj["deck"] = deck
-                            session["blackjack"] = bj
-                            return redirect(url_for("blackjack_bet"))
-                        else:
-                            bj["state"] = "dealer_turn"
-                    else:
-                        bj["state"] = "dealer_turn"  # 21 - go to dealer turn
-            elif action == "stand":
-                if is_split:
-                    bj["player_hands"][bj["current_hand"]] = player_hand.copy()
-                    print(f"DEBUG: Stand - Hand {bj['current_hand']} stood with: {player_hand}")
-                    # Move to next hand or go to dealer turn
-                    if bj["current_hand"] < len(bj["player_hands"]) - 1:
-                        bj["current_hand"] += 1
-                        print(f"DEBUG: Stand - Moved to hand {bj['current_hand']}")
-                        # Update session immediately and redirect to reload the new hand
-                        bj["deck"] = deck
-                        session["blackjack"] = bj
-                        return redirect(url_for("blackjack_bet"))
-                    else:
-                        bj["state"] = "dealer_turn"
-                else:
-                    bj["state"] = "dealer_turn"
-            elif action == "double":
-                # Double down: double the bet, take one card, then stand
-                current_bet = bj["split_bets"][bj["current_hand"]] if is_split else bj["bet"]
-                if len(player_hand) == 2 and user["balance"] >= current_bet:
-                    user["balance"] -= current_bet  # Deduct additional bet
-                    if is_split:
-                        bj["split_bets"][bj["current_hand"]] *= 2  # Double the bet for this hand
-                    else:
-                        bj["bet"] *= 2  # Double the bet
-                    bj["balance"] = user["balance"]  # Update balance in session
-                    player_hand.append(deck.pop())  # Take exactly one card
-                    player_val = hand_value(player_hand)
-                    
-                    if is_split:
-                        bj["player_hands"][bj["current_hand"]] = player_hand.copy()
-                        print(f"DEBUG: Double - Hand {bj['current_hand']} doubled with: {player_hand}")
-                        # Move to next hand or go to dealer turn
-                        if bj["current_hand"] < len(bj["player_hands"]) - 1:
-                            bj["current_hand"] += 1
-                            print(f"DEBUG: Double - Moved to hand {bj['current_hand']}")
-                            # Update session immediately and redirect to reload the new hand
-                            bj["deck"] = deck
-                            session["blackjack"] = bj
-                            return redirect(url_for("blackjack_bet"))
-                        else:
-                            bj["state"] = "dealer_turn"
-                    else:
-                        if player_val > 21:
-                            bj["state"] = "finished"  # Bust after double down
-                        else:
-                            bj["state"] = "dealer_turn"  # Go to dealer turn regardless of value
-                    save_users()  # Save the balance change immediately
-            elif action == "split":
-                # Split: split pair into two hands, requires additional bet
-                if (not is_split and len(player_hand) == 2 and player_hand[0][:-1] == player_hand[1][:-1] 
-                    and user["balance"] >= bj["bet"]):
-                    user["balance"] -= bj["bet"]  # Deduct additional bet for second hand
-                    bj["balance"] = user["balance"]  # Update balance in session
-                    
-                    # Create two hands from the split
-                    # Ensure deck has enough cards and is properly shuffled
-                    if len(deck) < 10:  # Reshuffle if running low
-                        deck = create_deck()
-                        random.shuffle(deck)
-                    
-                    # Deal cards for split hands
-                    first_new_card = deck.pop()
-                    second_new_card = deck.pop()
-                    
-                    first_hand = [player_hand[0], first_new_card]  # First original card + new card
-                    second_hand = [player_hand[1], second_new_card]  # Second original card + new card
-                    
-                    # Debug logging
-                    print(f"DEBUG: Split - Original cards: {player_hand[0]}, {player_hand[1]}")
-                    print(f"DEBUG: Split - New cards: {first_new_card}, {second_new_card}")
-                    print(f"DEBUG: Split - First hand: {first_hand}")
-                    print(f"DEBUG: Split - Second hand: {second_hand}")
-                    print(f"DEBUG: Split - Deck remaining: {len(deck)}")
-                    
-                    # Store split hands in session (ensure they're independent lists)
-                    bj["player_hands"] = [first_hand.copy(), second_hand.copy()]  # Array of hands
-                    bj["current_hand"] = 0  # Which hand we're playing (0 or 1)
-                    bj["split_bets"] = [bj["bet"], bj["bet"]]  # Bet for each hand
-                    bj["is_split"] = True
-                    
-                    # Remove the original single hand
-                    del bj["player_hand"]
-                    
-                    save_users()  # Save the balance change immediately
-
-            # Update the appropriate hand (only if we haven't already returned)
-            if is_split:
-                bj["player_hands"][bj["current_hand"]] = player_hand.copy()  # Ensure we store a copy
-                print(f"DEBUG: Updated hand {bj['current_hand']} to: {bj['player_hands'][bj['current_hand']]}")
-                print(f"DEBUG: All hands after update: {bj['player_hands']}")
-            else:
-                bj["player_hand"] = player_hand
-            bj["deck"] = deck
-            session["blackjack"] = bj
-            return redirect(url_for("blackjack_bet"))
-        else:
-            # Check for natural blackjack (21 with first 2 cards)
-            player_val = hand_value(player_hand)
-            dealer_val = hand_value(dealer_hand)
-            
-            # If player has natural blackjack and dealer doesn't show ace or 10
-            if len(player_hand) == 2 and player_val == 21:
-                if len(dealer_hand) == 2 and hand_value(dealer_hand) == 21:
-                    # Both have blackjack - push
-                    bj["state"] = "finished"
-                    session["blackjack"] = bj
-                    return redirect(url_for("blackjack_bet"))
-                else:
-                    # Player has blackjack, dealer doesn't
-                    bj["state"] = "finished"
-                    session["blackjack"] = bj
-                    return redirect(url_for("blackjack_bet"))
-            
-            # GET request: render game state page
-            template_vars = {
-                "dealer_hand": dealer_hand,
-                "dealer_value": hand_value(dealer_hand),
-                "balance": bj["balance"],
-                "bj": bj,
-                "bj_state": bj["state"]
-            }
-            
-            # Handle split vs normal hands for template
-            if is_split:
-                hand_values = [hand_value(hand) for hand in bj["player_hands"]]
-                template_vars.update({
-                    "player_hands": bj["player_hands"],
-                    "current_hand": bj["current_hand"],
-                    "player_hand": bj["player_hands"][bj["current_hand"]],  # Current active hand
-                    "player_value": hand_value(bj["player_hands"][bj["current_hand"]]),
-                    "hand_values": hand_values,
-                    "is_split": True,
-                    "split_bets": bj["split_bets"]
-                })
-            else:
-                template_vars.update({
-                    "player_hand": player_hand,
-                    "player_value": hand_value(player_hand),
-                    "is_split": False
-                })
-            
-            return render_template("blackjack_play.html", **template_vars)
-
-    if bj["state"] == "dealer_turn":
-        deck = bj["deck"]
-        dealer_hand = bj["dealer_hand"]
-
-        while hand_value(dealer_hand) < 17:
-            dealer_hand.append(deck.pop())
-
-        bj["dealer_hand"] = dealer_hand
-        bj["state"] = "finished"
-        session["blackjack"] = bj
+    if rnd.state == PLAYING and request.method == "POST":
+        action = request.form.get("action")
+        stake = rnd.act(action, user["balance"])
+        if stake:
+            user["balance"] -= stake
+            save_users()  # Save the extra stake immediately
+        blackjack_log.debug("%s: hand %d now %s (state %s)", action, rnd.current, rnd.hand.cards, rnd.state)
+        session["blackjack"] = rnd.to_session()
         return redirect(url_for("blackjack_bet"))
 
-    if bj["state"] == "finished":
-        dealer_hand = bj["dealer_hand"]
-        dealer_val = hand_value(dealer_hand)
-        balance = bj["balance"]
-        
-        # Handle split vs normal hands
-        is_split = "is_split" in bj and bj["is_split"]
-        
-        if is_split:
-            # Handle split hands
-            results = []
-            total_winnings = 0
-            
-            for i, hand in enumerate(bj["player_hands"]):
-                hand_val = hand_value(hand)
-                bet = bj["split_bets"][i]
-                hand_result = ""
-                hand_winnings = 0
-                
-                # Check for natural blackjack (21 with first 2 cards)
-                player_blackjack = len(hand) == 2 and hand_val == 21
-                dealer_blackjack = len(dealer_hand) == 2 and dealer_val == 21
-                
-                if hand_val > 21:
-                    hand_result = f"Hand {i+1}: Busted! Lost {bet} coins."
-                    hand_winnings = 0
-                elif player_blackjack and dealer_blackjack:
-                    hand_result = f"Hand {i+1}: Both have blackjack! Push - {bet} coins returned."
-                    hand_winnings = bet
-                elif player_blackjack and not dealer_blackjack:
-                    hand_result = f"Hand {i+1}: Blackjack! Won {int(bet * 2.5)} coins."
-                    hand_winnings = int(bet * 2.5)  # 3:2 payout for blackjack
-                elif dealer_val > 21:
-                    hand_result = f"Hand {i+1}: Dealer busted! Won {bet * 2} coins."
-                    hand_winnings = bet * 2
-                elif hand_val > dealer_val:
-                    hand_result = f"Hand {i+1}: Won {bet * 2} coins."
-                    hand_winnings = bet * 2
-                elif hand_val == dealer_val:
-                    hand_result = f"Hand {i+1}: Push - {bet} coins returned."
-                    hand_winnings = bet
-                else:
-                    hand_result = f"Hand {i+1}: Lost {bet} coins."
-                    hand_winnings = 0
-                
-                results.append(hand_result)
-                total_winnings += hand_winnings
-            
-            result = " | ".join(results)
-            winnings = total_winnings
-        else:
-            # Handle single hand (original logic)
-            player_hand = bj["player_hand"]
-            bet = bj["bet"]
-            
-            player_val = hand_value(player_hand)
-            result = ""
-            winnings = 0
-
-            # Check for natural blackjack (21 with first 2 cards)
-            player_blackjack = len(player_hand) == 2 and player_val == 21
-            dealer_blackjack = len(dealer_hand) == 2 and dealer_val == 21
-
-            if player_val > 21:
-                result = "You busted! You lose."
-                winnings = 0
-            elif player_blackjack and dealer_blackjack:
-                result = "Both have blackjack! Push - your bet is returned."
-                winnings = bet
-            elif player_blackjack and not dealer_blackjack:
-                result = f"Blackjack! You won {int(bet * 2.5)} coins."
-                winnings = int(bet * 2.5)  # 3:2 payout for blackjack
-            elif dealer_val > 21:
-                result = f"Dealer busted! You win {bet * 2} coins."
-                winnings = bet * 2
-            elif player_val > dealer_val:
-                result = f"You win! You won {bet * 2} coins."
-                winnings = bet * 2
-            elif player_val == dealer_val:
-                result = "Push. Your bet is returned."
-                winnings = bet
-            else:
-                result = "You lose."
-                winnings = 0
+    if rnd.step():
+        # A natural or the dealer's draw: show the new state on its own page
+        session["blackjack"] = rnd.to_session()
+        return redirect(url_for("blackjack_bet"))
 
-        user["balance"] = balance + winnings
-        save_users()
-        
-        # Log the transaction
-        if is_split:
-            total_bet = sum(bj["split_bets"])
-            transaction_result = "won" if winnings > total_bet else "lost" if winnings == 0 else "push"
-            net_amount = winnings - total_bet  # Net gain/loss
-            details = f"Blackjack split bet: {total_bet} coins (2 hands)"
-        else:
-            transaction_result = "won" if winnings > bet else "lost" if winnings == 0 else "push"
-            net_amount = winnings - bet  # Net gain/loss
-            details = f"Blackjack bet: {bet} coins"
-            if player_blackjack and not dealer_blackjack:
-                details += " (Natural Blackjack)"
-        log_transaction(user["username"], "blackjack", net_amount, details, transaction_result)
-        
-        # Track game metrics
-        GAMES_PLAYED.labels(game_type="blackjack", result=transaction_result).inc()
-        
-        session.pop("blackjack")  # Clear game session
-
-        # Prepare template variables for result page
-        result_vars = {
-            "dealer_hand": dealer_hand,
-            "dealer_val": dealer_val,
-            "result": result,
-            "balance": user["balance"],
-            "is_split": is_split
-        }
-        
-        if is_split:
-            result_vars.update({
-                "player_hands": bj["player_hands"],
-                "hand_values": [hand_value(hand) for hand in bj["player_hands"]],
-                "split_bets": bj["split_bets"]
-            })
-        else:
-            result_vars.update({
-                "player_hand": player_hand,
-                "player_val": player_val
-            })
-        
-        return render_template("blackjack_result.html", **result_vars)
+    if rnd.state == PLAYING:
+        return render_template("blackjack_play.html", round=rnd, dealer=rnd.dealer, bj_state=rnd.state,
+                               balance=rnd.balance)
+
+    # Finished: close the round on the user record, then pay out, log and clear it
+    user.pop(OPEN_ROUND_KEY, None)
+    _, outcomes = settle_blackjack(user, rnd)
+    session.pop("blackjack")  # Clear game session
+    session.pop("blackjack_id", None)
+    return render_template("blackjack_result.html", round=rnd, dealer=rnd.dealer, result=rnd.describe(outcomes),
+                           balance=user["balance"])
+
+def settle_blackjack(user, rnd):
+    """Pay out a finished round and log it. Returns (winnings, outcomes) as BlackjackRound.settle()."""
+    winnings, outcomes = rnd.settle()
+    user["balance"] += winnings
+    save_users()
+
+    total_bet = rnd.total_bet
+    transaction_result = "won" if winnings > total_bet else "lost" if winnings == 0 else "push"
+    if rnd.is_split:
+        details = f"Blackjack split bet: {total_bet} coins ({len(rnd.hands)} hands)"
+    else:
+        details = f"Blackjack bet: {total_bet} coins"
+        if outcomes[0][1] == "blackjack":
+            details += " (Natural Blackjack)"
+    log_transaction(user["username"], "blackjack", winnings - total_bet, details, transaction_result,
+                    wager=total_bet)
+
+    # Track game metrics
+    GAMES_PLAYED.labels(game_type="blackjack", result=transaction_result).inc()
+    return winnings, outcomes
+
+@app.route("/blackjack/hint")
+@track_metrics
+def blackjack_hint():
+    """EV of each legal action for the current hand, or for `hand` and `dealer` given as ranks (e.g. A,7 and 9)."""
+    user = current_user()
+    if not user:
+        return {"error": "Login required"}, 401
+
+    if request.args.get("hand"):
+        cards = [c.strip() for c in request.args["hand"].split(",") if c.strip()]
+        upcard = request.args.get("dealer", "")
+        ranks = [c[:-1] if c[-1:] in "♠♥♦♣" else {"T": "10"}.get(c.upper(), c.upper()) for c in cards]
+        allowed = {"double": len(cards) == 2, "split": len(cards) == 2 and ranks[0] == ranks[1]}
+    else:
+        rnd = BlackjackRound.from_session(session["blackjack"]) if "blackjack" in session else None
+        if rnd is None or rnd.state != PLAYING:
+            return {"error": "No hand in play"}, 404
+        cards, upcard = rnd.hand.cards, rnd.dealer.cards[0]
+        actions = rnd.actions(user["balance"])
+        allowed = {"double": "double" in actions, "split": "split" in actions}
+
+    try:
+        evs = strategy_table.lookup(cards, upcard)
+    except ValueError:
+        return {"error": "Give hand as comma-separated ranks and dealer as one rank"}, 400
+    evs = {action: ev for action, ev in evs.items() if allowed.get(action, True)}
+    return {"hand": cards, "dealer": upcard, "ev": evs, "best": max(evs, key=evs.get)}
 
 #########################
 # Roulette implementation
 #########################
 
+def play_roulette(user, bet_color, bet_amount):
+    """Take the bet, spin and pay out. Returns (result, None), or (None, error message) for an invalid bet."""
+    colors = ['red', 'black', 'green']
+    wheel = ['red', 'black', 'red', 'black', 'red', 'black', 'red',
+             'green', 'black', 'red', 'black', 'red', 'black', 'red', 'black']
+
+    try:
+        bet_amount = int(bet_amount)
+    except (ValueError, TypeError):
+        return None, "Invalid bet amount"
+    if bet_amount <= 0 or bet_amount > user["balance"]:
+        return None, "Invalid bet amount"
+    if bet_color not in colors:
+        return None, "Invalid color choice"
+
+    user["balance"] -= bet_amount
+
+    # Spin wheel
+    winning_color = random.choice(wheel)
+
+    # Determine winnings
+    win = False
+    if bet_color == winning_color:
+        if winning_color == "green":
+            multiplier = 14
+        else:
+            multiplier = 2
+        winnings = bet_amount * multiplier
+        user["balance"] += winnings
+        result = f"You won {winnings} coins! The ball landed on {winning_color}."
+        win = True
+    else:
+        result = f"You lost. The ball landed on {winning_color}."
+
+    save_users()
+
+    # Log the transaction
+    transaction_result = "won" if win else "lost"
+    net_amount = winnings - bet_amount if win else -bet_amount
+    log_transaction(user["username"], "roulette", net_amount,
+                   f"Roulette bet on {bet_color}: {bet_amount} coins", transaction_result, wager=bet_amount)
+
+    # Track game metrics
+    GAMES_PLAYED.labels(game_type="roulette", result=transaction_result).inc()
+
+    return {
+        "message": result,
+        "result_color": winning_color,
+        "balance": user["balance"],
+        "win": win
+    }, None
+
 @app.route("/roulette", methods=["GET", "POST"])
 @track_metrics
+@locks_user
 def roulette():
     user = current_user()
     if not user:
         return redirect(url_for("login"))
 
-    colors = ['red', 'black', 'green']
-    wheel = ['red', 'black', 'red', 'black', 'red', 'black', 'red',
-             'green', 'black', 'red', 'black', 'red', 'black', 'red', 'black']
-
     if request.method == "POST":
         # Handle both JSON (AJAX) and form data
         if request.is_json:
@@ -751,81 +877,96 @@ def roulette():
             bet_color = request.form.get("color")
             bet_amount = request.form.get("bet", "0")
 
-        try:
-            bet_amount = int(bet_amount)
-            if bet_amount <= 0 or bet_amount > user["balance"]:
-                if request.is_json:
-                    return {"error": "Invalid bet amount"}, 400
-                flash("Invalid bet amount")
-                return render_template("roulette.html", balance=user["balance"])
-        except (ValueError, TypeError):
-            if request.is_json:
-                return {"error": "Invalid bet amount"}, 400
-            flash("Invalid bet amount")
-            return render_template("roulette.html", balance=user["balance"])
-
-        if bet_color not in colors:
+        outcome, error = play_roulette(user, bet_color, bet_amount)
+        if error:
             if request.is_json:
-                return {"error": "Invalid color choice"}, 400
-            flash("Invalid color choice")
+                return {"error": error}, 400
+            flash(error)
             return render_template("roulette.html", balance=user["balance"])
 
-        user["balance"] -= bet_amount
-
-        # Spin wheel
-        winning_color = random.choice(wheel)
-
-        # Determine winnings
-        win = False
-        if bet_color == winning_color:
-            if winning_color == "green":
-                multiplier = 14
-            else:
-                multiplier = 2
-            winnings = bet_amount * multiplier
-            user["balance"] += winnings
-            result = f"You won {winnings} coins! The ball landed on {winning_color}."
-            win = True
-        else:
-            result = f"You lost. The ball landed on {winning_color}."
-
-        save_users()
-        
-        # Log the transaction
-        transaction_result = "won" if win else "lost"
-        net_amount = winnings - bet_amount if win else -bet_amount
-        log_transaction(user["username"], "roulette", net_amount, 
-                       f"Roulette bet on {bet_color}: {bet_amount} coins", transaction_result)
-        
-        # Track game metrics
-        GAMES_PLAYED.labels(game_type="roulette", result=transaction_result).inc()
-
         # Return JSON for AJAX requests
         if request.is_json:
-            return {
-                "message": result,
-                "result_color": winning_color,
-                "balance": user["balance"],
-                "win": win
-            }
+            return outcome
 
-        return render_template("roulette_result.html", result=result, balance=user["balance"])
+        return render_template("roulette_result.html", result=outcome["message"], balance=user["balance"])
 
-    return render_template("roulette.html", balance=user["balance"])
+    return render_cached("roulette.html", balance=user["balance"])
 
 #########################
 # Slot Machine implementation
 #########################
 
+def play_slots(user, bet_amount):
+    """Take the bet, spin and pay out. Returns (result, None), or (None, error message) for an invalid bet."""
+    symbols = ["🍒", "🔔", "🍋", "⭐", "💎", "7️⃣"]
+
+    try:
+        bet_amount = int(bet_amount)
+    except (ValueError, TypeError):
+        return None, "Invalid bet amount format"
+    # Enhanced validation
+    if bet_amount <= 0:
+        return None, "Bet amount must be positive"
+    elif bet_amount > user["balance"]:
+        return None, "Insufficient balance"
+    elif bet_amount > 10000:  # Maximum bet limit
+        return None, "Bet amount exceeds maximum limit of 10,000"
+
+    user["balance"] -= bet_amount
+
+    # Spin reels
+    a = random.choice(symbols)
+    b = random.choice(symbols)
+    c = random.choice(symbols)
+
+    win = False
+    winnings = 0
+    message = ""
+
+    if a == b == c:
+        multipliers = {"🍒": 3, "🔔": 5, "🍋": 2, "⭐": 10, "💎": 15, "7️⃣": 25}
+        winnings = bet_amount * multipliers.get(a, 0)
+        win = True
+        message = f"Jackpot! Three {a}! You won {winnings} coins."
+    elif a == b or b == c or a == c:
+        multipliers = {"🍒": 2, "🔔": 2, "🍋": 1, "⭐": 3, "💎": 5, "7️⃣": 10}
+        # Use the most common symbol in two matches
+        matched_symbol = a if a == b else b if b == c else a
+        winnings = bet_amount * multipliers.get(matched_symbol, 0)
+        win = True
+        message = f"Nice! Two {matched_symbol}! You won {winnings} coins."
+    else:
+        message = f"No match. You lost {bet_amount} coins."
+
+    if win:
+        user["balance"] += winnings
+
+    save_users()
+
+    # Log the transaction
+    transaction_result = "won" if win else "lost"
+    net_amount = winnings - bet_amount if win else -bet_amount
+    log_transaction(user["username"], "slots", net_amount,
+                   f"Slots bet: {bet_amount} coins", transaction_result, wager=bet_amount)
+
+    # Track game metrics
+    GAMES_PLAYED.labels(game_type="slots", result=transaction_result).inc()
+
+    return {
+        "message": message,
+        "reels": [a, b, c],
+        "balance": user["balance"],
+        "win": win
+    }, None
+
 @app.route("/slots", methods=["GET", "POST"])
 @track_metrics
+@locks_user
 def slots():
     user = current_user()
     if not user:
         return redirect(url_for("login"))
 
-    symbols = ["🍒", "🔔", "🍋", "⭐", "💎", "7️⃣"]
-
     if request.method == "POST":
         # Handle both JSON (AJAX) and form data
         if request.is_json:
@@ -833,88 +974,193 @@ def slots():
             bet_amount = data.get("bet", "0")
         else:
             bet_amount = request.form.get("bet", "0")
-            
-        try:
-            bet_amount = int(bet_amount)
-            # Enhanced validation
-            if bet_amount <= 0:
-                error_msg = "Bet amount must be positive"
-            elif bet_amount > user["balance"]:
-                error_msg = "Insufficient balance"
-            elif bet_amount > 10000:  # Maximum bet limit
-                error_msg = "Bet amount exceeds maximum limit of 10,000"
-            else:
-                error_msg = None
-                
-            if error_msg:
-                if request.is_json:
-                    return {"error": error_msg}, 400
-                flash(error_msg)
-                return render_template("slots.html", balance=user["balance"])
-        except (ValueError, TypeError):
-            error_msg = "Invalid bet amount format"
+
+        outcome, error = play_slots(user, bet_amount)
+        if error:
             if request.is_json:
-                return {"error": error_msg}, 400
-            flash(error_msg)
+                return {"error": error}, 400
+            flash(error)
             return render_template("slots.html", balance=user["balance"])
 
-        user["balance"] -= bet_amount
-
-        # Spin reels
-        a = random.choice(symbols)
-        b = random.choice(symbols)
-        c = random.choice(symbols)
-
-        win = False
-        winnings = 0
-        message = ""
-
-        if a == b == c:
-            multipliers = {"🍒": 3, "🔔": 5, "🍋": 2, "⭐": 10, "💎": 15, "7️⃣": 25}
-            winnings = bet_amount * multipliers.get(a, 0)
-            win = True
-            message = f"Jackpot! Three {a}! You won {winnings} coins."
-        elif a == b or b == c or a == c:
-            multipliers = {"🍒": 2, "🔔": 2, "🍋": 1, "⭐": 3, "💎": 5, "7️⃣": 10}
-            # Use the most common symbol in two matches
-            matched_symbol = a if a == b else b if b == c else a
-            winnings = bet_amount * multipliers.get(matched_symbol, 0)
-            win = True
-            message = f"Nice! Two {matched_symbol}! You won {winnings} coins."
-        else:
-            message = f"No match. You lost {bet_amount} coins."
+        # Return JSON for AJAX requests
+        if request.is_json:
+            return outcome
+
+        return render_template("slots.html",
+                             balance=user["balance"],
+                             result=outcome["message"],
+                             win=outcome["win"],
+                             reels=outcome["reels"])
 
-        if win:
-            user["balance"] += winnings
+    return render_cached("slots.html", balance=user["balance"])
 
+#########################
+# JSON API v1
+#########################
+
+# Token-authenticated JSON for the mobile client and bots: no cookie session, templates,
+# flashes or redirects, and every game action is one request to the same engines as the pages
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+# A token has no session, so the API's blackjack round is kept on the user record
+API_ROUND_KEY = "api_blackjack"
+
+def token_required(f):
+    """Authenticate the bearer token and pass the user to the route."""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = bearer_token(request.headers.get("Authorization"))
+        user = api_tokens.verify(token, find_user) if token else None
+        if user is None:
+            return {"error": "Invalid or missing token"}, 401
+        touch(user)
+        return f(user, *args, **kwargs)
+    return decorated_function
+
+def api_body():
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+@api.route("/login", methods=["POST"])
+@track_metrics
+def api_login():
+    data = api_body()
+    username = str(data.get("username") or "").strip()
+    password = data.get("password")
+    if not username or not isinstance(password, str) or not password:
+        return {"error": "username and password are required"}, 400
+    try:
+        user, created = sign_in(username, password)
+    except HashingBusy:
+        return {"error": "Server busy, try again shortly"}, 503, {"Retry-After": "1"}
+    if user is None:
+        return {"error": "Incorrect password"}, 401
+    return {"token": api_tokens.issue(user), "expires_in": api_tokens.ttl, "username": username,
+            "balance": user["balance"], "created": created}
+
+@api.route("/balance")
+@track_metrics
+@token_required
+def api_balance(user):
+    return {"username": user["username"], "balance": user["balance"]}
+
+@api.route("/tip", methods=["POST"])
+@track_metrics
+@token_required
+def api_tip(user):
+    data = api_body()
+    to_username = str(data.get("to") or "").strip()
+    amount, error = send_tip(user, to_username, data.get("amount"))
+    if error:
+        return {"error": error}, 400
+    return {"to": to_username, "amount": amount, "balance": user["balance"]}
+
+@api.route("/slots", methods=["POST"])
+@track_metrics
+@token_required
+def api_slots(user):
+    with user_locks.hold(user["username"]):
+        outcome, error = play_slots(user, api_body().get("bet"))
+    if error:
+        return {"error": error}, 400
+    return outcome
+
+@api.route("/roulette", methods=["POST"])
+@track_metrics
+@token_required
+def api_roulette(user):
+    data = api_body()
+    with user_locks.hold(user["username"]):
+        outcome, error = play_roulette(user, data.get("color"), data.get("bet"))
+    if error:
+        return {"error": error}, 400
+    return outcome
+
+def blackjack_json(rnd, user, outcomes=None):
+    """A round as the API returns it; the dealer's hole card stays hidden until the round is settled."""
+    body = {
+        "state": rnd.state,
+        "dealer": rnd.dealer.cards if outcomes else rnd.dealer.cards[:1],
+        "hands": [{"cards": hand.cards, "value": hand.value, "bet": hand.bet} for hand in rnd.hands],
+        "current": rnd.current,
+        "actions": rnd.actions(user["balance"]),
+        "balance": user["balance"],
+    }
+    if outcomes:
+        body.update(dealer_value=rnd.dealer.value, outcomes=[outcome for _, outcome in outcomes],
+                    payout=sum(payout for payout, _ in outcomes), result=rnd.describe(outcomes))
+    return body
+
+def advance_blackjack(user, rnd):
+    """Run the automatic steps (naturals, the dealer's draw) and settle a finished round.
+
+    Returns the response body. An unfinished round is kept on the user record
+    and saved with it, so a restart resumes the round rather than replaying an
+    earlier deck.
+    """
+    while rnd.step():
+        pass
+    if rnd.state != FINISHED:
+        user[API_ROUND_KEY] = rnd.to_session()
         save_users()
-        
-        # Log the transaction
-        transaction_result = "won" if win else "lost"
-        net_amount = winnings - bet_amount if win else -bet_amount
-        log_transaction(user["username"], "slots", net_amount, 
-                       f"Slots bet: {bet_amount} coins", transaction_result)
-        
-        # Track game metrics
-        GAMES_PLAYED.labels(game_type="slots", result=transaction_result).inc()
+        return blackjack_json(rnd, user)
+    user.pop(API_ROUND_KEY, None)
+    _, outcomes = settle_blackjack(user, rnd)
+    return blackjack_json(rnd, user, outcomes)
 
-        # Return JSON for AJAX requests
-        if request.is_json:
-            return {
-                "message": message,
-                "reels": [a, b, c],
-                "balance": user["balance"],
-                "win": win
-            }
+@api.route("/blackjack", methods=["GET", "POST"])
+@track_metrics
+@token_required
+def api_blackjack(user):
+    """GET the round in play, or POST {"bet": n} to deal a new one."""
+    with user_locks.hold(user["username"]):
+        data = user.get(API_ROUND_KEY)
+        if request.method == "GET":
+            if not data:
+                return {"error": "No round in play"}, 404
+            return blackjack_json(BlackjackRound.from_session(data), user)
+        if data:
+            return {"error": "A round is already in play", **blackjack_json(BlackjackRound.from_session(data), user)}, 409
+        if lifecycle.draining:
+            return {"error": "Server restarting, try again shortly"}, 503, {"Retry-After": "1"}
+
+        try:
+            bet = int(str(api_body().get("bet")).strip())
+        except ValueError:
+            bet = 0
+        if bet <= 0 or bet > user["balance"]:
+            return {"error": "Invalid bet amount"}, 400
 
-        return render_template("slots.html", 
-                             balance=user["balance"], 
-                             result=message, 
-                             win=win,
-                             reels=[a, b, c])
+        rnd = BlackjackRound.deal(user["balance"])
+        # Take the stake now so it cannot be spent in another game mid-round
+        user["balance"] -= bet
+        rnd.place_bet(bet, user["balance"])
+        return advance_blackjack(user, rnd)
 
-    return render_template("slots.html", balance=user["balance"])
+@api.route("/blackjack/action", methods=["POST"])
+@track_metrics
+@token_required
+def api_blackjack_action(user):
+    """POST {"action": "hit" | "stand" | "double" | "split"} for the hand in play."""
+    action = api_body().get("action")
+    if action not in ("hit", "stand", "double", "split"):
+        return {"error": "action must be hit, stand, double or split"}, 400
+    with user_locks.hold(user["username"]):
+        data = user.get(API_ROUND_KEY)
+        if not data:
+            return {"error": "No round in play"}, 404
+        rnd = BlackjackRound.from_session(data)
+        if action not in rnd.actions(user["balance"]):
+            return {"error": f"Cannot {action} now", **blackjack_json(rnd, user)}, 409
+
+        stake = rnd.act(action, user["balance"])
+        user["balance"] -= stake
+        blackjack_log.debug("api %s: hand %d now %s (state %s)", action, rnd.current, rnd.hand.cards, rnd.state)
+        return advance_blackjack(user, rnd)
+
+app.register_blueprint(api)
 
 if __name__ == "__main__":
+    lifecycle.install()
     app.run(host="0.0.0.0", debug=True)
 
@@ -1,8 +1,30 @@
+"""Blackjack rules and the round engine.
+
+BlackjackRound holds one round: the deck, the dealer's hand, the player's
+hands with their bets, and the state. It moves through
+
+  betting -> playing -> dealer_turn -> finished
+
+Player actions (hit, stand, double, split) are looked up in ACTIONS and are
+only valid while playing. The automatic steps (settling a natural, the dealer
+drawing) are looked up in STEPS and run on the next GET, so every state the
+player sees is one page. Hands keep their value up to date as cards are
+added, so nothing is recounted per request.
+
+The engine never touches the user store. A transition that needs more coins
+(double, split) is given the player's balance and returns the extra stake it
+took; the caller deducts it. A round goes to and from the session as one
+compact list via to_session()/from_session(), with cards as single letters.
+"""
 import random
 
 suits = ['♠', '♥', '♦', '♣']
 values = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
 
+BETTING, PLAYING, DEALER_TURN, FINISHED = "betting", "playing", "dealer_turn", "finished"
+
+RANK_VALUES = {v: 10 if v in ('J', 'Q', 'K') else 11 if v == 'A' else int(v) for v in values}
+
 def create_deck():
     return [v + s for s in suits for v in values]
 
@@ -12,13 +34,7 @@ def draw_card(deck):
     return card
 
 def card_value(card):
-    val = card[:-1]  # all chars except last (suit)
-    if val in ['J', 'Q', 'K']:
-        return 10
-    elif val == 'A':
-        return 11
-    else:
-        return int(val)
+    return RANK_VALUES[card[:-1]]
 
 def hand_value(hand):
     total = 0
@@ -40,3 +56,272 @@ def initial_hands(deck):
 
 def can_split(hand):
     return len(hand) == 2 and hand[0][:-1] == hand[1][:-1]
+
+# One letter per card for the session, in create_deck() order
+CARD_CODES = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+ENCODE = dict(zip(create_deck(), CARD_CODES))
+DECODE = dict(zip(CARD_CODES, create_deck()))
+
+def encode_cards(cards):
+    return "".join(ENCODE[card] for card in cards)
+
+def decode_cards(codes):
+    return [DECODE[code] for code in codes]
+
+class Hand:
+    __slots__ = ("cards", "value", "soft_aces", "bet")
+
+    def __init__(self, cards=(), bet=0):
+        self.cards = []
+        self.value = 0
+        self.soft_aces = 0  # aces still counted as 11
+        self.bet = bet
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        self.cards.append(card)
+        rank = card[:-1]
+        self.value += RANK_VALUES[rank]
+        if rank == 'A':
+            self.soft_aces += 1
+        while self.value > 21 and self.soft_aces:
+            self.value -= 10
+            self.soft_aces -= 1
+
+    @property
+    def is_natural(self):
+        return len(self.cards) == 2 and self.value == 21
+
+    @property
+    def is_pair(self):
+        return can_split(self.cards)
+
+class BlackjackRound:
+    __slots__ = ("state", "deck", "dealer", "hands", "current", "is_split", "balance")
+
+    def __init__(self, deck, balance):
+        """Deal a new round from a shuffled deck; cards are taken from the end."""
+        self.state = BETTING
+        self.deck = deck
+        player = Hand((deck.pop(), deck.pop()))
+        self.dealer = Hand((deck.pop(), deck.pop()))
+        self.hands = [player]
+        self.current = 0
+        self.is_split = False
+        self.balance = balance  # the player's balance as of the last transition, for display
+
+    @classmethod
+    def deal(cls, balance, rng=random):
+        deck = create_deck()
+        rng.shuffle(deck)
+        return cls(deck, balance)
+
+    @property
+    def hand(self):
+        return self.hands[self.current]
+
+    @property
+    def bet(self):
+        """The stake the round was opened with (per hand once split)."""
+        return self.hands[0].bet if not self.is_split else min(h.bet for h in self.hands)
+
+    @property
+    def total_bet(self):
+        return sum(hand.bet for hand in self.hands)
+
+    def actions(self, balance):
+        """The player actions open now, given the player's balance."""
+        if self.state != PLAYING:
+            return []
+        hand = self.hand
+        actions = ["hit", "stand"]
+        if len(hand.cards) == 2 and balance >= hand.bet:
+            actions.append("double")
+        if not self.is_split and hand.is_pair and balance >= hand.bet:
+            actions.append("split")
+        return actions
+
+    # Transitions
+
+    def place_bet(self, bet, balance):
+        """Open play with `bet`, already taken from the player's `balance`."""
+        self.hands[0].bet = bet
+        self.balance = balance
+        self.state = PLAYING
+
+    def act(self, action, balance):
+        """Apply a player action. Returns the extra stake taken from `balance`."""
+        handler = ACTIONS.get(action) if self.state == PLAYING else None
+        if handler is None:
+            return 0
+        self.balance = balance
+        stake = handler(self, balance)
+        self.balance -= stake
+        return stake
+
+    def step(self):
+        """Run the automatic transition for the current state. True if the state changed."""
+        handler = STEPS.get(self.state)
+        return handler(self) if handler else False
+
+    def _next_hand(self):
+        """Move to the next split hand, or to the dealer once the last one is done."""
+        if self.current < len(self.hands) - 1:
+            self.current += 1
+        else:
+            self.state = DEALER_TURN
+
+    def _hit(self, balance):
+        hand = self.hand
+        hand.add(self.deck.pop())
+        if hand.value > 21:
+            if self.is_split:
+                self._next_hand()
+            else:
+                self.state = FINISHED  # bust, the dealer does not play
+        elif hand.value == 21:
+            self._stand(balance)
+        return 0
+
+    def _stand(self, balance):
+        if self.is_split:
+            self._next_hand()
+        else:
+            self.state = DEALER_TURN
+        return 0
+
+    def _double(self, balance):
+        hand = self.hand
+        if len(hand.cards) != 2 or balance < hand.bet:
+            return 0
+        stake = hand.bet
+        hand.bet *= 2
+        hand.add(self.deck.pop())
+        if self.is_split:
+            self._next_hand()
+        elif hand.value > 21:
+            self.state = FINISHED
+        else:
+            self.state = DEALER_TURN
+        return stake
+
+    def _split(self, balance):
+        hand = self.hand
+        if self.is_split or not hand.is_pair or balance < hand.bet:
+            return 0
+        if len(self.deck) < 10:
+            self.deck = create_deck()
+            random.shuffle(self.deck)
+        first, second = hand.cards
+        self.hands = [Hand((first, self.deck.pop()), hand.bet), Hand((second, self.deck.pop()), hand.bet)]
+        self.current = 0
+        self.is_split = True
+        return hand.bet
+
+    def _settle_naturals(self):
+        hand = self.hand
+        if self.is_split:
+            if hand.value == 21:  # a split hand dealt to 21 is done, as if hit to 21
+                self._next_hand()
+                return True
+            return False
+        if hand.is_natural:
+            self.state = FINISHED
+            return True
+        return False
+
+    def _dealer_play(self):
+        while self.dealer.value < 17:
+            self.dealer.add(self.deck.pop())
+        self.state = FINISHED
+        return True
+
+    # Settlement
+
+    def payout(self, hand):
+        """(coins returned for `hand` including its stake, outcome)."""
+        dealer = self.dealer
+        bet = hand.bet
+        if hand.value > 21:
+            return 0, "bust"
+        if hand.is_natural and dealer.is_natural:
+            return bet, "push_blackjack"
+        if hand.is_natural:
+            return int(bet * 2.5), "blackjack"  # 3:2
+        if dealer.value > 21:
+            return bet * 2, "dealer_bust"
+        if hand.value > dealer.value:
+            return bet * 2, "win"
+        if hand.value == dealer.value:
+            return bet, "push"
+        return 0, "lose"
+
+    def settle(self):
+        """(winnings, [(payout, outcome) per hand]) for a finished round."""
+        outcomes = [self.payout(hand) for hand in self.hands]
+        return sum(p for p, _ in outcomes), outcomes
+
+    def describe(self, outcomes):
+        """The result line shown to the player."""
+        if not self.is_split:
+            (payout, outcome), = outcomes
+            return RESULTS[outcome].format(payout=payout, bet=self.hands[0].bet)
+        return " | ".join(f"Hand {i + 1}: " + SPLIT_RESULTS[outcome].format(payout=payout, bet=hand.bet)
+                          for i, (hand, (payout, outcome)) in enumerate(zip(self.hands, outcomes)))
+
+    # Session
+
+    def to_session(self):
+        return [self.state, encode_cards(self.deck), encode_cards(self.dealer.cards),
+                [[encode_cards(h.cards), h.bet] for h in self.hands], self.current, self.is_split, self.balance]
+
+    @classmethod
+    def from_session(cls, data):
+        """The round stored by to_session(), or None for a dict stored by the
+        previous route. Those rounds took the stake only at the finish, so
+        settling one here would pay out without ever charging it."""
+        if isinstance(data, dict):
+            return None
+        state, deck, dealer, hands, current, is_split, balance = data
+        round_ = cls.__new__(cls)
+        round_.state = state
+        round_.deck = decode_cards(deck)
+        round_.dealer = Hand(decode_cards(dealer))
+        round_.hands = [Hand(decode_cards(cards), bet) for cards, bet in hands]
+        round_.current = current
+        round_.is_split = is_split
+        round_.balance = balance
+        return round_
+
+RESULTS = {
+    "bust": "You busted! You lose.",
+    "push_blackjack": "Both have blackjack! Push - your bet is returned.",
+    "blackjack": "Blackjack! You won {payout} coins.",
+    "dealer_bust": "Dealer busted! You win {payout} coins.",
+    "win": "You win! You won {payout} coins.",
+    "push": "Push. Your bet is returned.",
+    "lose": "You lose.",
+}
+
+SPLIT_RESULTS = {
+    "bust": "Busted! Lost {bet} coins.",
+    "push_blackjack": "Both have blackjack! Push - {bet} coins returned.",
+    "blackjack": "Blackjack! Won {payout} coins.",
+    "dealer_bust": "Dealer busted! Won {payout} coins.",
+    "win": "Won {payout} coins.",
+    "push": "Push - {bet} coins returned.",
+    "lose": "Lost {bet} coins.",
+}
+
+ACTIONS = {
+    "hit": BlackjackRound._hit,
+    "stand": BlackjackRound._stand,
+    "double": BlackjackRound._double,
+    "split": BlackjackRound._split,
+}
+
+STEPS = {
+    PLAYING: BlackjackRound._settle_naturals,
+    DEALER_TURN: BlackjackRound._dealer_play,
+}
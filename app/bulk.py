@@ -0,0 +1,155 @@
+"""Bulk admin balance operations.
+
+A bulk file holds one operation per row: `username`, `action` (add, subtract
+or set) and a non-negative whole `amount`. CSV files need a header row naming
+those columns. NDJSON files have one object per line. Every row is parsed and
+checked before anything changes. plan_operations() then runs through the valid rows in
+order against a running balance per user, so several rows for one user
+combine the same way the admin form would apply them one after another.
+
+With atomic=True a single failing row rejects the whole file and nothing is
+applied. Otherwise failing rows are reported and the rest are applied.
+"""
+import csv
+import io
+import json
+import os
+
+BULK_MAX_ROWS = int(os.environ.get("BULK_MAX_ROWS", "100000"))
+
+ACTIONS = ("add", "subtract", "set")
+FIELDS = ("username", "action", "amount")
+FORMATS = ("csv", "ndjson")
+
+class BulkFileError(ValueError):
+    """The file as a whole cannot be read (unknown format, missing columns, too many rows)."""
+
+def detect_format(text, filename=None, content_type=None):
+    if filename:
+        extension = os.path.splitext(filename)[1].lower().lstrip(".")
+        if extension in ("ndjson", "jsonl"):
+            return "ndjson"
+        if extension == "csv":
+            return "csv"
+    if content_type:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            return "ndjson"
+        if "csv" in content_type:
+            return "csv"
+    return "ndjson" if text.lstrip().startswith("{") else "csv"
+
+def read_rows(text, fmt, max_rows=BULK_MAX_ROWS):
+    """Yield (row number, dict or None) for each non-blank row; None marks an unreadable row."""
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        missing = [f for f in FIELDS if f not in (reader.fieldnames or ())]
+        if missing:
+            raise BulkFileError(f"CSV header is missing column(s): {', '.join(missing)}")
+        rows = ((reader.line_num, row) for row in reader)
+    elif fmt == "ndjson":
+        rows = _ndjson_rows(text)
+    else:
+        raise BulkFileError(f"Unknown bulk format: {fmt}")
+    for count, row in enumerate(rows, 1):
+        if count > max_rows:
+            raise BulkFileError(f"Too many rows, the limit is {max_rows}")
+        yield row
+
+def _ndjson_rows(text):
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+def parse_operation(row):
+    """(operation, None) for a valid row, else (None, error message)."""
+    if row is None:
+        return None, "Row is not a JSON object"
+    username = str(row.get("username") or "").strip()
+    action = str(row.get("action") or "").strip().lower()
+    amount = row.get("amount")
+    if not username:
+        return None, "Missing username"
+    if action not in ACTIONS:
+        return None, f"Unknown action: {action or '(none)'}"
+    if isinstance(amount, bool):
+        amount = None
+    elif isinstance(amount, str):
+        try:
+            amount = int(amount.strip())
+        except ValueError:
+            amount = None
+    elif isinstance(amount, float) and amount.is_integer():
+        amount = int(amount)
+    if not isinstance(amount, int):
+        return None, "Amount must be a whole number"
+    if amount < 0:
+        return None, "Amount cannot be negative"
+    return {"username": username, "action": action, "amount": amount}, None
+
+def parse_operations(text, fmt, max_rows=BULK_MAX_ROWS):
+    """All rows of a bulk file as result dicts; valid ones carry an `op`."""
+    results = []
+    for number, row in read_rows(text, fmt, max_rows):
+        op, error = parse_operation(row)
+        result = {"row": number, "username": (op or row or {}).get("username"), "status": "pending"}
+        if error:
+            result.update(status="error", error=error)
+        else:
+            result.update(action=op["action"], amount=op["amount"], op=op)
+        results.append(result)
+    return results
+
+def plan_operations(results, balance_of, atomic=False):
+    """Check the parsed rows against current balances and compute the new ones.
+
+    `balance_of(username)` returns a user's balance, or None for an unknown
+    user. Callers hold the balance locks of every user in the file. Returns
+    {username: final balance} for the users to update (empty when an atomic
+    file has errors). Each result is marked `ok` with the `change` it made and
+    the `balance` after it, `error` with a reason, or `skipped` when an atomic
+    file was rejected.
+    """
+    balances = {}
+    for result in results:
+        op = result.get("op")
+        if op is None:
+            continue
+        username, action, amount = op["username"], op["action"], op["amount"]
+        balance = balances.get(username)
+        if balance is None:
+            balance = balance_of(username)
+            if balance is None:
+                result.update(status="error", error=f"User '{username}' not found")
+                continue
+        before = balance
+        if action == "add":
+            balance += amount
+        elif action == "subtract":
+            if balance < amount:
+                result.update(status="error", error=f"Cannot subtract {amount} coins, balance is {balance}")
+                continue
+            balance -= amount
+        else:
+            balance = amount
+        balances[username] = balance
+        result.update(status="ok", change=balance - before, balance=balance)
+
+    if atomic and any(r["status"] == "error" for r in results):
+        for result in results:
+            if result["status"] == "ok":
+                result["status"] = "skipped"
+                del result["change"], result["balance"]
+        return {}
+    return balances
+
+def summarize(results):
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    for result in results:
+        result.pop("op", None)
+        counts[result["status"]] += 1
+    return {"applied": counts["ok"], "failed": counts["error"], "skipped": counts["skipped"], "results": results}
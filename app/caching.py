@@ -0,0 +1,143 @@
+"""Page caching, conditional GET, static asset fingerprints and compression.
+
+render_cached() memoizes a rendered page. The key is the template, its context
+(the few values that change, such as balance) and the session values the
+layout reads. Pages with pending flash messages are always rendered, because
+rendering consumes the flashes.
+
+finalize_response(), registered as an after_request hook, then:
+  - gives fingerprinted static URLs (static_url(), `?v=<hash>`) a year-long
+    immutable Cache-Control
+  - compresses text responses above COMPRESS_MIN_SIZE with brotli (when the
+    package is installed and the client accepts it) or gzip
+  - tags complete GET responses with an ETag and answers If-None-Match with 304
+"""
+import functools
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, session, url_for
+from prometheus_client import Counter
+
+from app.timing import render_template
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", "1024"))
+PAGE_CACHE_TTL = float(os.environ.get("PAGE_CACHE_TTL", "300"))
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))  # 0 disables compression
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+
+# Session values read by base.html and the page templates
+SESSION_KEYS = ("username", "admin_authenticated")
+COMPRESSIBLE = {"application/json", "application/javascript", "application/x-ndjson", "image/svg+xml"}
+
+PAGE_CACHE = Counter("casino_page_cache_total", "Rendered page cache lookups", ["result"])
+
+class PageCache:
+    """Thread-safe LRU of rendered pages with a TTL."""
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._pages = OrderedDict()  # key -> (expires_at, html)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._pages.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, html):
+        with self._lock:
+            self._pages[key] = (time.monotonic() + self.ttl, html)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+page_cache = PageCache()
+
+def render_cached(template_name, **context):
+    """render_template() for pages whose output depends only on `context` and the session keys."""
+    if not page_cache.max_entries or current_app.debug or session.get("_flashes"):
+        PAGE_CACHE.labels(result="bypass").inc()
+        return render_template(template_name, **context)
+    key = (template_name, tuple(sorted(context.items())), tuple(session.get(k) for k in SESSION_KEYS))
+    html = page_cache.get(key)
+    if html is not None:
+        PAGE_CACHE.labels(result="hit").inc()
+        return html
+    PAGE_CACHE.labels(result="miss").inc()
+    html = render_template(template_name, **context)
+    page_cache.set(key, html)
+    return html
+
+@functools.lru_cache(maxsize=256)
+def _file_hash(path, mtime_ns):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def static_url(filename):
+    """URL of a static file with a content fingerprint, safe to cache forever."""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        version = _file_hash(path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return url_for("static", filename=filename)
+    return url_for("static", filename=filename, v=version)
+
+def compress(response):
+    if (COMPRESS_MIN_SIZE <= 0 or response.direct_passthrough or response.is_streamed
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers):
+        return
+    mimetype = response.mimetype or ""
+    if not (mimetype.startswith("text/") or mimetype in COMPRESSIBLE):
+        return
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return
+    response.vary.add("Accept-Encoding")
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        body, encoding = brotli.compress(data, quality=BROTLI_QUALITY), "br"
+    elif accepted["gzip"]:
+        body, encoding = gzip.compress(data, COMPRESS_LEVEL, mtime=0), "gzip"
+    else:
+        return
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+
+def finalize_response(response):
+    if request.endpoint == "static" and request.args.get("v"):
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+    compress(response)
+
+    if (request.method in ("GET", "HEAD") and response.status_code == 200 and not response.is_streamed
+            and not response.direct_passthrough and "ETag" not in response.headers):
+        # The ETag covers the encoded body, so each encoding gets its own
+        response.add_etag()
+        if not response.headers.get("Cache-Control"):
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
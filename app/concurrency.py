@@ -0,0 +1,39 @@
+"""Locks that make balance updates safe under threaded gunicorn workers.
+
+Every read-check-write of a user's balance runs under that user's stripe lock.
+There is one lock per stripe rather than one per user, so memory stays fixed
+however many accounts exist. Transfers between two users take both stripes in
+index order, which means two opposite tips can never deadlock. Anything that
+changes the shape of the shared stores (adding users or ledger keys,
+compaction) or writes them to disk holds store_lock. The order is always user
+stripes first, then store_lock.
+"""
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+LOCK_STRIPES = int(os.environ.get("USER_LOCK_STRIPES", "64"))
+
+class StripedLocks:
+    def __init__(self, stripes=LOCK_STRIPES):
+        # Reentrant so a route holding a user's lock can call helpers that take it again
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def stripe(self, key):
+        return zlib.crc32(key.encode()) % len(self._locks)
+
+    @contextmanager
+    def hold(self, *keys):
+        """Hold the stripes for all `keys`, acquired in ascending stripe order."""
+        stripes = sorted({self.stripe(key) for key in keys})
+        for i in stripes:
+            self._locks[i].acquire()
+        try:
+            yield
+        finally:
+            for i in reversed(stripes):
+                self._locks[i].release()
+
+user_locks = StripedLocks()
+store_lock = threading.RLock()
@@ -0,0 +1,202 @@
+"""Server-Sent Events for live balance updates.
+
+Each worker has one EventHub. An /events stream subscribes the session's user
+and gets a small bounded queue. publish() formats an event once and offers the
+same bytes to every subscriber of that user. A subscriber that falls behind
+has its queue cleared and gets a single `resync` event instead, so one slow
+client can never hold memory or block a publisher.
+
+With EVENTS_BACKEND=redis, events are published to a Redis channel. A
+listener thread in every worker delivers them to its local subscribers, so a
+tip handled by one worker reaches a stream held open by another. If Redis
+cannot be reached, events are delivered locally only.
+
+Under gthread each open stream occupies a thread. EVENTS_MAX_STREAMS therefore
+caps streams per worker. Beyond it /events answers 503, and pages fall back
+to their normal reloads. Each user holds at most one stream per worker: a new
+one replaces the old, which gets a `replaced` event and ends. Streams end
+after EVENTS_MAX_AGE seconds, and EventSource reconnects on its own, so
+threads are recycled. A stream's slot is released when its response closes,
+even if the body was never iterated.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from prometheus_client import Counter, Gauge
+
+EVENTS_BACKEND = os.environ.get("EVENTS_BACKEND", "local")
+EVENTS_REDIS_URL = os.environ.get("EVENTS_REDIS_URL", os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0"))
+EVENTS_CHANNEL = os.environ.get("EVENTS_CHANNEL", "casino:events")
+EVENTS_MAX_STREAMS = int(os.environ.get("EVENTS_MAX_STREAMS", "4"))
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", "32"))
+EVENTS_HEARTBEAT = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+EVENTS_MAX_AGE = float(os.environ.get("EVENTS_MAX_AGE", "300"))
+
+SSE_STREAMS = Gauge("casino_sse_streams", "Open Server-Sent Events streams in this worker")
+SSE_EVENTS = Counter("casino_sse_events_total", "Events delivered to local subscribers", ["event"])
+SSE_RESYNCS = Counter("casino_sse_resyncs_total", "Subscriber queues overflowed and replaced by a resync event")
+SSE_REJECTED = Counter("casino_sse_rejected_total", "Streams refused because the worker was at EVENTS_MAX_STREAMS")
+
+RESYNC = b"event: resync\ndata: {}\n\n"
+REPLACED = b"event: replaced\ndata: {}\n\n"
+HEARTBEAT = b": heartbeat\n\n"
+
+log = logging.getLogger(__name__)
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+class Subscriber:
+    __slots__ = ("username", "queue", "closed")
+
+    def __init__(self, username, size):
+        self.username = username
+        self.queue = queue.Queue(size)
+        self.closed = False
+
+    def drain(self):
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def close(self):
+        """End the stream with a `replaced` event, sent ahead of anything still queued."""
+        self.closed = True
+        self.drain()
+        try:
+            self.queue.put_nowait(REPLACED)
+        except queue.Full:
+            pass  # the stream still sees `closed` by its next heartbeat
+
+    def offer(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            # Too far behind: drop the backlog and tell the client to refetch its state
+            SSE_RESYNCS.inc()
+            self.drain()
+            try:
+                self.queue.put_nowait(RESYNC)
+            except queue.Full:
+                pass  # a concurrent publisher refilled it; the client catches up on the next overflow
+
+class EventHub:
+    def __init__(self, max_streams=EVENTS_MAX_STREAMS, queue_size=EVENTS_QUEUE_SIZE,
+                 heartbeat=EVENTS_HEARTBEAT, max_age=EVENTS_MAX_AGE):
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.relay = None
+        self._subscribers = {}  # username -> Subscriber
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, username):
+        """A new subscriber, or None if this worker already serves max_streams.
+
+        A user's previous stream is closed and its slot handed to the new one.
+        """
+        with self._lock:
+            previous = self._subscribers.get(username)
+            if previous is None and self._count >= self.max_streams:
+                SSE_REJECTED.inc()
+                return None
+            subscriber = self._subscribers[username] = Subscriber(username, self.queue_size)
+            if previous is not None:
+                previous.close()
+            else:
+                self._count += 1
+                SSE_STREAMS.set(self._count)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Release a subscriber's slot; safe to call more than once."""
+        with self._lock:
+            if self._subscribers.get(subscriber.username) is subscriber:
+                del self._subscribers[subscriber.username]
+                self._count -= 1
+                SSE_STREAMS.set(self._count)
+
+    def publish(self, username, event, data):
+        if self.relay is not None and self.relay.publish(username, event, data):
+            return
+        self.deliver(username, event, data)
+
+    def deliver(self, username, event, data):
+        with self._lock:
+            subscriber = self._subscribers.get(username)
+        if subscriber is None:
+            return
+        subscriber.offer(format_event(event, data))
+        SSE_EVENTS.labels(event=event).inc()
+
+    def stream(self, subscriber):
+        """Response body for one subscriber: events as they come, heartbeats in between.
+
+        Ends when the subscriber is replaced by a newer stream for the same user.
+        """
+        deadline = time.monotonic() + self.max_age
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    payload = subscriber.queue.get(timeout=min(self.heartbeat, remaining))
+                except queue.Empty:
+                    if subscriber.closed:
+                        return
+                    yield HEARTBEAT
+                    continue
+                yield payload
+                if payload is REPLACED:
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+class RedisRelay:
+    """Fans events out to every worker through a Redis pub/sub channel."""
+
+    def __init__(self, hub, url=EVENTS_REDIS_URL, channel=EVENTS_CHANNEL):
+        import redis  # optional dependency, only needed for this backend
+        self.hub = hub
+        self.channel = channel
+        self.client = redis.Redis.from_url(url)
+        self._thread = threading.Thread(target=self._listen, name="events-relay", daemon=True)
+        self._thread.start()
+
+    def publish(self, username, event, data):
+        try:
+            self.client.publish(self.channel, json.dumps({"user": username, "event": event, "data": data}))
+            return True
+        except Exception as e:
+            log.warning("Event relay unavailable, delivering locally: %s", e)
+            return False
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    event = json.loads(message["data"])
+                    self.hub.deliver(event["user"], event["event"], event["data"])
+            except Exception as e:
+                log.warning("Event relay listener failed, retrying: %s", e)
+                time.sleep(1)
+
+def hub_from_env(backend=EVENTS_BACKEND):
+    hub = EventHub()
+    if backend == "redis":
+        hub.relay = RedisRelay(hub)
+    elif backend != "local":
+        raise ValueError(f"Unknown EVENTS_BACKEND: {backend}")
+    return hub
@@ -0,0 +1,71 @@
+"""Password hashing on a bounded process pool.
+
+scrypt is deliberately slow, so hashing inside the request worker holds the GIL
+and stalls every other request on that worker. Jobs run in a small process
+pool instead. At most PASSWORD_HASH_QUEUE jobs may be queued or running; a
+login that cannot get a slot within PASSWORD_HASH_QUEUE_TIMEOUT seconds fails
+fast with HashingBusy instead of piling up behind a burst.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from prometheus_client import Counter, Gauge
+
+# Werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# 0 hashes inline on the calling thread (tests, local development)
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE", "16"))
+HASH_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_HASH_QUEUE_TIMEOUT", "2"))
+
+HASH_QUEUE_DEPTH = Gauge('casino_password_hash_queue_depth', 'Password hashing jobs queued or running')
+HASH_REJECTED = Counter('casino_password_hash_rejected_total', 'Password hashing jobs rejected because the queue was full')
+
+# Werkzeug fills in these parameters when a method is given without them
+METHOD_DEFAULTS = {
+    "scrypt": "scrypt:32768:8:1",
+    "pbkdf2": "pbkdf2:sha256:600000",
+    "pbkdf2:sha256": "pbkdf2:sha256:600000",
+}
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue stays full for longer than the timeout."""
+
+_slots = threading.BoundedSemaphore(HASH_QUEUE_SIZE)
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    # Created on first use so each gunicorn worker gets its own pool after forking
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                            mp_context=multiprocessing.get_context("forkserver"))
+        return _executor
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=HASH_QUEUE_TIMEOUT):
+        HASH_REJECTED.inc()
+        raise HashingBusy()
+    HASH_QUEUE_DEPTH.inc()
+    try:
+        if HASH_WORKERS <= 0:
+            return fn(*args)
+        return get_executor().submit(fn, *args).result()
+    finally:
+        HASH_QUEUE_DEPTH.dec()
+        _slots.release()
+
+def hash_password(password):
+    return _run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+def needs_rehash(pwhash):
+    """True if `pwhash` was made with different parameters than PASSWORD_HASH_METHOD."""
+    current = METHOD_DEFAULTS.get(PASSWORD_HASH_METHOD, PASSWORD_HASH_METHOD)
+    return pwhash.split("$", 1)[0] != current
@@ -0,0 +1,105 @@
+import base64
+import csv
+import io
+import json
+from bisect import bisect_left, bisect_right
+
+# Columns written by the CSV and NDJSON exporters, in order
+EXPORT_FIELDS = ["username", "timestamp", "type", "details", "amount", "result", "balance_after", "wager"]
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+def record_time(record):
+    return record.get("timestamp") or ""
+
+def encode_cursor(records, position):
+    """Cursor for `records[position]`: its timestamp and its index among the records sharing it.
+
+    Compaction only removes whole seconds from the front of a history, so this
+    pair keeps naming the same record when the list positions shift.
+    """
+    timestamp = record_time(records[position])
+    sequence = position - bisect_left(records, timestamp, hi=position, key=record_time)
+    raw = json.dumps([timestamp, sequence], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Turn an opaque cursor back into (timestamp, sequence), or None if it is invalid."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, sequence = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if not isinstance(timestamp, str) or not isinstance(sequence, int) or sequence < 0:
+        return None
+    return timestamp, sequence
+
+def cursor_position(records, cursor):
+    """The current list position of the record a decoded cursor names.
+
+    If compaction archived that record, everything older went with it and the
+    position is the start of the list.
+    """
+    timestamp, sequence = cursor
+    first = bisect_left(records, timestamp, key=record_time)
+    return min(first + sequence, bisect_right(records, timestamp, lo=first, key=record_time))
+
+def clamp_page_size(limit):
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def page(records, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one newest-first page of a user's records and the cursor for the next one.
+
+    The cursor names the oldest record on the page. New bets are appended and
+    compaction trims whole seconds from the front, so paging never skips or
+    repeats a record.
+    """
+    end = len(records)
+    if cursor is not None:
+        end = cursor_position(records, cursor)
+    start = max(0, end - limit)
+    items = [records[i] for i in range(end - 1, start - 1, -1)]
+    next_cursor = encode_cursor(records, start) if start > 0 else None
+    return items, next_cursor
+
+def iter_ledger(history, username=None):
+    """Yield (username, record) pairs one at a time.
+
+    Only the list of usernames is copied up front, so exporting the whole casino
+    costs O(users) memory and tolerates new transactions arriving mid-export.
+    Compaction swaps in a trimmed list rather than editing the one being
+    walked, so it cannot make an export skip records.
+    """
+    usernames = [username] if username is not None else list(history.keys())
+    for name in usernames:
+        records = history.get(name) or []
+        for i in range(len(records)):
+            yield name, records[i]
+
+def export_row(username, record):
+    return {"username": username, **{k: record.get(k) for k in EXPORT_FIELDS[1:]}}
+
+def ndjson_lines(rows):
+    for username, record in rows:
+        yield json.dumps(export_row(username, record), ensure_ascii=False) + "\n"
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for username, record in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(export_row(username, record))
+        yield buffer.getvalue()
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
@@ -0,0 +1,143 @@
+"""Incremental reader for the top level of large JSON files.
+
+users.json (a list, or the old username -> record dict) and
+balance_history.json (username -> list of records) can be far larger than
+memory. JsonStream yields their top-level entries one at a time while holding
+only the current chunk and the entry being decoded.
+
+An entry larger than a chunk is not re-parsed as each chunk arrives. The
+reader scans for the end of the entry, resuming where the previous chunk ran
+out, and decodes it once the whole entry is in the buffer.
+"""
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+
+class JsonStream:
+    """Iterate (key, value) over a top-level JSON object, or (index, value)
+    over a top-level array, read from a binary file object.
+
+    `bytes_read` tracks how far into the file the reader has got, for progress
+    reporting.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self.bytes_read = 0
+        self.is_list = None
+
+    def _fill(self):
+        """Read another chunk, dropping what has been consumed. False at EOF.
+
+        Chunks grow with the unconsumed part of the buffer, so an entry spanning
+        many chunks is copied a bounded number of times.
+        """
+        if self._eof:
+            return False
+        data = self._file.read(max(self._chunk_size, len(self._buf) - self._pos))
+        self.bytes_read += len(data)
+        if not data:
+            self._eof = True
+            self._buf = self._buf[self._pos:] + self._utf8.decode(b"", final=True)
+        else:
+            self._buf = self._buf[self._pos:] + self._utf8.decode(data)
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or "" at EOF."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset ~{self.bytes_read}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _end(self):
+        """Index just past the string, array or object at the read position.
+
+        Reads more chunks as needed. Scanning picks up where the buffer ran
+        out, so each character is looked at about once.
+        """
+        depth = 0
+        i = self._pos
+        while True:
+            match = _STRUCTURE.search(self._buf, i)
+            if match is not None and match.group() == '"':
+                rest = _STRING_REST.match(self._buf, match.end())
+                if rest is not None:
+                    i = rest.end()
+                    if not depth:
+                        return i
+                    continue
+                i = match.start()  # the string goes on in the next chunk
+            elif match is not None:
+                i = match.end()
+                depth += 1 if match.group() in "[{" else -1
+                if not depth:
+                    return i
+                continue
+            else:
+                i = len(self._buf)
+            consumed = self._pos
+            if not self._fill():
+                raise ValueError(f"Unterminated value at offset ~{self.bytes_read}")
+            i -= consumed
+
+    def _value(self):
+        char = self._peek()
+        if char and char in '"[{':
+            self._end()
+            value, self._pos = _decoder.raw_decode(self._buf, self._pos)
+            return value
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off by the chunk boundary decodes "successfully"
+            if end == len(self._buf) and not self._eof:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        opener = self._expect("[{")
+        self.is_list = opener == "["
+        closer = "]" if self.is_list else "}"
+        index = 0
+        if self._peek() == closer:
+            return
+        while True:
+            if self.is_list:
+                key = index
+            else:
+                key = self._value()
+                self._expect(":")
+            yield key, self._value()
+            index += 1
+            if self._expect("," + closer) == closer:
+                return
@@ -0,0 +1,188 @@
+"""Health probes and graceful shutdown.
+
+LifecycleMiddleware sits outside everything else and answers the probes
+without touching Flask, sessions or the user store:
+
+  /healthz  200 while the process is serving requests
+  /readyz   200 once startup finished and every readiness check passes,
+            503 while starting or draining
+
+Readiness checks are registered by the app. Each must run in constant time,
+for example checking that the data directory is writable.
+
+On SIGTERM the worker starts draining. /readyz turns 503 so the load balancer
+stops sending traffic, and new requests to the bet endpoints get 503 with
+Retry-After, so clients retry on another pod. Other pages are still served.
+The blackjack endpoints (LIFECYCLE_ROUND_PATHS) are let through, because a
+round's stake is taken at the bet and the player must still be able to finish
+it here; those routes refuse to open a new round while draining. After
+LIFECYCLE_DRAIN_DELAY seconds the previous SIGTERM handler runs. Under gunicorn, that handler stops
+accepting connections and lets in-flight requests finish. At interpreter exit,
+shutdown() waits up to LIFECYCLE_DRAIN_TIMEOUT for running bets and then
+runs the registered flush callbacks once.
+"""
+import atexit
+import logging
+import os
+import signal
+import threading
+import time
+
+from prometheus_client import Gauge
+
+from app.admission import ADMISSION_PATHS
+
+LIFECYCLE_DRAIN_DELAY = float(os.environ.get("LIFECYCLE_DRAIN_DELAY", "5"))
+LIFECYCLE_DRAIN_TIMEOUT = float(os.environ.get("LIFECYCLE_DRAIN_TIMEOUT", "20"))
+LIFECYCLE_BET_PATHS = os.environ.get("LIFECYCLE_BET_PATHS", ADMISSION_PATHS)
+LIFECYCLE_ROUND_PATHS = os.environ.get("LIFECYCLE_ROUND_PATHS", "/blackjack_bet,/api/v1/blackjack,"
+                                                                 "/api/v1/blackjack/action")
+
+STATES = ("starting", "ready", "draining", "stopped")
+LIFECYCLE_STATE = Gauge("casino_lifecycle_state", "Worker lifecycle state (1 for the current one)", ["state"])
+
+log = logging.getLogger(__name__)
+
+class Lifecycle:
+    def __init__(self, drain_delay=LIFECYCLE_DRAIN_DELAY, drain_timeout=LIFECYCLE_DRAIN_TIMEOUT):
+        self.drain_delay = drain_delay
+        self.drain_timeout = drain_timeout
+        self.state = None
+        self.checks = {}  # name -> callable, truthy when ready
+        self._flushes = []
+        self._inflight = 0
+        self._idle = threading.Condition()
+        self._set_state("starting")
+
+    def _set_state(self, state):
+        self.state = state
+        for name in STATES:
+            LIFECYCLE_STATE.labels(state=name).set(1 if name == state else 0)
+
+    @property
+    def draining(self):
+        return self.state in ("draining", "stopped")
+
+    def mark_ready(self):
+        if self.state == "starting":
+            self._set_state("ready")
+
+    def add_check(self, name, check):
+        self.checks[name] = check
+
+    def on_shutdown(self, flush):
+        self._flushes.append(flush)
+
+    def readiness(self):
+        """(ready, {check name: "ok" or the reason it failed})."""
+        results = {}
+        for name, check in self.checks.items():
+            try:
+                results[name] = "ok" if check() else "failed"
+            except Exception as e:
+                results[name] = f"error: {e}"
+        ready = self.state == "ready" and all(r == "ok" for r in results.values())
+        return ready, results
+
+    # In-flight bets
+
+    def enter(self):
+        with self._idle:
+            self._inflight += 1
+
+    def leave(self):
+        with self._idle:
+            self._inflight -= 1
+            if not self._inflight:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        """Wait for running bets to finish. False if some were still running at the timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._inflight, timeout)
+
+    # Shutdown
+
+    def begin_drain(self, reason="shutdown"):
+        if not self.draining:
+            self._set_state("draining")
+            log.info("Draining: %s", reason)
+
+    def shutdown(self):
+        """Drain, then flush once. Safe to call more than once."""
+        if self.state == "stopped":
+            return
+        self.begin_drain()
+        started = time.monotonic()
+        if not self.wait_idle(self.drain_timeout):
+            log.warning("Shutting down with %d bets still running after %.0fs", self._inflight, self.drain_timeout)
+        for flush in self._flushes:
+            try:
+                flush()
+            except Exception:
+                log.exception("Shutdown flush %s failed", getattr(flush, "__name__", flush))
+        self._set_state("stopped")
+        log.info("Shutdown complete in %.2fs", time.monotonic() - started)
+
+    def install(self):
+        """Drain on SIGTERM before handing over to the previous handler, and flush at exit.
+
+        Called once the server has set up its own signal handling: from
+        gunicorn's post_worker_init hook, or before app.run() in development.
+        """
+        atexit.register(self.shutdown)
+        if threading.current_thread() is not threading.main_thread():
+            return  # signal handlers can only be set from the main thread
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm(signum, frame):
+            self.begin_drain("SIGTERM")
+            if callable(previous):
+                # Keep serving while the load balancer notices /readyz, then let the server stop
+                timer = threading.Timer(self.drain_delay, previous, (signum, frame))
+                timer.daemon = True
+                timer.start()
+            else:
+                raise SystemExit(128 + signum)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+class LifecycleMiddleware:
+    def __init__(self, wsgi_app, lifecycle, bet_paths=LIFECYCLE_BET_PATHS, round_paths=LIFECYCLE_ROUND_PATHS):
+        self.wsgi_app = wsgi_app
+        self.lifecycle = lifecycle
+        self.bet_paths = {p.strip() for p in bet_paths.split(",") if p.strip()}
+        self.round_paths = {p.strip() for p in round_paths.split(",") if p.strip()}
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO")
+        if path == "/healthz":
+            return self.respond(start_response, "200 OK", b"ok\n")
+        if path == "/readyz":
+            ready, results = self.lifecycle.readiness()
+            body = "".join(f"{name}: {result}\n" for name, result in results.items())
+            body = f"{self.lifecycle.state}\n{body}".encode()
+            return self.respond(start_response, "200 OK" if ready else "503 Service Unavailable", body)
+        if path not in self.bet_paths:
+            return self.wsgi_app(environ, start_response)
+
+        if self.lifecycle.draining and path not in self.round_paths:
+            return self.respond(start_response, "503 Service Unavailable", b"Server restarting, try again shortly.\n",
+                                [("Retry-After", "1")])
+        self.lifecycle.enter()
+        try:
+            # Bet responses are small, so consume the body here and the bet is done once this returns
+            result = self.wsgi_app(environ, start_response)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        finally:
+            self.lifecycle.leave()
+
+    def respond(self, start_response, status, body, headers=()):
+        start_response(status, [("Content-Type", "text/plain; charset=utf-8"),
+                                ("Content-Length", str(len(body))),
+                                ("Cache-Control", "no-store"), *headers])
+        return [body]
@@ -0,0 +1,149 @@
+"""Non-blocking logging for the web app.
+
+Loggers hand records to a bounded queue through a QueueHandler. A
+QueueListener thread formats them (JSON by default) and writes them to stdout,
+so a request never waits on log I/O. When the queue is full, records are dropped
+and counted instead of blocking.
+
+Call sites use %-style arguments (`log.debug("hand %s", hand)`), never
+f-strings. A disabled level then costs one cached isEnabledFor() check, and
+the arguments are never formatted.
+
+Settings:
+  LOG_LEVEL           root level for the app's loggers (default INFO)
+  LOG_LEVELS          per-module overrides, e.g. "app.blackjack=DEBUG,app.admin=WARNING"
+  LOG_FORMAT          json or text
+  LOG_QUEUE_SIZE      records buffered before new ones are dropped
+  LOG_DEBUG_RATE      DEBUG records per second let through per logger (0 = no limit)
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_DEBUG_RATE = float(os.environ.get("LOG_DEBUG_RATE", "20"))
+
+_listener = None
+_configure_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Structured data goes in `extra={"fields": {...}}`."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class DebugSampler(logging.Filter):
+    """Token bucket per logger for DEBUG records; INFO and above always pass.
+
+    The number of records suppressed since the last one let through is attached
+    to that record as the `sampled_out` field.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self._buckets = {}  # logger name -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(record.name, [self.rate, now, 0])
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.fields = {**(getattr(record, "fields", None) or {}), "sampled_out": suppressed}
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records rather than block when the queue is full.
+
+    The stdlib prepare() formats the message on the logging thread and clears
+    args and exc_info. This one queues a shallow copy untouched, so formatting
+    and tracebacks are left to the listener. Arguments are therefore rendered
+    a little later; log values, not objects that are changed right after.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def parse_levels(spec):
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging(level=LOG_LEVEL, levels=LOG_LEVELS, fmt=LOG_FORMAT, stream=None):
+    """Route the `app` logger hierarchy through the queue. Safe to call more than once."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == "json" else
+                            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        handler.addFilter(DebugSampler(LOG_DEBUG_RATE))
+
+        root = logging.getLogger("app")
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level)
+        root.propagate = False
+        for name, module_level in parse_levels(levels).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        return handler
+
+def flush_logging():
+    """Stop the listener after it drains the queue, e.g. at exit or in tests."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+atexit.register(flush_logging)
@@ -0,0 +1,202 @@
+"""Opt-in statistical profiler for live requests.
+
+Selected requests register their thread with the profiler. A background thread
+wakes every `interval` seconds, reads those threads' current frames with
+sys._current_frames() and counts the stacks it sees. Requests that are not
+selected pay only for one attribute check, and nothing runs at all while the
+profiler is disabled.
+
+Stacks are aggregated across requests and can be read as collapsed stacks
+(``endpoint;outer;...;inner count``), the input format of flamegraph.pl and
+speedscope, or as a top-functions table.
+
+Each gunicorn worker profiles its own requests. When PROFILER_CONTROL_FILE is
+set, configuration changes are also written there and every worker picks them
+up within a second.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_STACKS = 20000
+MAX_DEPTH = 64
+TRUNCATED = "[other stacks]"
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    def __init__(self, enabled=False, rate=0.0, endpoints=(), interval=0.005, control_file=None):
+        self.enabled = enabled
+        self.rate = rate
+        self.endpoints = set(endpoints)
+        self.interval = interval
+        self.control_file = control_file
+        self._control_mtime = None
+        self._control_checked = 0.0
+        self._active = {}  # thread id -> endpoint being profiled
+        self._stacks = Counter()
+        self._samples = 0
+        self._requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # Request selection
+
+    def should_profile(self, endpoint):
+        self._poll_control_file()
+        if not self.enabled or endpoint is None:
+            return False
+        return endpoint in self.endpoints or (self.rate > 0 and random.random() < self.rate)
+
+    def begin(self, endpoint):
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            self._requests += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+                self._thread.start()
+
+    def end(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    # Sampling
+
+    def _sample_loop(self):
+        # Exits once profiling is switched off and the last request finished
+        while self.enabled or self._active:
+            time.sleep(self.interval)
+            self.sample()
+        with self._lock:
+            self._thread = None
+
+    def sample(self):
+        with self._lock:
+            active = dict(self._active)
+        if not active:
+            return
+        frames = sys._current_frames()
+        for thread_id, endpoint in active.items():
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(endpoint)
+            key = ";".join(reversed(stack))
+            with self._lock:
+                if key not in self._stacks and len(self._stacks) >= MAX_STACKS:
+                    key = f"{endpoint};{TRUNCATED}"
+                self._stacks[key] += 1
+                self._samples += 1
+
+    # Reports
+
+    def collapsed(self):
+        with self._lock:
+            stacks = list(self._stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+    def top(self, limit=25):
+        """Functions ranked by self samples, with inclusive samples alongside."""
+        own = Counter()
+        inclusive = Counter()
+        with self._lock:
+            stacks = list(self._stacks.items())
+        for stack, count in stacks:
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                inclusive[label] += count
+        total = self._samples or 1
+        return [{"function": label, "self": n, "self_pct": round(100 * n / total, 2),
+                 "total": inclusive[label], "total_pct": round(100 * inclusive[label] / total, 2)}
+                for label, n in own.most_common(limit)]
+
+    def status(self):
+        return {"enabled": self.enabled, "rate": self.rate, "endpoints": sorted(self.endpoints),
+                "interval_ms": self.interval * 1000, "samples": self._samples,
+                "requests": self._requests, "stacks": len(self._stacks)}
+
+    # Runtime control
+
+    def configure(self, enabled=None, rate=None, endpoints=None, interval_ms=None, reset=False, publish=True):
+        if rate is not None:
+            self.rate = max(0.0, min(1.0, float(rate)))
+        if endpoints is not None:
+            self.endpoints = {e.strip() for e in endpoints if e.strip()}
+        if interval_ms is not None:
+            self.interval = max(0.001, float(interval_ms) / 1000)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if reset:
+            with self._lock:
+                self._stacks.clear()
+                self._samples = 0
+                self._requests = 0
+        if publish and self.control_file:
+            tmp_path = f"{self.control_file}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"enabled": self.enabled, "rate": self.rate, "endpoints": sorted(self.endpoints),
+                           "interval_ms": self.interval * 1000}, f)
+            os.replace(tmp_path, self.control_file)
+
+    def _poll_control_file(self):
+        if not self.control_file:
+            return
+        now = time.monotonic()
+        if now - self._control_checked < 1.0:
+            return
+        self._control_checked = now
+        try:
+            mtime = os.stat(self.control_file).st_mtime_ns
+            if mtime == self._control_mtime:
+                return
+            with open(self.control_file) as f:
+                config = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._control_mtime = mtime
+        self.configure(publish=False, **config)
+
+class ProfilerMiddleware:
+    """WSGI wrapper, so session decoding and encoding are inside the profiled window."""
+
+    def __init__(self, wsgi_app, profiler, url_map):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+        self.url_map = url_map
+
+    def __call__(self, environ, start_response):
+        profiler = self.profiler
+        if not profiler.enabled and not profiler.control_file:
+            return self.wsgi_app(environ, start_response)
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except Exception:
+            endpoint = None
+        if not profiler.should_profile(endpoint):
+            return self.wsgi_app(environ, start_response)
+        profiler.begin(endpoint)
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            profiler.end()
+
+def from_env():
+    return SamplingProfiler(
+        enabled=os.environ.get("PROFILER_ENABLED", "0") == "1",
+        rate=float(os.environ.get("PROFILER_SAMPLE_RATE", "0.01")),
+        endpoints=[e for e in os.environ.get("PROFILER_ENDPOINTS", "").split(",") if e],
+        interval=float(os.environ.get("PROFILER_INTERVAL_MS", "5")) / 1000,
+        control_file=os.environ.get("PROFILER_CONTROL_FILE") or None,
+    )
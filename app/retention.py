@@ -0,0 +1,175 @@
+"""History retention: keep recent bets hot, fold older ones into daily rollups
+and archive their raw records in gzip-compressed cold segments."""
+import gzip
+import json
+import os
+import re
+import sys
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+# Raw transactions newer than this stay in balance_history.json
+HOT_DAYS = int(os.environ.get("HISTORY_HOT_DAYS", "30"))
+# Cold segments older than this are deleted; 0 keeps them forever
+COLD_RETENTION_DAYS = int(os.environ.get("HISTORY_COLD_RETENTION_DAYS", "0"))
+# Seconds between compactions run by the background thread
+COMPACT_INTERVAL = int(os.environ.get("HISTORY_COMPACT_INTERVAL", "3600"))
+
+ROLLUPS_FILE = os.environ.get("HISTORY_ROLLUPS_FILE", "history_rollups.json")
+COLD_DIR = os.environ.get("HISTORY_COLD_DIR", "history_cold")
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+WAGER_PATTERN = re.compile(r"(\d+) coins")
+BET_TYPES = {"slots", "roulette", "blackjack"}
+
+def record_wager(record):
+    """Coins staked by a record; older records only carry it inside `details`."""
+    if record.get("wager") is not None:
+        return record["wager"]
+    if record.get("type") not in BET_TYPES:
+        return 0
+    match = WAGER_PATTERN.search(record.get("details") or "")
+    return int(match.group(1)) if match else 0
+
+def expired_count(records, cutoff):
+    """Number of leading records older than `cutoff`. Records are appended in
+    time order, so the expired ones are always a prefix of the list."""
+    return bisect_left(records, cutoff, key=lambda r: r.get("timestamp", ""))
+
+def add_to_rollups(rollups, username, record):
+    day = (record.get("timestamp") or "unknown")[:10]
+    bucket = rollups.setdefault(username, {}).setdefault(day, {}).setdefault(
+        record.get("type", "unknown"), {"count": 0, "wagered": 0, "net": 0})
+    bucket["count"] += 1
+    bucket["wagered"] += record_wager(record)
+    amount = record.get("amount")
+    bucket["net"] += amount if isinstance(amount, (int, float)) else 0
+
+def load_rollups(path=ROLLUPS_FILE):
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+    return {}
+
+def save_rollups(rollups, path=ROLLUPS_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(rollups, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def segment_path(day, cold_dir=COLD_DIR):
+    return os.path.join(cold_dir, f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}")
+
+def append_cold(lines_by_day, cold_dir=COLD_DIR):
+    """Append raw records to one segment per day. Appending adds a new gzip
+    member, which gzip readers treat as a continuation of the same stream."""
+    os.makedirs(cold_dir, exist_ok=True)
+    for day, lines in lines_by_day.items():
+        with gzip.open(segment_path(day, cold_dir), "at", encoding="utf-8") as f:
+            f.writelines(lines)
+
+def segment_days(cold_dir=COLD_DIR):
+    if not os.path.isdir(cold_dir):
+        return []
+    return sorted(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)] for name in os.listdir(cold_dir)
+                  if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+
+def prune_cold(now, retention_days=COLD_RETENTION_DAYS, cold_dir=COLD_DIR):
+    if retention_days <= 0:
+        return 0
+    oldest_kept = (now - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    pruned = 0
+    for day in segment_days(cold_dir):
+        if day < oldest_kept:
+            os.remove(segment_path(day, cold_dir))
+            pruned += 1
+    return pruned
+
+def iter_cold(username=None, cold_dir=COLD_DIR):
+    """Yield archived (username, record) pairs, oldest segment first."""
+    for day in segment_days(cold_dir):
+        with gzip.open(segment_path(day, cold_dir), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                name = row.pop("username")
+                if username is None or name == username:
+                    yield name, row
+
+def expiry_cutoff(hot_days=HOT_DAYS, now=None):
+    return ((now or datetime.now()) - timedelta(days=hot_days)).strftime(TIMESTAMP_FORMAT)
+
+def expired_records(history, cutoff):
+    """{username: records older than `cutoff`}, as copies of each history's prefix.
+
+    Records are never changed once appended, so the copies can be archived
+    without holding the lock that guards `history`.
+    """
+    expired = {}
+    for username in list(history.keys()):
+        records = history[username]
+        count = expired_count(records, cutoff)
+        if count:
+            expired[username] = records[:count]
+    return expired
+
+def archive(expired, rollups_file=ROLLUPS_FILE, cold_dir=COLD_DIR):
+    """Add expired records to the rollups and append them to the cold segments."""
+    rollups = load_rollups(rollups_file)
+    lines_by_day = {}
+    for username, records in expired.items():
+        for record in records:
+            add_to_rollups(rollups, username, record)
+            day = (record.get("timestamp") or "unknown")[:10]
+            lines_by_day.setdefault(day, []).append(
+                json.dumps({"username": username, **record}, ensure_ascii=False) + "\n")
+    append_cold(lines_by_day, cold_dir)
+    save_rollups(rollups, rollups_file)
+
+def drop_expired(history, expired):
+    """Remove archived records from the front of each history.
+
+    Histories only grow at the end in the meantime, so the archived records
+    are still the first ones. New lists, not in-place deletes: running
+    exports keep walking the old ones.
+    """
+    for username, records in expired.items():
+        remaining = history[username][len(records):]
+        if remaining:
+            history[username] = remaining
+        else:
+            del history[username]
+
+def compact(history, hot_days=HOT_DAYS, now=None, rollups_file=ROLLUPS_FILE, cold_dir=COLD_DIR):
+    """Move records older than `hot_days` out of `history` in place.
+
+    Cold segments and rollups are written before the caller persists the
+    trimmed history, so a crash can duplicate archived records but never lose
+    them. Returns counts of what was moved.
+    """
+    now = now or datetime.now()
+    expired = expired_records(history, expiry_cutoff(hot_days, now))
+    stats = {"users": len(expired), "records": sum(map(len, expired.values())), "pruned_segments": 0}
+    if expired:
+        archive(expired, rollups_file, cold_dir)
+        drop_expired(history, expired)
+
+    stats["pruned_segments"] = prune_cold(now, cold_dir=cold_dir)
+    return stats
+
+if __name__ == "__main__":
+    # Offline compaction: python -m app.retention [balance_history.json]
+    history_file = sys.argv[1] if len(sys.argv) > 1 else "balance_history.json"
+    with open(history_file, "r") as f:
+        history = json.load(f)
+    stats = compact(history)
+    if stats["records"]:
+        with open(history_file, "w") as f:
+            json.dump(history, f, indent=4)
+    print(f"Compacted {stats['records']} records for {stats['users']} users, "
+          f"pruned {stats['pruned_segments']} cold segments.")
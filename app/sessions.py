@@ -0,0 +1,209 @@
+"""Server-side sessions: the cookie carries only an opaque session ID.
+
+SESSION_BACKEND picks the store:
+  cookie  Flask's default signed cookie (no server state)
+  memory  in-process LRU with TTL expiry and entry/byte caps; sessions live in one
+          process, so run a single gunicorn worker (threads are fine)
+  redis   shared by every worker and node (needs the redis package and SESSION_REDIS_URL)
+
+Session data is stored serialized, so the byte cap measures real usage and
+concurrent requests never share one mutable dict. IDs the store does not know
+are never adopted, because a fresh ID is issued instead. session.clear()
+(logout) drops the old ID as well, and session.regenerate() moves the data to
+a new ID, so an ID planted before login never becomes an authenticated one.
+
+SESSION_TTL is idle time, not a lifetime: every request that uses a session
+pushes its expiry back, so an active player is never logged out mid-session.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from prometheus_client import Counter, Gauge
+from werkzeug.datastructures import CallbackDict
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "cookie")
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_ENTRIES = int(os.environ.get("SESSION_MAX_ENTRIES", "100000"))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+SESSION_LOOKUPS = Counter("casino_session_lookups_total", "Server-side session lookups", ["backend", "result"])
+SESSION_EVICTIONS = Counter("casino_session_evictions_total", "Sessions evicted from the memory store", ["reason"])
+SESSION_ENTRIES = Gauge("casino_session_store_entries", "Sessions held by the memory store")
+SESSION_BYTES = Gauge("casino_session_store_bytes", "Serialized bytes held by the memory store")
+
+class MemoryStore:
+    """LRU of serialized sessions with per-entry expiry, bounded by count and bytes."""
+
+    name = "memory"
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES, max_bytes=SESSION_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # sid -> (expires_at, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(sid, "ttl")
+                return None
+            self._entries.move_to_end(sid)
+            return entry[1]
+
+    def set(self, sid, payload):
+        with self._lock:
+            if sid in self._entries:
+                self._remove(sid, None)
+            self._entries[sid] = (time.time() + self.ttl, payload)
+            self._bytes += len(payload)
+            self._evict()
+            self._report()
+
+    def touch(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                self._entries[sid] = (time.time() + self.ttl, entry[1])
+
+    def delete(self, sid):
+        with self._lock:
+            if sid in self._entries:
+                self._remove(sid, None)
+                self._report()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, sid, reason):
+        _, payload = self._entries.pop(sid)
+        self._bytes -= len(payload)
+        if reason:
+            SESSION_EVICTIONS.labels(reason=reason).inc()
+
+    def _evict(self):
+        # Least recently used first; one that had already expired counts as a TTL eviction
+        now = time.time()
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_sid, (expires_at, _) = next(iter(self._entries.items()))
+            self._remove(oldest_sid, "ttl" if expires_at <= now else "capacity")
+
+    def _report(self):
+        SESSION_ENTRIES.set(len(self._entries))
+        SESSION_BYTES.set(self._bytes)
+
+class RedisStore:
+    """Sessions as Redis strings with a server-side TTL, shared by all workers."""
+
+    name = "redis"
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=SESSION_TTL, prefix="casino:session:"):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, sid):
+        payload = self.client.get(self.prefix + sid)
+        return payload.decode("utf-8") if payload is not None else None
+
+    def set(self, sid, payload):
+        self.client.set(self.prefix + sid, payload, ex=self.ttl)
+
+    def touch(self, sid):
+        self.client.expire(self.prefix + sid, self.ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.rotate = False
+
+    def clear(self):
+        # A cleared session (logout) must not be resumable with the old ID
+        super().clear()
+        self.rotate = True
+
+    def regenerate(self):
+        """Keep the data under a new ID and drop the old one; call before a privilege change."""
+        self.rotate = True
+        self.modified = True
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            payload = self.store.get(sid)
+            if payload is not None:
+                SESSION_LOOKUPS.labels(backend=self.store.name, result="hit").inc()
+                return ServerSession(self.serializer.loads(payload), sid=sid)
+            SESSION_LOOKUPS.labels(backend=self.store.name, result="miss").inc()
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.rotate and not session.new:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+            if session.modified or session.rotate:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)))
+        else:
+            # Sliding expiry: the TTL counts from the last request, not from login
+            self.store.touch(session.sid)
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+        response.vary.add("Cookie")
+
+STORES = {"memory": MemoryStore, "redis": RedisStore}
+
+def session_interface_from_env(backend=SESSION_BACKEND):
+    """The configured server-side interface, or None to keep Flask's cookie sessions."""
+    if backend == "cookie":
+        return None
+    if backend not in STORES:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return ServerSideSessionInterface(STORES[backend]())
@@ -0,0 +1,282 @@
+"""Binary snapshots of the JSON stores for fast, lazy cold starts.
+
+A snapshot sits next to its JSON file (``users.json.snap``) and holds the same
+records as compact JSON blobs plus fixed-width tables:
+
+    header   magic, version, column count, source size/mtime, count, table offsets
+    records  one compact JSON blob per key, in write order
+    keys     the key bytes, back to back
+    entries  count x (key_offset, key_len, record_offset, record_len), in write order
+    index    count x entry number, sorted by key
+    columns  optional typed arrays with one value per entry, in write order
+
+A record's position in write order (its ordinal) is stable. Stores that keep
+per-record columns, like UserTable, use it as the record ID.
+
+Opening a snapshot maps the file and reads only the header. Lookups binary
+search the index through the mapping and decode a record the first time it is
+touched, so startup cost no longer depends on how many users exist.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from collections.abc import MutableMapping
+
+MAGIC = b"CSNP"
+VERSION = 2
+HEADER = struct.Struct("<4sHHQqIQQQ")
+ENTRY = struct.Struct("<QHQI")
+ORDINAL = struct.Struct("<I")
+
+def snapshot_path(json_path):
+    return f"{json_path}.snap"
+
+def encode(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+class Snapshot:
+    """Read-only view of a snapshot file through mmap. Positions are ordinals."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.column_count, self.source_size, self.source_mtime_ns,
+         self.count, self._entries_offset, self._index_offset, self._columns_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} snapshot")
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self._map, self._entries_offset + i * ENTRY.size)
+
+    def _ordinal(self, rank):
+        return ORDINAL.unpack_from(self._map, self._index_offset + rank * ORDINAL.size)[0]
+
+    def key(self, i):
+        key_offset, key_len, _, _ = self._entry(i)
+        return self._map[key_offset:key_offset + key_len]
+
+    def find(self, key):
+        """Return the ordinal of `key`, or None."""
+        target = key.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(self._ordinal(mid)) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            i = self._ordinal(lo)
+            if self.key(i) == target:
+                return i
+        return None
+
+    def raw(self, i):
+        _, _, record_offset, record_len = self._entry(i)
+        return self._map[record_offset:record_offset + record_len]
+
+    def keys(self):
+        for key, _ in self.positions():
+            yield key
+
+    def positions(self):
+        """Yield (key, ordinal) in key order."""
+        for rank in range(self.count):
+            i = self._ordinal(rank)
+            yield self.key(i).decode(), i
+
+    def columns(self):
+        """The stored columns as fresh (writable) arrays, indexed by ordinal."""
+        columns = []
+        offset = self._columns_offset
+        for _ in range(self.column_count):
+            typecode = chr(self._map[offset])
+            column = array(typecode)
+            size = self.count * column.itemsize
+            column.frombytes(self._map[offset + 1:offset + 1 + size])
+            columns.append(column)
+            offset += 1 + size
+        return columns
+
+    def matches(self, json_path):
+        """True if the snapshot was written from the current version of `json_path`."""
+        try:
+            st = os.stat(json_path)
+        except FileNotFoundError:
+            return False
+        return st.st_size == self.source_size and st.st_mtime_ns == self.source_mtime_ns
+
+def open_snapshot(json_path):
+    """Open the snapshot for `json_path` if it exists and is not stale."""
+    path = snapshot_path(json_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        snap = Snapshot(path)
+    except (ValueError, OSError, struct.error):
+        return None
+    return snap if snap.matches(json_path) else None
+
+class LazyMap(MutableMapping):
+    """Mapping whose values are decoded from a snapshot on first access.
+
+    Decoded and newly assigned values live in `_cache`; keys removed since the
+    snapshot was written are remembered in `_deleted`. Untouched records are
+    never decoded, not even when the store is saved again.
+    """
+
+    def __init__(self, snap=None, items=()):
+        self._snap = snap
+        self._cache = dict(items)
+        self._deleted = set()
+        self._extra = {k: None for k in self._cache if not self._in_snapshot(k)}
+
+    def _in_snapshot(self, key):
+        snap = self._snap
+        return snap is not None and key not in self._deleted and snap.find(key) is not None
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        # Read the snapshot once: a concurrent save may rebase onto a new one
+        snap = self._snap
+        if snap is None or key in self._deleted:
+            raise KeyError(key)
+        i = snap.find(key)
+        if i is None:
+            raise KeyError(key)
+        return self._cache.setdefault(key, json.loads(snap.raw(i)))
+
+    def __setitem__(self, key, value):
+        if key not in self._cache and not self._in_snapshot(key):
+            self._extra[key] = None
+        self._deleted.discard(key)
+        self._cache[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._cache.pop(key, None)
+        if key in self._extra:
+            del self._extra[key]
+        else:
+            self._deleted.add(key)
+
+    def __contains__(self, key):
+        return key in self._cache or self._in_snapshot(key)
+
+    def _walk(self):
+        """Yield (key, snapshot, position) for every live key; snapshot is None
+        for keys added since the last save."""
+        snap = self._snap
+        if snap is not None:
+            for key, i in snap.positions():
+                if key not in self._deleted:
+                    yield key, snap, i
+        for key in list(self._extra):
+            yield key, None, None
+
+    def __iter__(self):
+        for key, _, _ in self._walk():
+            yield key
+
+    def items(self):
+        for key, snap, i in self._walk():
+            value = self._cache.get(key)
+            if value is None:
+                value = self._cache.setdefault(key, json.loads(snap.raw(i)))
+            yield key, value
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def __len__(self):
+        base = self._snap.count - len(self._deleted) if self._snap is not None else 0
+        return base + len(self._extra)
+
+    def raw_items(self):
+        """Yield (key, encoded value) without decoding untouched records."""
+        for key, snap, i in self._walk():
+            if key in self._cache:
+                yield key, encode(self._cache[key])
+            else:
+                yield key, snap.raw(i)
+
+    def rebase(self, snap):
+        """Point at a freshly written snapshot that contains every current key."""
+        self._snap = snap
+        self._deleted = set()
+        self._extra = {}
+
+def temp_path(path):
+    """A new empty file next to `path`, for writing and then os.replace-ing over it."""
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    return tmp_path
+
+def write_store(records, json_path, as_list, columns=()):
+    """Write `records` as JSON and as a snapshot, then rebase `records` on it.
+
+    Records go out one per line, so most lines are copied straight from the
+    previous snapshot. `columns` are arrays with one value per record in the
+    order `records.raw_items()` yields them. Both files are written to
+    temporary paths and swapped in with os.replace. The temporary names are
+    unique, so workers saving the same store at once cannot clobber each
+    other's half-written files.
+    """
+    snap_path = snapshot_path(json_path)
+    json_tmp = temp_path(json_path)
+    snap_tmp = temp_path(snap_path)
+    try:
+        entries = []
+
+        with open(json_tmp, "wb") as jf, open(snap_tmp, "wb") as sf:
+            sf.write(b"\0" * HEADER.size)
+            jf.write(b"[" if as_list else b"{")
+            first = True
+            for key, blob in records.raw_items():
+                jf.write(b"\n" if first else b",\n")
+                first = False
+                if not as_list:
+                    jf.write(encode(key) + b":")
+                jf.write(blob)
+                entries.append((key.encode(), sf.tell(), len(blob)))
+                sf.write(blob)
+            jf.write(b"\n]\n" if as_list else b"\n}\n")
+
+            key_offsets = []
+            for key, _, _ in entries:
+                key_offsets.append(sf.tell())
+                sf.write(key)
+            entries_offset = sf.tell()
+            for (key, record_offset, record_len), key_offset in zip(entries, key_offsets):
+                sf.write(ENTRY.pack(key_offset, len(key), record_offset, record_len))
+            index_offset = sf.tell()
+            for i in sorted(range(len(entries)), key=lambda i: entries[i][0]):
+                sf.write(ORDINAL.pack(i))
+            columns_offset = sf.tell()
+            for column in columns:
+                if len(column) != len(entries):
+                    raise ValueError(f"column has {len(column)} values for {len(entries)} records")
+                sf.write(column.typecode.encode())
+                sf.write(column.tobytes())
+
+        os.replace(json_tmp, json_path)
+        st = os.stat(json_path)
+        with open(snap_tmp, "r+b") as sf:
+            sf.write(HEADER.pack(MAGIC, VERSION, len(columns), st.st_size, st.st_mtime_ns,
+                                 len(entries), entries_offset, index_offset, columns_offset))
+        os.replace(snap_tmp, snap_path)
+    finally:
+        # Only left behind if writing failed
+        for path in (json_tmp, snap_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    records.rebase(Snapshot(snap_path))
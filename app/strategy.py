@@ -0,0 +1,308 @@
+"""Expected values of blackjack decisions under this casino's rules.
+
+The rules are the ones app/blackjack.py plays:
+  - every round is dealt from a fresh 52-card deck
+  - aces count 11 unless that busts the hand (hand_value)
+  - the dealer draws below 17 and stands on every 17, soft or hard
+  - the dealer does not peek: a dealer natural only matters against a player
+    natural (push); against any other 21 it is just 21 (push)
+  - naturals pay 3:2, including a split hand dealt to two-card 21
+  - double on any two cards, also after a split; one split per round, same
+    rank only; a hand that reaches 21 stands automatically
+
+EVs are in units of the initial bet. The player's draws are exact for the
+cards the player can see. Two approximations keep a full table to seconds:
+each split hand is valued as if the other one did not exist, and the dealer
+draws from the unseen deck without removing its own earlier cards. Results
+are memoized on the player's hand composition (counts per rank, A..T) and
+the dealer upcard, and the remaining deck is derived from those. Dealer
+outcome distributions are memoized on the upcard and the remaining deck.
+
+build_table() computes every two-card start and every hand reachable from it
+by hitting, for every upcard. That takes a few seconds. The table is stored in
+STRATEGY_TABLE, so a hint is one dict lookup.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+STRATEGY_TABLE = os.environ.get("STRATEGY_TABLE", "strategy_table.json")
+TABLE_VERSION = 1
+
+RANKS = "A23456789T"  # rank indexes 0..9; 10, J, Q and K all count as T
+FULL_DECK = (4, 4, 4, 4, 4, 4, 4, 4, 4, 16)
+ACTIONS = ("stand", "hit", "double", "split")
+
+# Dealer outcome indexes
+BUST, NATURAL = 5, 6  # 0..4 are final totals 17..21
+
+log = logging.getLogger(__name__)
+
+def rank_index(card):
+    """Rank index of a card such as "K♠", or a bare rank such as "K" or "T". ValueError if invalid."""
+    rank = card[:-1] if card[-1:] in ("♠", "♥", "♦", "♣") else card
+    rank = rank.upper()
+    if rank == "A":
+        return 0
+    if rank in ("T", "10", "J", "Q", "K"):
+        return 9
+    if rank in ("2", "3", "4", "5", "6", "7", "8", "9"):
+        return int(rank) - 1
+    raise ValueError(f"Unknown card: {card}")
+
+def add_card(total, soft, index):
+    """(total, soft aces) after adding a card, with hand_value's ace rule."""
+    if index == 0:
+        total += 11
+        soft += 1
+    else:
+        total += index + 1
+    while total > 21 and soft:
+        total -= 10
+        soft -= 1
+    return total, soft
+
+def hand_total(counts):
+    total = soft = 0
+    for index, count in enumerate(counts):
+        for _ in range(count):
+            total, soft = add_card(total, soft, index)
+    return total, soft
+
+def composition_key(counts):
+    return "".join(RANKS[i] * c for i, c in enumerate(counts))
+
+def parse_composition(key):
+    counts = [0] * 10
+    for rank in key:
+        counts[RANKS.index(rank)] += 1
+    return tuple(counts)
+
+def _remove(deck, index):
+    return deck[:index] + (deck[index] - 1,) + deck[index + 1:]
+
+# Dealer
+
+@lru_cache(maxsize=None)
+def dealer_outcomes(up, deck):
+    """Probabilities of the dealer's final outcomes (17..21, bust, natural).
+
+    The hole card and the draws come from `deck`, the cards the player has not
+    seen. Each dealer card is drawn with the deck's proportions without removing
+    the dealer's earlier draws; that keeps this a small DP over totals.
+    """
+    remaining = sum(deck)
+    probs = [(index, count / remaining) for index, count in enumerate(deck) if count]
+    memo = {}
+
+    def final(total, soft):
+        if total >= 17:
+            outcome = [0.0] * 7
+            outcome[BUST if total > 21 else total - 17] = 1.0
+            return outcome
+        key = (total, soft)
+        if key not in memo:
+            result = [0.0] * 7
+            for index, p in probs:
+                for i, q in enumerate(final(*add_card(total, soft, index))):
+                    result[i] += p * q
+            memo[key] = result
+        return memo[key]
+
+    up_total, up_soft = add_card(0, 0, up)
+    result = [0.0] * 7
+    for index, p in probs:
+        total, soft = add_card(up_total, up_soft, index)
+        if total == 21:
+            result[NATURAL] += p
+            continue
+        for i, q in enumerate(final(total, soft)):
+            result[i] += p * q
+    return tuple(result)
+
+def stand_ev(total, natural, up, deck):
+    """EV of standing on `total` against upcard index `up`; `deck` excludes all seen cards."""
+    if total > 21:
+        return -1.0
+    dist = dealer_outcomes(up, deck)
+    if natural:
+        return 1.5 * (1.0 - dist[NATURAL])
+    ev = dist[BUST]
+    dealer_21 = dist[4] + dist[NATURAL]
+    for dealer_total, p in zip(range(17, 21), dist):
+        if total > dealer_total:
+            ev += p
+        elif total < dealer_total:
+            ev -= p
+    if total < 21:
+        ev -= dealer_21
+    return ev
+
+# Player
+
+def _deck_for(counts, up, removed=()):
+    deck = [FULL_DECK[i] - counts[i] for i in range(10)]
+    deck[up] -= 1
+    for index in removed:
+        deck[index] -= 1
+    return tuple(deck)
+
+def _draws(counts, deck):
+    """(probability, new counts, new deck) for every card that can be drawn."""
+    remaining = sum(deck)
+    for index, count in enumerate(deck):
+        if count:
+            yield count / remaining, counts[:index] + (counts[index] + 1,) + counts[index + 1:], _remove(deck, index)
+
+@lru_cache(maxsize=None)
+def play_ev(counts, up, removed=()):
+    """Best EV of hitting or standing from here (no double or split), with the hit and stand EVs."""
+    deck = _deck_for(counts, up, removed)
+    total, _ = hand_total(counts)
+    stand = stand_ev(total, False, up, deck)
+    if total >= 21:
+        return stand, None, stand
+    hit = 0.0
+    for p, next_counts, _ in _draws(counts, deck):
+        next_total, _ = hand_total(next_counts)
+        if next_total > 21:
+            hit -= p
+        elif next_total == 21:
+            hit += p * stand_ev(21, False, up, _deck_for(next_counts, up, removed))
+        else:
+            hit += p * play_ev(next_counts, up, removed)[0]
+    return max(stand, hit), hit, stand
+
+def double_ev(counts, up, removed=()):
+    deck = _deck_for(counts, up, removed)
+    ev = 0.0
+    for p, next_counts, next_deck in _draws(counts, deck):
+        total, _ = hand_total(next_counts)
+        ev += p * stand_ev(total, False, up, next_deck)
+    return 2 * ev
+
+def split_hand_ev(index, up):
+    """EV of one hand after splitting a pair of rank `index`, played with stand, hit or double."""
+    start = tuple(1 if i == index else 0 for i in range(10))
+    removed = (index,)  # the other card of the pair went to the other hand
+    deck = _deck_for(start, up, removed)
+    ev = 0.0
+    for p, counts, next_deck in _draws(start, deck):
+        total, _ = hand_total(counts)
+        if total == 21:
+            ev += p * stand_ev(21, True, up, next_deck)
+        else:
+            ev += p * max(play_ev(counts, up, removed)[0], double_ev(counts, up, removed))
+    return ev
+
+def evaluate(counts, up):
+    """{action: EV} for a player hand (rank counts) against upcard index `up`.
+
+    Double and split appear only where the hand allows them.
+    """
+    counts = tuple(counts)
+    cards = sum(counts)
+    total, _ = hand_total(counts)
+    if cards == 2 and total == 21:
+        return {"stand": stand_ev(21, True, up, _deck_for(counts, up))}
+    best, hit, stand = play_ev(counts, up)
+    evs = {"stand": stand}
+    if hit is not None:
+        evs["hit"] = hit
+    if cards == 2 and total < 21:
+        evs["double"] = double_ev(counts, up)
+        if max(counts) == 2:
+            evs["split"] = 2 * split_hand_ev(counts.index(2), up)
+    return evs
+
+# Tables
+
+def build_table():
+    """EVs for every two-card start and every hand reachable by hitting, for every upcard."""
+    table = {}
+    for up in range(10):
+        pending = []
+        for first in range(10):
+            for second in range(first, 10):
+                pending.append(tuple((i == first) + (i == second) for i in range(10)))
+        seen = set()
+        while pending:
+            counts = pending.pop()
+            key = f"{composition_key(counts)}|{RANKS[up]}"
+            if key in seen:
+                continue
+            seen.add(key)
+            evs = evaluate(counts, up)
+            table[key] = {action: round(ev, 6) for action, ev in evs.items()}
+            if "hit" in evs:
+                for _, next_counts, _ in _draws(counts, _deck_for(counts, up)):
+                    if hand_total(next_counts)[0] < 21:
+                        pending.append(next_counts)
+    return table
+
+def save_table(table, path=STRATEGY_TABLE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": TABLE_VERSION, "hands": table}, f, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp_path, path)
+
+def load_table(path=STRATEGY_TABLE):
+    """The table stored at `path`, or None if it is missing or from another version."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != TABLE_VERSION:
+        return None
+    return data["hands"]
+
+class StrategyTable:
+    """Hint lookups from the stored table.
+
+    If the table file is missing it is built in a background thread and saved;
+    until then lookups solve the hand directly, which takes milliseconds.
+    """
+
+    def __init__(self, path=STRATEGY_TABLE):
+        self.path = path
+        self._hands = None
+        self._building = False
+        self._lock = threading.Lock()
+
+    def _table(self):
+        if self._hands is None:
+            with self._lock:
+                if self._hands is None and not self._building:
+                    self._hands = load_table(self.path)
+                    if self._hands is None:
+                        self._building = True
+                        threading.Thread(target=self._build, name="strategy-table", daemon=True).start()
+        return self._hands
+
+    def _build(self):
+        started = time.monotonic()
+        self._hands = build_table()
+        log.info("Built strategy table with %d hands in %.1fs", len(self._hands), time.monotonic() - started)
+        try:
+            save_table(self._hands, self.path)
+        except OSError as e:
+            log.warning("Could not save strategy table to %s: %s", self.path, e)
+
+    def lookup(self, cards, upcard):
+        """{action: EV} for a hand (cards or bare ranks) against the dealer's upcard."""
+        counts = [0] * 10
+        for card in cards:
+            counts[rank_index(card)] += 1
+        up = rank_index(upcard)
+        if not cards or min(_deck_for(counts, up)) < 0:
+            raise ValueError("Not a hand one deck can deal")
+        hands = self._table()
+        evs = hands.get(f"{composition_key(counts)}|{RANKS[up]}") if hands is not None else None
+        if evs is None:
+            # Not built yet, or a hand only reachable after a split
+            evs = {action: round(ev, 6) for action, ev in evaluate(counts, up).items()}
+        return evs
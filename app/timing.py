@@ -0,0 +1,143 @@
+"""Per-request phase timings, reported in a Server-Timing header.
+
+TimingMiddleware starts a RequestTiming for each request. Code marks its phases
+with `span(name)` or the `@timed(name)` decorator. Time spent in a nested span
+is subtracted from the enclosing one, so each phase reports only its own time
+and the phases add up to no more than the total. Outside a request, for
+example in scripts and tests, spans cost a single context variable lookup.
+
+Phases and their Server-Timing names:
+  session-decode / session-encode   TimedSessionInterface
+  lookup                            find_user
+  logic                             route body (track_metrics), minus nested phases
+  save-users                        save_users
+  log-transaction                   log_transaction
+  render                            render_template
+"""
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import flask
+from flask.sessions import SessionInterface
+
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+SERVER_TIMING_LOG = os.environ.get("SERVER_TIMING_LOG", "0") == "1"
+
+DESCRIPTIONS = {
+    "session-decode": "Session decode",
+    "lookup": "User lookup",
+    "logic": "Game logic",
+    "save-users": "save_users",
+    "log-transaction": "log_transaction",
+    "render": "Template render",
+    "session-encode": "Session encode",
+}
+
+_current = ContextVar("request_timing", default=None)
+log = logging.getLogger(__name__)
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._children = []  # time spent in nested spans, one entry per open span
+
+    def enter(self):
+        self._children.append(0.0)
+
+    def exit(self, name, elapsed):
+        own = elapsed - self._children.pop()
+        self.phases[name] = self.phases.get(name, 0.0) + own
+        if self._children:
+            self._children[-1] += elapsed
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        parts = [f'{name};dur={seconds * 1000:.2f};desc="{DESCRIPTIONS.get(name, name)}"'
+                 for name, seconds in self.phases.items()]
+        parts.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(parts)
+
+@contextmanager
+def span(name):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    timing.enter()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.exit(name, time.perf_counter() - started)
+
+def timed(name):
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def render_template(*args, **kwargs):
+    with span("render"):
+        return flask.render_template(*args, **kwargs)
+
+class TimedSessionInterface(SessionInterface):
+    """Wraps another session interface and times cookie decoding and encoding."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def open_session(self, app, request):
+        with span("session-decode"):
+            return self.inner.open_session(app, request)
+
+    def make_null_session(self, app):
+        return self.inner.make_null_session(app)
+
+    def is_null_session(self, obj):
+        return self.inner.is_null_session(obj)
+
+    def save_session(self, app, session, response):
+        with span("session-encode"):
+            return self.inner.save_session(app, session, response)
+
+class TimingMiddleware:
+    """Adds the Server-Timing header once the response, session included, is final."""
+
+    def __init__(self, wsgi_app, header=SERVER_TIMING, log=SERVER_TIMING_LOG):
+        self.wsgi_app = wsgi_app
+        self.header = header
+        self.log = log
+
+    def __call__(self, environ, start_response):
+        if not (self.header or self.log):
+            return self.wsgi_app(environ, start_response)
+        timing = RequestTiming()
+        token = _current.set(timing)
+
+        def timed_start_response(status, headers, exc_info=None):
+            if self.header:
+                headers.append(("Server-Timing", timing.header()))
+            if self.log:
+                log.info("request timing", extra={"fields": {
+                    "method": environ.get("REQUEST_METHOD"),
+                    "path": environ.get("PATH_INFO"),
+                    "status": int(status.split(" ", 1)[0]),
+                    "total_ms": round(timing.total() * 1000, 2),
+                    "phases_ms": {name: round(s * 1000, 2) for name, s in timing.phases.items()},
+                }})
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, timed_start_response)
+        finally:
+            _current.reset(token)
@@ -0,0 +1,55 @@
+"""Bearer tokens for the JSON API.
+
+A token is the username and a fingerprint of the user's password hash, signed
+with SECRET_KEY by itsdangerous along with the time it was issued. Verifying
+one is a signature check and one user lookup, with nothing stored on the
+server. Tokens expire after API_TOKEN_TTL seconds. Changing a password (or
+rehashing it with new parameters) changes the fingerprint, which revokes every
+token issued before.
+"""
+import hashlib
+import os
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+API_TOKEN_TTL = int(os.environ.get("API_TOKEN_TTL", str(7 * 24 * 3600)))
+
+def fingerprint(password_hash):
+    return hashlib.blake2b(password_hash.encode(), digest_size=6).hexdigest()
+
+class TokenSigner:
+    def __init__(self, secret_key, ttl=API_TOKEN_TTL, salt="casino-api-v1"):
+        self.ttl = ttl
+        self._serializer = URLSafeTimedSerializer(secret_key, salt=salt)
+
+    def issue(self, user):
+        return self._serializer.dumps([user["username"], fingerprint(user["password"])])
+
+    def identity(self, token):
+        """(username, password fingerprint) from a genuine, unexpired token, else None.
+
+        Only the signature is checked, not whether the password changed since.
+        """
+        try:
+            username, stamp = self._serializer.loads(token, max_age=self.ttl)
+        except (BadSignature, ValueError, TypeError):
+            return None
+        return username, stamp
+
+    def verify(self, token, find_user):
+        """The user a token was issued to, or None if it is invalid, expired or revoked."""
+        identity = self.identity(token)
+        if identity is None:
+            return None
+        username, stamp = identity
+        user = find_user(username)
+        if user is None or fingerprint(user["password"]) != stamp:
+            return None
+        return user
+
+def bearer_token(authorization):
+    """The token from an `Authorization: Bearer <token>` header value, or None."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return token.strip() or None
@@ -0,0 +1,250 @@
+"""Compact in-memory user store.
+
+Every user has a stable integer ID. Balances, last-active times and admin flags
+live in typed arrays indexed by ID, a few bytes per user. The rest of a user
+(username, password hash) stays in the snapshot until that user is looked up,
+at which point it becomes a UserRecord with __slots__. Aggregates such as
+totals, active counts and rankings run over the arrays without decoding any
+records.
+
+UserRecord supports the dict operations the routes use (user["balance"] += x,
+user.get("last_active", 0)) and attribute access for the templates. The arrays
+hold the authoritative values, so every change made through a record shows up
+in the aggregates immediately.
+"""
+import heapq
+import json
+import math
+from array import array
+
+from app.snapshot import encode
+
+COLUMN_TYPES = ("q", "d", "B")
+COLUMN_FIELDS = ("balance", "last_active", "is_admin")
+
+class UserRecord:
+    __slots__ = ("_table", "id", "username", "password", "extra")
+
+    def __init__(self, table, user_id, username, password, extra=None):
+        self._table = table
+        self.id = user_id
+        self.username = username
+        self.password = password
+        self.extra = extra  # any other fields found in users.json, kept for round trips
+
+    @property
+    def balance(self):
+        return self._table.balances[self.id]
+
+    @balance.setter
+    def balance(self, value):
+        self._table.balances[self.id] = value
+
+    @property
+    def last_active(self):
+        value = self._table.last_active[self.id]
+        return None if math.isnan(value) else value
+
+    @last_active.setter
+    def last_active(self, value):
+        self._table.last_active[self.id] = math.nan if value is None else value
+
+    @property
+    def is_admin(self):
+        return bool(self._table.admins[self.id])
+
+    @is_admin.setter
+    def is_admin(self, value):
+        self._table.admins[self.id] = 1 if value else 0
+
+    # Dict-style access, as the routes used when users were plain dicts
+
+    def keys(self):
+        keys = ["username", "password", "balance", "is_admin"]
+        if self.last_active is not None:
+            keys.append("last_active")
+        return keys + list(self.extra or ())
+
+    def __getitem__(self, key):
+        if key in ("username", "password", "balance", "is_admin"):
+            return getattr(self, key)
+        if key == "last_active":
+            value = self.last_active
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in ("username", "password", "balance", "is_admin", "last_active"):
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, default=None):
+        """Remove an extra field; the fixed fields cannot be removed."""
+        if self.extra and key in self.extra:
+            return self.extra.pop(key)
+        return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+    def __repr__(self):
+        return f"UserRecord({self.to_dict()!r})"
+
+class UserTable:
+    """Users by ID, backed by a snapshot whose ordinals are the IDs.
+
+    Saving writes records in ID order, so after every save a user's snapshot
+    ordinal equals its ID and IDs never have to be remapped. Records are
+    decoded on first lookup and kept; untouched users are copied from the old
+    snapshot as raw bytes when the store is saved.
+    """
+
+    def __init__(self, snap=None):
+        self._snap = snap
+        self._ids = {}  # username -> ID for users added since the snapshot was written
+        self._records = {}  # ID -> UserRecord for users looked up or added
+        if snap is not None:
+            self.balances, self.last_active, self.admins = snap.columns()
+        else:
+            self.balances, self.last_active, self.admins = (array(t) for t in COLUMN_TYPES)
+
+    @classmethod
+    def from_dicts(cls, users):
+        table = cls()
+        for user in users:
+            table.append(user)
+        return table
+
+    # Lookups
+
+    def _id(self, username):
+        user_id = self._ids.get(username)
+        if user_id is not None:
+            return user_id
+        # Read the snapshot once: a concurrent save may rebase onto a new one
+        snap = self._snap
+        return snap.find(username) if snap is not None else None
+
+    def get(self, username):
+        user_id = self._id(username)
+        if user_id is None:
+            return None
+        return self.record(user_id)
+
+    def record(self, user_id):
+        record = self._records.get(user_id)
+        if record is None:
+            data = json.loads(self._snap.raw(user_id))
+            for field in COLUMN_FIELDS:
+                data.pop(field, None)
+            record = UserRecord(self, user_id, data.pop("username"), data.pop("password", None), data or None)
+            record = self._records.setdefault(user_id, record)
+        return record
+
+    def __contains__(self, username):
+        return self._id(username) is not None
+
+    def append(self, user):
+        """Add a user from a dict and return its record. Callers hold store_lock."""
+        user = dict(user)
+        user_id = len(self.balances)
+        self.balances.append(int(user.pop("balance", 0)))
+        last_active = user.pop("last_active", None)
+        self.last_active.append(math.nan if last_active is None else last_active)
+        self.admins.append(1 if user.pop("is_admin", False) else 0)
+        record = UserRecord(self, user_id, user.pop("username"), user.pop("password", None), user or None)
+        self._records[user_id] = record
+        self._ids[record.username] = user_id
+        return record
+
+    def __len__(self):
+        return len(self.balances)
+
+    def __bool__(self):
+        return len(self.balances) > 0
+
+    def __iter__(self):
+        for user_id in range(len(self.balances)):
+            yield self.record(user_id)
+
+    def usernames(self):
+        """All usernames in sorted order, read from the snapshot index without decoding records."""
+        snap = self._snap
+        names = list(snap.keys()) if snap is not None else []
+        return sorted(names + list(self._ids)) if self._ids else names
+
+    # Column aggregates
+
+    def total_balance(self):
+        return sum(self.balances)
+
+    def admin_count(self):
+        return sum(self.admins)
+
+    def active_since(self, cutoff):
+        """Number of users active after `cutoff`; users never seen are NaN and never count."""
+        return sum(map(float(cutoff).__lt__, self.last_active))
+
+    def ranked(self, limit=None):
+        """Records by balance, highest first."""
+        balances = self.balances
+        if limit is None:
+            ids = sorted(range(len(balances)), key=balances.__getitem__, reverse=True)
+        else:
+            ids = heapq.nlargest(limit, range(len(balances)), key=balances.__getitem__)
+        return [self.record(user_id) for user_id in ids]
+
+    def balances_by_username(self):
+        """Yield (username, balance) without decoding untouched records."""
+        snap = self._snap
+        if snap is not None:
+            for username, user_id in snap.positions():
+                yield username, self.balances[user_id]
+        for username, user_id in list(self._ids.items()):
+            yield username, self.balances[user_id]
+
+    # Persistence, used by write_store
+
+    def raw_items(self):
+        snap = self._snap
+        for user_id in range(len(self.balances)):
+            record = self._records.get(user_id)
+            if record is not None:
+                yield record.username, encode(record.to_dict())
+            else:
+                yield snap.key(user_id).decode(), snap.raw(user_id)
+
+    def columns(self):
+        return [self.balances, self.last_active, self.admins]
+
+    def rebase(self, snap):
+        self._snap = snap
+        self._ids = {}
+
+    def forget_records(self):
+        """Drop all decoded records. Only safe while no request holds one, e.g. at startup."""
+        self._records = {}
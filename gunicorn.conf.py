@@ -0,0 +1,6 @@
+"""Gunicorn hooks; the server settings themselves are passed on the command line."""
+
+def post_worker_init(worker):
+    # After gunicorn installed its signal handlers, so the drain runs before its graceful stop
+    from app.app import lifecycle
+    lifecycle.install()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Ledger Analytics
+Builds the finance reports from the transaction ledger without loading it:
+balance_history.json is cut into byte ranges at user lines, and each range
+and cold segment is parsed and folded by a process pool (see app/analytics.py).
+
+Reports, one file each in --out:
+  rtp.json        per game: bets, wagered, returned, realized RTP
+  daily_ggr.json  per day: bets, wagered, gross gaming revenue
+  user_ltv.json   per user: bets, wagered, lifetime value, tips, adjustments
+  tip_flows.json  per sender and recipient: tips and coins
+
+Each file is compact columnar JSON, {"version", "rows", "columns": {name: [values]}},
+which loads straight into a dataframe (pandas.DataFrame(data["columns"])).
+
+Usage:
+  python scripts/analytics.py --history /data/balance_history.json --out /data/reports
+  python scripts/analytics.py --workers 8 --no-cold
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analytics import ANALYTICS_BATCH_RECORDS, ANALYTICS_RANGE_BYTES, ANALYTICS_WORKERS, analyze, write_report
+from app.retention import COLD_DIR
+
+def print_rtp(columns):
+    print(f"{'game':<10} {'bets':>12} {'wagered':>14} {'returned':>14} {'rtp':>8}")
+    for game, bets, wagered, returned, rtp in zip(*columns.values()):
+        rtp = f"{rtp:.2%}" if rtp is not None else "-"
+        print(f"{game:<10} {bets:>12,} {wagered:>14,} {returned:>14,} {rtp:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", default="balance_history.json", help="hot ledger file")
+    parser.add_argument("--cold-dir", default=COLD_DIR, help="archived ledger segments")
+    parser.add_argument("--no-cold", action="store_true", help="only report on the hot ledger")
+    parser.add_argument("--out", default="reports", help="directory for the report files")
+    parser.add_argument("--workers", type=int, default=ANALYTICS_WORKERS, help="processes (default: CPU count)")
+    parser.add_argument("--range-bytes", type=int, default=ANALYTICS_RANGE_BYTES,
+                        help="bytes of the hot ledger per pool task")
+    parser.add_argument("--batch-records", type=int, default=ANALYTICS_BATCH_RECORDS,
+                        help="ledger records per pool task, for a ledger not saved one user per line")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+
+    def progress(records, done):
+        rate = records / (time.monotonic() - started)
+        print(f"{records:,} records ({done:.1%} of {args.history}), {rate:,.0f} records/s", file=sys.stderr)
+
+    summary = analyze(args.history, None if args.no_cold else args.cold_dir, args.workers, args.batch_records,
+                      progress, args.range_bytes)
+    os.makedirs(args.out, exist_ok=True)
+    reports = summary.reports()
+    for name, columns in reports.items():
+        write_report(os.path.join(args.out, f"{name}.json"), columns)
+
+    elapsed = time.monotonic() - started
+    print(f"{summary.records:,} records from {len(summary.users):,} users in {elapsed:.1f}s; "
+          f"reports written to {args.out}", file=sys.stderr)
+    print_rtp(reports["rtp"])
+
+if __name__ == "__main__":
+    main()
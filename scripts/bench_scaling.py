@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Storage Scaling Benchmark
+Generates datasets of growing size with gen_dataset.py and measures, each in a
+fresh process:
+
+  load_users / load_history   full JSON parse (the no-snapshot path)
+  open_users / open_history   lazy open from the binary snapshot
+  save_users / save_history   rewrite of JSON + snapshot after one change
+  admin_render                GET /admin over every user
+  peak_rss_mb                 peak resident memory of the measuring process
+
+Results go to a CSV, an ASCII chart per metric and, if matplotlib is
+installed, a PNG via --plot.
+
+Usage: python scripts/bench_scaling.py --sizes 10000,100000,1000000 --tx-per-user 20
+"""
+
+import argparse
+import atexit
+import csv
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from gen_dataset import generate
+
+METRICS = ["load_users", "open_users", "save_users", "load_history", "open_history", "save_history",
+           "admin_render", "peak_rss_mb"]
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def measure(data_dir):
+    """Runs in a child process so memory numbers start from a clean interpreter."""
+    work_dir = tempfile.mkdtemp(prefix="casino-scaling-")
+    atexit.register(shutil.rmtree, work_dir, ignore_errors=True)
+    os.chdir(work_dir)
+    sys.path.insert(0, REPO_ROOT)
+    import app.app as casino
+    from app.snapshot import LazyMap
+    from app.usertable import UserTable
+
+    results = {}
+
+    def timed(name, fn):
+        started = time.perf_counter()
+        value = fn()
+        results[name] = time.perf_counter() - started
+        return value
+
+    casino.USERS_FILE = os.path.join(data_dir, "users.json")
+    casino.BALANCE_HISTORY_FILE = os.path.join(data_dir, "balance_history.json")
+
+    users_list = timed("load_users", casino.load_users_json)
+    casino.users = UserTable.from_dicts(users_list)
+    del users_list
+    history = timed("load_history", casino.load_balance_history_json)
+    casino.balance_history = LazyMap(items=history.items())
+    del history
+
+    # The first save writes the snapshots; time the second, which is the steady state
+    casino.save_users()
+    casino.users.forget_records()
+    casino.save_balance_history()
+    casino.find_user("user1")["balance"] += 1
+    timed("save_users", casino.save_users)
+    casino.balance_history["user1"].append({"timestamp": "2099-01-01 00:00:00", "type": "slots", "amount": 1})
+    timed("save_history", casino.save_balance_history)
+
+    client = casino.app.test_client()
+    with client.session_transaction() as sess:
+        sess["admin_authenticated"] = True
+    timed("admin_render", lambda: client.get("/admin"))
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    timed("open_users", casino.load_users)
+    timed("open_history", casino.load_balance_history)
+    print(json.dumps(results))
+
+def ascii_chart(rows, metric, width=50):
+    peak = max(row[metric] for row in rows) or 1
+    unit = "MB" if metric.endswith("_mb") else "s"
+    print(f"\n{metric}")
+    for row in rows:
+        bar = "#" * max(1, int(width * row[metric] / peak))
+        print(f"  {row['users']:>10,} users {bar} {row[metric]:.3f}{unit}")
+
+def plot(rows, path):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed; skipping --plot")
+        return
+    sizes = [row["users"] for row in rows]
+    fig, (timing, memory) = plt.subplots(1, 2, figsize=(12, 5))
+    for metric in METRICS[:-1]:
+        timing.plot(sizes, [row[metric] for row in rows], marker="o", label=metric)
+    timing.set(xscale="log", yscale="log", xlabel="users", ylabel="seconds", title="Storage operations")
+    timing.legend()
+    memory.plot(sizes, [row["peak_rss_mb"] for row in rows], marker="o")
+    memory.set(xscale="log", xlabel="users", ylabel="MB", title="Peak RSS")
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"Chart written to {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated user counts")
+    parser.add_argument("--tx-per-user", type=float, default=20, help="average transactions per user")
+    parser.add_argument("--distribution", default="zipf", choices=["zipf", "lognormal", "uniform"])
+    parser.add_argument("--csv", default="scaling.csv", help="where to write the results table")
+    parser.add_argument("--plot", metavar="PNG", help="also draw a chart (needs matplotlib)")
+    parser.add_argument("--measure", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    rows = []
+    for n_users in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as data_dir:
+            n_tx = generate(data_dir, n_users, int(n_users * args.tx_per_user), args.distribution, progress=False)
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", data_dir],
+                                 capture_output=True, text=True, check=True).stdout
+            row = {"users": n_users, "transactions": n_tx, **json.loads(out.splitlines()[-1])}
+            rows.append(row)
+            print(f"{n_users:>10,} users {n_tx:>12,} tx  " +
+                  "  ".join(f"{m}={row[m]:.3f}" for m in METRICS))
+
+    with open(args.csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["users", "transactions", *METRICS])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Results written to {args.csv}")
+
+    for metric in METRICS:
+        ascii_chart(rows, metric)
+    if args.plot:
+        plot(rows, args.plot)
+
+if __name__ == "__main__":
+    main()
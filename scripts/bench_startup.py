@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measures how long `import app.app` takes for growing user counts, once from the
+pretty-printed JSON files (cold, which also writes the snapshots) and once from
+the binary snapshots (warm).
+
+Usage: python scripts/bench_startup.py [--sizes 10000,100000,1000000] [--history 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Well-formed but unusable scrypt hash; sharing one keeps generation fast
+PASSWORD_HASH = "scrypt:32768:8:1$bench$" + "0" * 128
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.app as c; " \
+                 "t1 = time.perf_counter(); c.find_user('user0'); " \
+                 "print(t1 - t, time.perf_counter() - t1)"
+
+def write_dataset(directory, n_users, history_per_user):
+    """Write users.json and balance_history.json in the app's historical indent=4 format."""
+    users = [{"username": f"user{i}", "password": PASSWORD_HASH, "balance": 1000 + i % 5000,
+              "is_admin": False, "last_active": 1700000000.0 + i} for i in range(n_users)]
+    with open(os.path.join(directory, "users.json"), "w") as f:
+        json.dump(users, f, indent=4)
+    history = {
+        f"user{i}": [{"timestamp": "2099-01-01 12:00:00", "type": "slots", "details": "Slots bet: 10 coins",
+                      "amount": -10, "result": "lost", "balance_after": 990, "wager": 10}] * history_per_user
+        for i in range(n_users)
+    }
+    with open(os.path.join(directory, "balance_history.json"), "w") as f:
+        json.dump(history, f, indent=4)
+
+def timed_import(directory):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=directory, env=env,
+                         capture_output=True, text=True, check=True).stdout.split()
+    return float(out[-2]), float(out[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated user counts")
+    parser.add_argument("--history", type=int, default=5, help="transactions per user")
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'json import':>12} {'snap import':>12} {'first lookup':>13} {'speedup':>8}")
+    for n_users in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            write_dataset(directory, n_users, args.history)
+            generated = time.perf_counter() - started
+
+            cold, _ = timed_import(directory)  # parses JSON and writes the snapshots
+            warm, lookup = timed_import(directory)
+            print(f"{n_users:>10} {cold:>11.3f}s {warm:>11.3f}s {lookup * 1000:>11.3f}ms {cold / warm:>7.1f}x"
+                  f"  (dataset generated in {generated:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Shared helpers for the load test and benchmark scripts: summary statistics,
+baseline files and regression checks. Standard library only."""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from statistics import NormalDist
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+def percentile(sorted_values, q):
+    """Linear-interpolated percentile of an already sorted list, q in [0, 100]."""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+def environment():
+    """Where the numbers came from, stored with every result file."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(BASELINE_DIR)).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit,
+            "python": sys.version.split()[0], "machine": platform.machine(), "cpus": os.cpu_count()}
+
+def baseline_path(kind, name):
+    return os.path.join(BASELINE_DIR, kind, f"{name}.json")
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def relative_change(current, baseline):
+    if not baseline:
+        return 0.0
+    return (current - baseline) / baseline
+
+def autorange(fn, min_time=0.05):
+    """Loop count that makes one timed round of `fn` last at least `min_time` seconds."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - started >= min_time:
+            return number
+        number *= 2
+
+def time_rounds(fn, rounds, number):
+    """Seconds per call of `fn`, one sample per round."""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+def mann_whitney_p(a, b):
+    """Two-sided p-value of the Mann-Whitney U test (normal approximation).
+
+    Timing samples are skewed by GC pauses and scheduler noise, so a rank test
+    is a safer regression check than comparing means.
+    """
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    ranked = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(ranked)
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1  # ties share the average rank
+        i = j + 1
+    r1 = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u1 = r1 - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    sd = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12)
+    if sd == 0:
+        return 1.0
+    z = (abs(u1 - mean) - 0.5) / sd
+    return max(0.0, min(1.0, 2 * (1 - NormalDist().cdf(z))))
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Synthetic Dataset Generator
+Writes realistic users and transaction histories for scale-testing the storage
+layer. Output is streamed, so memory stays flat no matter how many users or
+transactions are requested.
+
+Activity per user follows --distribution:
+  zipf       a few whales and a long tail (weight of rank r is 1 / r^alpha)
+  lognormal  most players moderately active, heavy right tail
+  uniform    everyone equally active
+
+Formats:
+  json    users.json + balance_history.json, exactly as app/app.py stores them
+  ndjson  users.ndjson + ledger.ndjson, one transaction per line (the export format)
+
+Usage:
+  python scripts/gen_dataset.py --users 1000000 --transactions 100000000 --out /data/scale
+  python scripts/gen_dataset.py --users 50000 --transactions 2000000 --distribution lognormal
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Well-formed but unusable scrypt hash; sharing one keeps generation fast
+PASSWORD_HASH = "scrypt:32768:8:1$synthetic$" + "0" * 128
+
+GAME_MIX = [("slots", 45), ("roulette", 30), ("blackjack", 20), ("tip_sent", 4), ("admin_add", 1)]
+ROULETTE_COLORS = ["red", "black", "green"]
+
+def activity_weights(n_users, distribution, alpha, seed):
+    """Yield one unnormalized activity weight per user, reproducibly."""
+    rng = random.Random(seed)
+    for rank in range(1, n_users + 1):
+        if distribution == "zipf":
+            yield 1.0 / rank ** alpha
+        elif distribution == "lognormal":
+            yield rng.lognormvariate(0, alpha)
+        else:
+            yield 1.0
+
+def transaction(rng, kind, balance, n_users):
+    """One ledger record plus the balance after it."""
+    if kind == "tip_sent":
+        amount = -min(balance, rng.randint(1, 100))
+        details = f"Tip sent to user{rng.randrange(n_users)}"
+        return {"type": kind, "details": details, "amount": amount, "result": "sent", "wager": None}, balance + amount
+    if kind == "admin_add":
+        amount = rng.choice([100, 500, 1000, 5000])
+        return {"type": kind, "details": f"Admin added {amount} coins", "amount": amount,
+                "result": None, "wager": None}, balance + amount
+
+    bet = max(1, min(balance, int(rng.lognormvariate(3, 1))))
+    if kind == "slots":
+        won = rng.random() < 0.3
+        net = bet * rng.choice([1, 2, 3, 5]) - bet if won else -bet
+        details = f"Slots bet: {bet} coins"
+    elif kind == "roulette":
+        color = rng.choice(ROULETTE_COLORS)
+        won = rng.random() < (1 / 15 if color == "green" else 7 / 15)
+        net = bet * (13 if color == "green" else 1) if won else -bet
+        details = f"Roulette bet on {color}: {bet} coins"
+    else:
+        won = rng.random() < 0.43
+        net = bet if won else -bet
+        details = f"Blackjack bet: {bet} coins"
+    result = "won" if won else "lost"
+    return {"type": kind, "details": details, "amount": net, "result": result, "wager": bet}, balance + net
+
+def user_transactions(rng, count, start, span_seconds, n_users):
+    """Yield (record, balance_after) in time order without materializing the list."""
+    kinds = [k for k, _ in GAME_MIX]
+    weights = [w for _, w in GAME_MIX]
+    balance = 1000
+    timestamp = start
+    mean_gap = span_seconds / max(count, 1)
+    for _ in range(count):
+        timestamp += timedelta(seconds=rng.expovariate(1 / mean_gap))
+        kind = rng.choices(kinds, weights)[0]
+        if balance <= 0 and kind != "admin_add":
+            kind = "admin_add"
+        record, balance = transaction(rng, kind, balance, n_users)
+        record = {"timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"), **record, "balance_after": balance}
+        yield record, balance
+
+class JsonWriter:
+    """users.json (list) and balance_history.json (username -> list), one user per line."""
+
+    def __init__(self, out_dir):
+        self.users = open(os.path.join(out_dir, "users.json"), "w", buffering=1 << 20)
+        self.history = open(os.path.join(out_dir, "balance_history.json"), "w", buffering=1 << 20)
+        self.users.write("[")
+        self.history.write("{")
+        self.first = True
+
+    def begin_user(self, username):
+        sep = "\n" if self.first else ",\n"
+        self.history.write(f"{sep}{json.dumps(username)}:[")
+        self.first_record = True
+
+    def record(self, username, record):
+        self.history.write(("" if self.first_record else ",") + json.dumps(record, separators=(",", ":"),
+                                                                           ensure_ascii=False))
+        self.first_record = False
+
+    def end_user(self, user):
+        sep = "\n" if self.first else ",\n"
+        self.users.write(sep + json.dumps(user, separators=(",", ":")))
+        self.history.write("]")
+        self.first = False
+
+    def close(self):
+        self.users.write("\n]\n")
+        self.history.write("\n}\n")
+        self.users.close()
+        self.history.close()
+
+class NdjsonWriter:
+    """users.ndjson and ledger.ndjson, one object per line with the username inline."""
+
+    def __init__(self, out_dir):
+        self.users = open(os.path.join(out_dir, "users.ndjson"), "w", buffering=1 << 20)
+        self.ledger = open(os.path.join(out_dir, "ledger.ndjson"), "w", buffering=1 << 20)
+
+    def begin_user(self, username):
+        pass
+
+    def record(self, username, record):
+        self.ledger.write(json.dumps({"username": username, **record}, separators=(",", ":"),
+                                     ensure_ascii=False) + "\n")
+
+    def end_user(self, user):
+        self.users.write(json.dumps(user, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.users.close()
+        self.ledger.close()
+
+WRITERS = {"json": JsonWriter, "ndjson": NdjsonWriter}
+
+def generate(out_dir, n_users, n_transactions, distribution="zipf", alpha=1.1, days=90, seed=42,
+             fmt="json", progress=True):
+    os.makedirs(out_dir, exist_ok=True)
+    total_weight = sum(activity_weights(n_users, distribution, alpha, seed))
+    per_weight = n_transactions / total_weight if total_weight else 0
+
+    rng = random.Random(seed)
+    writer = WRITERS[fmt](out_dir)
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    span = days * 86400
+    written = 0
+    cumulative = 0.0
+    started = last_report = time.monotonic()
+
+    for i, weight in enumerate(activity_weights(n_users, distribution, alpha, seed)):
+        username = f"user{i}"
+        # Round the running total rather than each count, so rounding errors never add up,
+        # and give the last user whatever is left so the total is exactly n_transactions
+        cumulative += weight
+        target = n_transactions if i == n_users - 1 else round(cumulative * per_weight)
+        count = target - written
+
+        writer.begin_user(username)
+        balance = 1000
+        # Start each user at a random point so whales and the long tail interleave in time
+        user_start = start + timedelta(seconds=rng.randrange(span // 2 + 1))
+        for record, balance in user_transactions(rng, count, user_start, span // 2, n_users):
+            writer.record(username, record)
+        writer.end_user({"username": username, "password": PASSWORD_HASH, "balance": balance,
+                         "is_admin": i == 0, "last_active": end.timestamp() - rng.randrange(span)})
+        written += count
+
+        now = time.monotonic()
+        if progress and now - last_report >= 5:
+            last_report = now
+            print(f"{i + 1:,}/{n_users:,} users, {written:,} transactions, "
+                  f"{written / (now - started):,.0f} tx/s", file=sys.stderr)
+
+    writer.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=1000000, help="total transactions")
+    parser.add_argument("--distribution", choices=["zipf", "lognormal", "uniform"], default="zipf")
+    parser.add_argument("--alpha", type=float, default=1.1, help="zipf exponent or lognormal sigma")
+    parser.add_argument("--days", type=int, default=90, help="time span covered by the history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=sorted(WRITERS), default="json")
+    parser.add_argument("--out", default=".", help="output directory")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    written = generate(args.out, args.users, args.transactions, args.distribution, args.alpha,
+                       args.days, args.seed, args.format)
+    print(f"Wrote {args.users:,} users and {written:,} transactions to {args.out} "
+          f"in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
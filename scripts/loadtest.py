@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Load Test
+Drives realistic player journeys against a running casino instance and reports
+throughput and latency per endpoint. Standard library only.
+
+Each virtual player logs in (registering on first use), then loops through
+slots and roulette spins over the JSON API, a full blackjack round played from
+the HTML (hit, stand, double and split decided from the page), an occasional
+tip to another player and a balance check. Redirects are followed by hand, so
+every hop is timed under its own endpoint.
+
+Usage:
+  python scripts/loadtest.py --url http://127.0.0.1:5000 --users 20 --duration 60
+  python scripts/loadtest.py --spawn --save-baseline release-1.4
+  python scripts/loadtest.py --spawn --compare release-1.4 --threshold 0.2
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from benchlib import summarize, environment, baseline_path, save_results, load_results, relative_change
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLAYER_VALUE = re.compile(r'hand-value">Value: (\d+)')
+ACTIVE_HAND_VALUE = re.compile(r'active-hand">.*?hand-value">Value: (\d+)', re.S)
+
+class Recorder:
+    """Thread-safe latency samples and error counts per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+class Client:
+    """Keep-alive HTTP client with a cookie jar of one session cookie."""
+
+    def __init__(self, base_url, recorder, timeout=30):
+        parts = urlsplit(base_url)
+        self._host, self._port = parts.hostname, parts.port or 80
+        self._timeout = timeout
+        self._conn = None
+        self._cookies = {}
+        self._recorder = recorder
+
+    def request(self, method, path, endpoint, form=None, json_body=None):
+        """Send one request without following redirects. Returns (status, headers, body)."""
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            body = json.dumps(json_body)
+            headers["Content-Type"] = "application/json"
+        if self._cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self._cookies.items())
+
+        started = time.perf_counter()
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            self._conn.request(method, path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            data = response.read().decode("utf-8", "replace")
+        except (OSError, http.client.HTTPException):
+            self._recorder.record(endpoint, time.perf_counter() - started, False)
+            self._conn = None
+            return 0, {}, ""
+        self._recorder.record(endpoint, time.perf_counter() - started, response.status < 400)
+
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(header)
+            for key, morsel in cookie.items():
+                if morsel.value:
+                    self._cookies[key] = morsel.value
+                else:
+                    self._cookies.pop(key, None)
+        return response.status, response.headers, data
+
+    def get(self, path, endpoint=None, follow=True):
+        """GET `path`, following redirects and timing each hop separately."""
+        status, headers, body = self.request("GET", path, endpoint or f"GET {path}")
+        hops = 0
+        while follow and status in (301, 302, 303) and hops < 5:
+            path = urlsplit(headers["Location"]).path
+            status, headers, body = self.request("GET", path, f"GET {path}")
+            hops += 1
+        return status, body
+
+class Player:
+    def __init__(self, name, client, peers, rng):
+        self.name = name
+        self.client = client
+        self.peers = peers
+        self.rng = rng
+
+    def login(self):
+        self.client.request("POST", "/", "POST /", form={"username": self.name, "password": "loadtest-pass"})
+        self.client.get("/menu")
+
+    def slots(self):
+        self.client.request("POST", "/slots", "POST /slots (json)", json_body={"bet": self.rng.randint(1, 10)})
+
+    def roulette(self):
+        color = self.rng.choice(["red", "black", "red", "black", "green"])
+        self.client.request("POST", "/roulette", "POST /roulette (json)",
+                            json_body={"color": color, "bet": self.rng.randint(1, 10)})
+
+    def choose_action(self, page):
+        if 'value="split"' in page and self.rng.random() < 0.8:
+            return "split"
+        match = ACTIVE_HAND_VALUE.search(page)
+        values = PLAYER_VALUE.findall(page)
+        value = int(match.group(1)) if match else int(values[-1]) if values else 21
+        if 'value="double"' in page and value in (9, 10, 11):
+            return "double"
+        return "hit" if value < 17 else "stand"
+
+    def blackjack(self):
+        status, page = self.client.get("/blackjack_bet", "GET /blackjack_bet")
+        for _ in range(20):
+            if status != 200 or "Play Again" in page:
+                return
+            if 'name="bet"' in page:
+                self.client.request("POST", "/blackjack_bet", "POST /blackjack_bet (bet)",
+                                    form={"bet": self.rng.randint(5, 20)})
+            elif 'value="hit"' in page:
+                action = self.choose_action(page)
+                self.client.request("POST", "/blackjack_bet", f"POST /blackjack_bet ({action})",
+                                    form={"action": action})
+            else:
+                return
+            status, page = self.client.get("/blackjack_bet", "GET /blackjack_bet")
+
+    def tip(self):
+        peer = self.rng.choice(self.peers)
+        if peer != self.name:
+            self.client.request("POST", "/tip", "POST /tip", form={"username": peer, "amount": "1"})
+
+    def journey(self, deadline):
+        self.login()
+        while time.monotonic() < deadline:
+            self.slots()
+            self.roulette()
+            self.blackjack()
+            if self.rng.random() < 0.2:
+                self.tip()
+            if self.rng.random() < 0.1:
+                self.client.get("/balance")
+
+def wait_for_port(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not come up within {timeout}s")
+
+def spawn_gunicorn(port, gunicorn_args):
+    """Start gunicorn on a throwaway data directory, as the Dockerfile runs it.
+
+    Returns (process, data directory); stop_gunicorn removes the directory.
+    """
+    data_dir = tempfile.mkdtemp(prefix="casino-loadtest-")
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    # Every virtual player shares one IP, which the per-IP rate limit would throttle
+    env.setdefault("ADMISSION_ENABLED", "0")
+    cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", *gunicorn_args.split(), "app.app:app"]
+    process = subprocess.Popen(cmd, cwd=data_dir, env=env)
+    try:
+        wait_for_port("127.0.0.1", port)
+    except BaseException:
+        stop_gunicorn(process, data_dir)
+        raise
+    return process, data_dir
+
+def stop_gunicorn(process, data_dir):
+    process.terminate()
+    process.wait(timeout=30)
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+def report(recorder, elapsed):
+    endpoints = {}
+    total = 0
+    for endpoint, samples in sorted(recorder.samples.items()):
+        stats = summarize([s * 1000 for s in samples])
+        stats["errors"] = recorder.errors.get(endpoint, 0)
+        stats["rps"] = stats["count"] / elapsed
+        endpoints[endpoint] = stats
+        total += stats["count"]
+
+    print(f"\n{'endpoint':<34} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, s in endpoints.items():
+        print(f"{endpoint:<34} {s['count']:>7} {s['errors']:>5} {s['rps']:>8.1f} "
+              f"{s['p50']:>8.1f} {s['p95']:>8.1f} {s['p99']:>8.1f}")
+    print(f"\nTotal: {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    return {"endpoints": endpoints, "total_rps": total / elapsed, "duration": elapsed}
+
+def compare(results, baseline, threshold):
+    """Print changes against a baseline. Returns True if anything regressed past `threshold`."""
+    regressed = False
+    print(f"\n{'endpoint':<34} {'p95 change':>11} {'rps change':>11}")
+    for endpoint, stats in results["endpoints"].items():
+        base = baseline["endpoints"].get(endpoint)
+        if not base:
+            continue
+        p95 = relative_change(stats["p95"], base["p95"])
+        rps = relative_change(stats["rps"], base["rps"])
+        flag = ""
+        if p95 > threshold or rps < -threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{endpoint:<34} {p95:>+10.1%} {rps:>+10.1%}{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="base URL of the app under test")
+    parser.add_argument("--spawn", action="store_true", help="start a local gunicorn for the run")
+    parser.add_argument("--port", type=int, default=5055, help="port for --spawn")
+    parser.add_argument("--gunicorn-args", default="--workers 2 --worker-class gthread --threads 8",
+                        help="extra gunicorn arguments for --spawn")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual players")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for player decisions")
+    parser.add_argument("--output", help="write the full results as JSON")
+    parser.add_argument("--save-baseline", metavar="NAME", help="store results as benchmarks/loadtest/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.spawn:
+        server = spawn_gunicorn(args.port, args.gunicorn_args)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        recorder = Recorder()
+        run_id = random.Random(args.seed).randrange(1 << 30)
+        names = [f"lt{run_id}-{i}" for i in range(args.users)]
+        deadline = time.monotonic() + args.duration
+        players = [Player(name, Client(url, recorder), names,
+                          random.Random(f"{args.seed}-{name}" if args.seed is not None else None))
+                   for name in names]
+        threads = [threading.Thread(target=p.journey, args=(deadline,), daemon=True) for p in players]
+
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results = report(recorder, time.monotonic() - started)
+    finally:
+        if server:
+            stop_gunicorn(*server)
+
+    results["meta"] = {**environment(), "users": args.users, "duration": args.duration, "url": url}
+    if args.output:
+        save_results(args.output, results)
+    if args.save_baseline:
+        path = baseline_path("loadtest", args.save_baseline)
+        save_results(path, results)
+        print(f"Baseline saved to {path}")
+    if args.compare:
+        if compare(results, load_results(baseline_path("loadtest", args.compare)), args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks
+Times the hot game primitives and the persistence paths. Storage benchmarks
+run once per (user count, history size) pair. Each benchmark runs --rounds
+timed rounds, sized automatically so a round lasts at least --min-time
+seconds, and one sample per round is kept. With --compare, each benchmark is
+checked against a stored baseline using a Mann-Whitney U test. A benchmark
+counts as a regression when the difference is significant at --alpha and its
+median slowed down by more than --threshold.
+
+Usage:
+  python scripts/microbench.py --users 1000,10000 --history 10,100 --save-baseline main
+  python scripts/microbench.py --compare main --filter save_users
+"""
+
+import argparse
+import atexit
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchlib import (autorange, time_rounds, mann_whitney_p, environment, baseline_path,
+                      save_results, load_results, relative_change)
+
+# app.app loads its stores from the working directory at import time
+WORK_DIR = tempfile.mkdtemp(prefix="casino-microbench-")
+os.chdir(WORK_DIR)
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+import app.app as casino
+from app import blackjack, slots, roulette
+from app.snapshot import LazyMap
+from app.usertable import UserTable
+
+def game_benchmarks():
+    hand = ["A♠", "7♥", "A♦", "2♣"]
+    cards = blackjack.create_deck()
+    yield "card_value", {}, lambda: [blackjack.card_value(c) for c in cards]
+    yield "hand_value", {}, lambda: blackjack.hand_value(hand)
+
+    def deal():
+        deck = blackjack.create_deck()
+        for _ in range(10):
+            blackjack.draw_card(deck)
+    yield "create_deck+draw_card", {}, deal
+
+    def play_round():
+        # The engine behind /blackjack_bet, including the session round trips between requests
+        rnd = blackjack.BlackjackRound.deal(1000)
+        rnd.place_bet(10, 990)
+        rnd = blackjack.BlackjackRound.from_session(rnd.to_session())
+        while rnd.state == blackjack.PLAYING and not rnd.step():
+            rnd.act("hit" if rnd.hand.value < 17 else "stand", 990)
+            rnd = blackjack.BlackjackRound.from_session(rnd.to_session())
+        rnd.step()
+        rnd.settle()
+    yield "blackjack_round", {}, play_round
+
+    yield "spin_reels+calculate_payout", {}, lambda: slots.calculate_payout(10, slots.spin_reels())
+    yield "spin_wheel+payout", {}, lambda: roulette.payout(10, "red", roulette.spin_wheel())
+
+def populate(n_users, history_size):
+    """Replace the app's stores with synthetic data and point them at fresh files."""
+    rng = random.Random(n_users * 1000 + history_size)
+    casino.USERS_FILE = os.path.join(WORK_DIR, f"users-{n_users}-{history_size}.json")
+    casino.BALANCE_HISTORY_FILE = os.path.join(WORK_DIR, f"history-{n_users}-{history_size}.json")
+    casino.users = UserTable.from_dicts(
+        {"username": f"user{i}", "password": "scrypt:32768:8:1$bench$0", "balance": rng.randint(0, 50000),
+         "is_admin": False, "last_active": time.time() - rng.randint(0, 7200)}
+        for i in range(n_users))
+    record = {"timestamp": "2099-01-01 12:00:00", "type": "slots", "details": "Slots bet: 10 coins",
+              "amount": -10, "result": "lost", "balance_after": 990, "wager": 10}
+    casino.balance_history = LazyMap(items=((f"user{i}", [dict(record) for _ in range(history_size)])
+                                            for i in range(n_users)))
+    # Write once so later saves start from a snapshot, as in production
+    casino.save_users()
+    casino.users.forget_records()
+    casino.save_balance_history()
+
+def storage_benchmarks(n_users, history_size):
+    populate(n_users, history_size)
+    params = {"users": n_users, "history": history_size}
+    client = casino.app.test_client()
+    rng = random.Random(0)
+
+    def bet():
+        casino.log_transaction(f"user{rng.randrange(n_users)}", "slots", -10, "Slots bet: 10 coins", "lost", wager=10)
+
+    yield "save_users", params, casino.save_users
+    yield "log_transaction", params, bet
+    yield "metrics_render", params, lambda: client.get("/metrics")
+
+def run(name, params, fn, rounds, min_time):
+    fn()  # warm up caches and lazy loads outside the timed rounds
+    number = autorange(fn, min_time)
+    samples = time_rounds(fn, rounds, number)
+    return {
+        "name": name,
+        "params": params,
+        "number": number,
+        "samples": samples,
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples),
+    }
+
+def key(result):
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]" if params else result["name"]
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1000,10000", help="comma-separated user counts")
+    parser.add_argument("--history", default="10,100", help="comma-separated transactions per user")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per round")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="NAME", help="store results as benchmarks/micro/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a stored baseline")
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level for --compare")
+    parser.add_argument("--threshold", type=float, default=0.05, help="minimum median slowdown to report")
+    args = parser.parse_args()
+
+    suites = [game_benchmarks()]
+    for n_users in (int(n) for n in args.users.split(",")):
+        for history_size in (int(h) for h in args.history.split(",")):
+            suites.append(storage_benchmarks(n_users, history_size))
+
+    baseline = load_results(baseline_path("micro", args.compare))["benchmarks"] if args.compare else {}
+    results = {}
+    regressed = []
+    print(f"{'benchmark':<52} {'median':>10} {'stdev':>10} {'vs base':>9} {'p':>7}")
+    for suite in suites:
+        for name, params, fn in suite:
+            if args.filter not in name:
+                continue
+            result = run(name, params, fn, args.rounds, args.min_time)
+            results[key(result)] = result
+            line = f"{key(result):<52} {format_time(result['median']):>10} {format_time(result['stdev']):>10}"
+            base = baseline.get(key(result))
+            if base:
+                change = relative_change(result["median"], base["median"])
+                p = mann_whitney_p(result["samples"], base["samples"])
+                line += f" {change:>+8.1%} {p:>7.3f}"
+                if p < args.alpha and change > args.threshold:
+                    line += "  REGRESSION"
+                    regressed.append(key(result))
+            print(line)
+
+    output = {"meta": environment(), "benchmarks": results}
+    if args.output:
+        save_results(args.output, output)
+    if args.save_baseline:
+        path = baseline_path("micro", args.save_baseline)
+        save_results(path, output)
+        print(f"Baseline saved to {path}")
+    if regressed:
+        print(f"{len(regressed)} regression(s): {', '.join(regressed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
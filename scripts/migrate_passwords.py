@@ -3,74 +3,214 @@
 Password Migration Script
 This script converts plain text passwords to hashed passwords in users.json
 Run this once before deploying the updated application.
+
+Records are streamed from the input, hashed across a process pool and written
+to a partial output file in their original order. A checkpoint is saved every
+--checkpoint-every records, so an interrupted run resumes where it stopped:
+just run the same command again. The finished file replaces users.json
+atomically. Both the old {"username": {...}} and the list format are accepted;
+the output is always the list format.
+
+Usage: python scripts/migrate_passwords.py [--input users.json] [--workers 4]
 """
 
+import argparse
 import json
 import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from werkzeug.security import generate_password_hash
+from app.jsonstream import JsonStream
+from app.hashing import PASSWORD_HASH_METHOD
+
+HASH_PREFIXES = ('pbkdf2:', 'scrypt:', 'bcrypt')
+PROGRESS_INTERVAL = 5  # seconds between progress lines
+
+def migrate_batch(batch, method):
+    """Hash the plaintext passwords in one batch. Runs in a pool worker.
+
+    Returns the encoded output lines and how many passwords were hashed.
+    """
+    lines = []
+    hashed = 0
+    for user in batch:
+        password = user.get('password', '')
+        # Check if password is already hashed (starts with hash method prefix)
+        if not password.startswith(HASH_PREFIXES):
+            user['password'] = generate_password_hash(password, method)
+            hashed += 1
+        user.setdefault('balance', 1000)
+        user.setdefault('is_admin', False)
+        lines.append(json.dumps(user, separators=(",", ":"), ensure_ascii=False))
+    return lines, hashed
+
+def iter_users(stream):
+    for key, value in stream:
+        if stream.is_list:  # New format: [{"username": "...", "password": "...", ...}]
+            yield value
+        else:  # Old format: {"username": {"password": "...", ...}}
+            yield {'username': key, **value}
+
+def iter_batches(users, size, skip):
+    batch = []
+    for i, user in enumerate(users):
+        if i < skip:
+            continue
+        batch.append(user)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class Checkpoint:
+    """Progress marker tying the partial output to the exact input it came from."""
+
+    def __init__(self, path, source_stat):
+        self.path = path
+        self.source = [source_stat.st_size, source_stat.st_mtime_ns]
+        self.records = 0
+        self.output_bytes = 0
+        self.backup = None
+
+    def load(self):
+        """Resume from a previous run. False if there is none or the input changed."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            saved = json.load(f)
+        if saved["source"] != self.source:
+            print("Input changed since the last checkpoint; starting over.")
+            return False
+        self.records = saved["records"]
+        self.output_bytes = saved["output_bytes"]
+        self.backup = saved.get("backup")
+        return True
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"source": self.source, "records": self.records, "output_bytes": self.output_bytes,
+                       "backup": self.backup}, f)
+        os.replace(tmp_path, self.path)
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+
+def new_backup_path(users_file):
+    """A backup name no earlier run has used, e.g. users.json.backup-20250331-120000."""
+    base = f"{users_file}.backup-{time.strftime('%Y%m%d-%H%M%S')}"
+    path = base
+    n = 1
+    while os.path.exists(path):
+        path = f"{base}-{n}"
+        n += 1
+    return path
+
+def migrate_passwords(users_file="users.json", workers=None, batch_size=64, checkpoint_every=10000,
+                      method=PASSWORD_HASH_METHOD):
+    partial_file = f"{users_file}.migrating"
 
-def migrate_passwords():
-    users_file = "users.json"
-    backup_file = "users.json.backup"
-    
     if not os.path.exists(users_file):
-        print("No users.json file found. Nothing to migrate.")
-        return
-    
-    # Create backup
-    if os.path.exists(backup_file):
-        print("Backup file already exists. Remove it first if you want to re-run migration.")
+        print(f"No {users_file} file found. Nothing to migrate.")
         return
-    
-    with open(users_file, 'r') as f:
-        data = json.load(f)
-    
-    # Create backup
-    with open(backup_file, 'w') as f:
-        json.dump(data, f, indent=4)
-    print(f"Created backup: {backup_file}")
-    
-    # Convert format and hash passwords
-    users_list = []
-    
-    if isinstance(data, dict):  # Old format: {"username": {"password": "...", ...}}
-        for username, user_data in data.items():
-            password = user_data.get('password', '')
-            # Check if password is already hashed (starts with hash method prefix)
-            if not password.startswith(('pbkdf2:', 'scrypt:', 'bcrypt')):
-                hashed_password = generate_password_hash(password)
-                print(f"Hashing password for user: {username}")
-            else:
-                hashed_password = password
-                print(f"Password already hashed for user: {username}")
-            
-            users_list.append({
-                'username': username,
-                'password': hashed_password,
-                'balance': user_data.get('balance', 1000),
-                'is_admin': user_data.get('is_admin', False)
-            })
-    
-    elif isinstance(data, list):  # New format: [{"username": "...", "password": "...", ...}]
-        for user in data:
-            password = user.get('password', '')
-            if not password.startswith(('pbkdf2:', 'scrypt:', 'bcrypt')):
-                hashed_password = generate_password_hash(password)
-                print(f"Hashing password for user: {user.get('username', 'unknown')}")
-            else:
-                hashed_password = password
-                print(f"Password already hashed for user: {user.get('username', 'unknown')}")
-            
-            user['password'] = hashed_password
-            user.setdefault('is_admin', False)
-        users_list = data
-    
-    # Save updated data
-    with open(users_file, 'w') as f:
-        json.dump(users_list, f, indent=4)
-    
-    print(f"Migration completed. Updated {len(users_list)} users.")
-    print("Original file backed up as users.json.backup")
+
+    checkpoint = Checkpoint(f"{users_file}.checkpoint", os.stat(users_file))
+    resuming = checkpoint.load() and os.path.exists(partial_file)
+    if resuming:
+        print(f"Resuming after {checkpoint.records} records.")
+    else:
+        checkpoint.records = checkpoint.output_bytes = 0
+
+    # A fresh run always takes its own backup; a resumed one keeps the backup of its first run
+    if resuming and checkpoint.backup and os.path.exists(checkpoint.backup):
+        backup_file = checkpoint.backup
+    else:
+        backup_file = checkpoint.backup = new_backup_path(users_file)
+        shutil.copyfile(users_file, backup_file)
+        print(f"Created backup: {backup_file}")
+
+    total_bytes = os.path.getsize(users_file)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    started = last_report = time.monotonic()
+    processed = hashed_total = 0
+
+    with open(users_file, "rb") as src, open(partial_file, "r+b" if resuming else "wb") as out, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        # Drop anything written after the last checkpoint
+        out.truncate(checkpoint.output_bytes)
+        out.seek(checkpoint.output_bytes)
+        if not resuming:
+            out.write(b"[")
+        first = checkpoint.records == 0
+        since_checkpoint = 0
+
+        stream = JsonStream(src)
+        batches = iter_batches(iter_users(stream), batch_size, checkpoint.records)
+        in_flight = deque()
+
+        def write_result(future):
+            nonlocal first, processed, hashed_total, since_checkpoint, last_report
+            lines, hashed = future.result()
+            for line in lines:
+                out.write((b"\n" if first else b",\n") + line.encode())
+                first = False
+            processed += len(lines)
+            hashed_total += hashed
+            since_checkpoint += len(lines)
+            checkpoint.records += len(lines)
+            if since_checkpoint >= checkpoint_every:
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.output_bytes = out.tell()
+                checkpoint.save()
+                since_checkpoint = 0
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                rate = processed / (now - started)
+                done = stream.bytes_read / total_bytes if total_bytes else 1
+                eta = (now - started) * (1 - done) / done if done else 0
+                print(f"{checkpoint.records} users migrated ({done:.1%}), {rate:,.0f} users/s, ETA {format_eta(eta)}")
+
+        for batch in batches:
+            in_flight.append(pool.submit(migrate_batch, batch, method))
+            if len(in_flight) >= max_in_flight:
+                write_result(in_flight.popleft())
+        while in_flight:
+            write_result(in_flight.popleft())
+
+        out.write(b"\n]\n")
+        out.flush()
+        os.fsync(out.fileno())
+
+    os.replace(partial_file, users_file)
+    if os.path.exists(checkpoint.path):
+        os.remove(checkpoint.path)
+
+    elapsed = time.monotonic() - started
+    print(f"Migration completed. Updated {checkpoint.records} users "
+          f"({hashed_total} passwords hashed this run) in {elapsed:.1f}s.")
+    print(f"Original file backed up as {backup_file}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="users.json", help="users file to migrate in place")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=64, help="users per pool task")
+    parser.add_argument("--checkpoint-every", type=int, default=10000, help="users between checkpoints")
+    parser.add_argument("--method", default=PASSWORD_HASH_METHOD, help="Werkzeug hash method string")
+    args = parser.parse_args()
+    migrate_passwords(args.input, args.workers, args.batch_size, args.checkpoint_every, args.method)
 
 if __name__ == "__main__":
-    migrate_passwords() 
\ No newline at end of file
+    main()
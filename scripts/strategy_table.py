@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Strategy Table
+Computes the EV of stand, hit, double and split for every two-card hand and
+every hand reachable from one by hitting, against every dealer upcard, under
+the casino's blackjack rules (see app/strategy.py). The result is written to
+the file /blackjack/hint reads (STRATEGY_TABLE, default strategy_table.json).
+Standard library only.
+
+With --chart, also prints the basic strategy for two-card hands:
+S stand, H hit, D double, P split.
+
+Usage:
+  python scripts/strategy_table.py
+  python scripts/strategy_table.py --output /data/strategy_table.json --chart
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.strategy import RANKS, STRATEGY_TABLE, build_table, save_table
+
+UPCARDS = "23456789TA"
+LETTERS = {"stand": "S", "hit": "H", "double": "D", "split": "P"}
+
+def chart_rows(table):
+    """(label, row of best-action letters by upcard) for hard totals, soft hands and pairs."""
+    starts = [RANKS[a] + RANKS[b] for a in range(10) for b in range(a, 10)]
+    for key in starts:
+        if key == "AT":
+            continue  # a natural has no decision
+        row = []
+        for up in UPCARDS:
+            evs = table[f"{key}|{up}"]
+            row.append(LETTERS[max(evs, key=evs.get)])
+        yield key, "".join(row)
+
+def print_chart(table):
+    print(f"{'hand':>6}  " + " ".join(UPCARDS))
+    for label, row in chart_rows(table):
+        print(f"{label:>6}  " + " ".join(row))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=STRATEGY_TABLE, help="table file to write")
+    parser.add_argument("--chart", action="store_true", help="print the two-card basic strategy chart")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    table = build_table()
+    save_table(table, args.output)
+    print(f"{len(table)} hands written to {args.output} in {time.monotonic() - started:.1f}s")
+    if args.chart:
+        print_chart(table)
+
+if __name__ == "__main__":
+    main()
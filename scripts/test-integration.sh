@@ -126,7 +126,7 @@ spec:
               cpu: "100m"
           readinessProbe:
             httpGet:
-              path: /metrics
+              path: /readyz
               port: 5000
             initialDelaySeconds: 5
             periodSeconds: 5
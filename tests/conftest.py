@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import pytest
+
+# Importing app.app loads the stores and may write snapshots and compacted history,
+# so every store path points into a scratch directory before it is imported
+DATA_DIR = tempfile.mkdtemp(prefix="casino-tests-")
+os.environ["USERS_FILE"] = os.path.join(DATA_DIR, "users.json")
+os.environ["BALANCE_HISTORY_FILE"] = os.path.join(DATA_DIR, "balance_history.json")
+os.environ["HISTORY_ROLLUPS_FILE"] = os.path.join(DATA_DIR, "history_rollups.json")
+os.environ["HISTORY_COLD_DIR"] = os.path.join(DATA_DIR, "history_cold")
+
+import app.app as casino
+from app.app import app
+from app.snapshot import LazyMap
+from app.usertable import UserTable
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+@pytest.fixture(autouse=True)
+def stores(tmp_path, monkeypatch):
+    """Give the app empty users and ledger stores saved under tmp_path, discarded after the test"""
+    monkeypatch.setattr(casino, "USERS_FILE", str(tmp_path / "users.json"))
+    monkeypatch.setattr(casino, "BALANCE_HISTORY_FILE", str(tmp_path / "balance_history.json"))
+    monkeypatch.setattr(casino, "users", UserTable.from_dicts([]))
+    monkeypatch.setattr(casino, "balance_history", LazyMap(items=[]))
+    monkeypatch.setattr(casino, "users_dirty", False)
+    app.config['TESTING'] = True
+
+@pytest.fixture
+def make_user(stores):
+    def make(username, balance=100, password="x", is_admin=False):
+        return casino.users.append({"username": username, "password": password, "balance": balance,
+                                    "is_admin": is_admin})
+    return make
+
+@pytest.fixture
+def client(stores):
+    with app.test_client() as client:
+        yield client
@@ -0,0 +1,103 @@
+import threading
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+from app.admission import AdmissionMiddleware, MemoryBuckets, queue_ms
+from app.sessions import MemoryStore
+from app.tokens import TokenSigner
+
+def ok_app(environ, start_response):
+    return Response("ok")(environ, start_response)
+
+def make_client(app=ok_app, user=(100, 100), ip=(100, 100), **kwargs):
+    middleware = AdmissionMiddleware(app, MemoryBuckets(*user), ip and MemoryBuckets(*ip), paths="/slots", **kwargs)
+    return Client(middleware)
+
+def test_bucket_refills_at_rate():
+    """Test that a bucket allows its burst, then one request per 1/rate seconds"""
+    bucket = MemoryBuckets(rate=2, burst=3)
+    assert [bucket.take("k", now=0)[0] for _ in range(4)] == [True, True, True, False]
+    assert bucket.take("k", now=0)[1] == 0.5
+    assert bucket.take("k", now=0.5)[0]
+
+def test_ip_limit_returns_429_with_retry_after():
+    """Test that an address over its limit is rejected with a Retry-After hint"""
+    client = make_client(ip=(1, 2))
+    statuses = [client.post("/slots").status_code for _ in range(3)]
+    response = client.post("/slots")
+    assert statuses == [200, 200, 429]
+    assert response.headers["Retry-After"] == "1"
+
+def test_players_behind_one_proxy_share_no_bucket_when_ip_limit_is_off():
+    """Test that with the IP bucket off, many players from the ingress address are each limited alone"""
+    store = MemoryStore()
+    client = make_client(user=(1, 1), ip=None, sessions=store)
+    for i in range(50):
+        store.set(f"player{i}", "{}")
+        client.set_cookie("session", f"player{i}")
+        assert client.post("/slots", environ_base={"REMOTE_ADDR": "10.0.0.1"}).status_code == 200
+
+def test_user_limit_is_per_server_side_session():
+    """Test that one player's bucket does not throttle another, and unknown session IDs get none"""
+    store = MemoryStore()
+    store.set("alice", "{}")
+    store.set("bob", "{}")
+    client = make_client(user=(1, 1), sessions=store)
+    client.set_cookie("session", "alice")
+    assert client.post("/slots").status_code == 200
+    assert client.post("/slots").status_code == 429
+    client.set_cookie("session", "bob")
+    assert client.post("/slots").status_code == 200
+    client.set_cookie("session", "made-up")
+    assert client.post("/slots").status_code == 200
+    assert client.post("/slots").status_code == 200
+
+def test_cookie_sessions_get_only_the_ip_bucket():
+    """Test that without a session store, rotating the cookie neither throttles nor escapes anything"""
+    client = make_client(user=(1, 1), ip=(1, 2))
+    client.set_cookie("session", "alice")
+    assert client.post("/slots").status_code == 200
+    assert client.post("/slots").status_code == 200
+    client.set_cookie("session", "alice-resigned")
+    assert client.post("/slots").status_code == 429
+
+def test_user_limit_applies_to_api_users():
+    """Test that API clients are limited per token username, across fresh tokens and stray cookies"""
+    signer = TokenSigner("test")
+    alice = {"username": "alice", "password": "hash"}
+    client = make_client(user=(1, 1), tokens=signer)
+    bearer = lambda user: {"Authorization": f"Bearer {signer.issue(user)}"}
+    assert client.post("/slots", headers=bearer(alice)).status_code == 200
+    client.set_cookie("session", "random")
+    assert client.post("/slots", headers=bearer(alice)).status_code == 429
+    assert client.post("/slots", headers=bearer({"username": "bob", "password": "hash"})).status_code == 200
+    assert client.post("/slots", headers={"Authorization": "Bearer forged"}).status_code == 200
+
+def test_other_paths_are_never_limited():
+    """Test that /metrics and pages bypass admission control entirely"""
+    client = make_client(ip=(1, 1))
+    assert all(client.get("/metrics").status_code == 200 for _ in range(5))
+
+def test_sheds_when_too_many_bets_are_running():
+    """Test that bet requests beyond the in-flight cap get a 503 instead of queueing"""
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_app(environ, start_response):
+        entered.set()
+        release.wait(5)
+        return ok_app(environ, start_response)
+
+    client = make_client(app=slow_app, max_inflight=1)
+    first = threading.Thread(target=lambda: client.post("/slots"))
+    first.start()
+    entered.wait(5)
+    assert client.post("/slots").status_code == 503
+    release.set()
+    first.join()
+
+def test_queue_time_from_proxy_header():
+    """Test that X-Request-Start is read in seconds, milliseconds or microseconds"""
+    assert queue_ms({"HTTP_X_REQUEST_START": "t=1000.0"}, now=1000.25) == pytest.approx(250)
+    assert queue_ms({"HTTP_X_REQUEST_START": "t=1000000000000"}, now=1000000000.1) == pytest.approx(100, abs=0.01)
+    assert queue_ms({"HTTP_X_REQUEST_START": "1000000000000000"}, now=1000000000.5) == pytest.approx(500, abs=0.01)
+    assert queue_ms({}) is None
@@ -0,0 +1,82 @@
+import json
+from datetime import datetime
+from app.analytics import Summary, analyze, fold_batch, iter_ranges, write_report
+from app.retention import compact
+from app.snapshot import LazyMap, write_store
+
+NOW = datetime(2025, 3, 31, 12, 0, 0)
+
+def make_history():
+    return {
+        "alice": [
+            {"timestamp": "2025-01-05 10:00:00", "type": "slots", "details": "Slots bet: 10 coins", "amount": -10, "result": "lost"},
+            {"timestamp": "2025-01-05 11:00:00", "type": "slots", "details": "Slots bet: 20 coins", "amount": 20, "result": "won"},
+            {"timestamp": "2025-03-30 09:00:00", "type": "roulette", "details": "Roulette bet on red: 5 coins", "amount": -5, "result": "lost", "wager": 5},
+            {"timestamp": "2025-03-30 09:05:00", "type": "tip_sent", "details": "Tip sent to bob", "amount": -50, "result": "sent"},
+        ],
+        "bob": [
+            {"timestamp": "2025-03-30 09:05:00", "type": "tip_received", "details": "Tip received from alice", "amount": 50, "result": "received"},
+            {"timestamp": "2025-03-30 10:00:00", "type": "admin_add", "details": "Admin added 100 coins", "amount": 100, "result": None},
+            {"timestamp": "2025-03-30 11:00:00", "type": "blackjack", "details": "Blackjack bet: 40 coins", "amount": 60, "result": "win", "wager": 40},
+        ],
+    }
+
+def test_reports():
+    """Test that a summary computes RTP, GGR, lifetime value and tip flows"""
+    reports = fold_batch(make_history().items()).reports()
+    assert reports["rtp"] == {"game": ["blackjack", "roulette", "slots"], "bets": [1, 1, 2],
+                              "wagered": [40, 5, 30], "returned": [100, 0, 40], "rtp": [2.5, 0.0, 1.333333]}
+    assert reports["daily_ggr"] == {"day": ["2025-01-05", "2025-03-30"], "bets": [2, 2],
+                                    "wagered": [30, 45], "ggr": [-10, -55]}
+    ltv = reports["user_ltv"]
+    assert ltv["username"] == ["alice", "bob"]
+    assert ltv["ltv"] == [-5, -60] and ltv["tips_sent"] == [50, 0] and ltv["tips_received"] == [0, 50]
+    assert ltv["adjustments"] == [0, 100]
+    assert ltv["first_seen"] == ["2025-01-05 10:00:00", "2025-03-30 09:05:00"]
+    assert reports["tip_flows"] == {"sender": ["alice"], "recipient": ["bob"], "tips": [1], "coins": [50]}
+
+def test_merge_matches_a_single_pass():
+    """Test that merging the summaries of a split ledger gives the summary of the whole"""
+    history = make_history()
+    whole = fold_batch(history.items()).reports()
+    parts = [Summary() for _ in range(3)]
+    for username, records in history.items():
+        for i, record in enumerate(records):
+            parts[i % 3].add(username, record)
+    merged = parts[2].merge(parts[1]).merge(parts[0])
+    assert merged.reports() == whole and merged.records == 7
+
+def test_analyze_reads_hot_history_and_cold_segments(tmp_path):
+    """Test that analyze covers records in balance_history.json and in cold segments across workers"""
+    expected = fold_batch(make_history().items()).reports()
+    history = make_history()
+    cold_dir = str(tmp_path / "cold")
+    compact(history, hot_days=30, now=NOW, rollups_file=str(tmp_path / "rollups.json"), cold_dir=cold_dir)
+    history_file = tmp_path / "balance_history.json"
+    history_file.write_text(json.dumps(history))
+
+    summary = analyze(str(history_file), cold_dir, workers=2, batch_records=1)
+    assert summary.reports() == expected
+    assert analyze(str(history_file), None, workers=1).records == 5
+
+def test_workers_parse_byte_ranges_of_the_app_layout(tmp_path):
+    """Test that a history saved by the app is split at user lines and parsed by the workers"""
+    history = make_history()
+    history["carol\u2028"] = [{**history["bob"][2], "details": "Blackjack\u2028bet: 40 coins"}]
+    history_file = str(tmp_path / "balance_history.json")
+    write_store(LazyMap(items=history.items()), history_file, as_list=False)
+
+    ranges = list(iter_ranges(history_file, 10))
+    assert len(ranges) == 3  # one per user
+    with open(history_file, "rb") as f:
+        data = f.read()
+    assert all(data[start:start + 1] == b'"' for start, _ in ranges[1:])
+    summary = analyze(history_file, None, workers=2, range_bytes=10)
+    assert summary.reports() == fold_batch(history.items()).reports()
+
+def test_write_report_is_columnar(tmp_path):
+    """Test that a report file stores each column as one list"""
+    path = str(tmp_path / "rtp.json")
+    write_report(path, {"game": ["slots"], "rtp": [0.95]})
+    with open(path) as f:
+        assert json.load(f) == {"version": 1, "rows": 1, "columns": {"game": ["slots"], "rtp": [0.95]}}
@@ -0,0 +1,96 @@
+import app.app as casino
+from app.blackjack import BlackjackRound, create_deck
+
+def stacked(*cards):
+    """A deck that deals `cards` first: player, player, dealer, dealer, then draws."""
+    rest = [c for c in create_deck() if c not in cards]
+    return rest + list(reversed(cards))
+
+def login(client, username, password="pw"):
+    rv = client.post("/api/v1/login", json={"username": username, "password": password})
+    assert rv.status_code == 200
+    return {"Authorization": f"Bearer {rv.get_json()['token']}"}
+
+def test_login_registers_and_issues_token(client):
+    """Test that /api/v1/login registers new users, returns a token and rejects bad credentials"""
+    rv = client.post("/api/v1/login", json={"username": "api_user", "password": "pw"})
+    data = rv.get_json()
+    assert data["created"] is True and data["balance"] == 1000 and data["token"]
+    assert "Set-Cookie" not in rv.headers
+
+    assert client.post("/api/v1/login", json={"username": "api_user", "password": "nope"}).status_code == 401
+    assert client.post("/api/v1/login", json={"username": "api_user"}).status_code == 400
+    assert client.post("/api/v1/login", data="not json").status_code == 400
+
+def test_token_is_required_and_revoked_by_password_change(client):
+    """Test that API routes need a valid token, and a new password invalidates old tokens"""
+    headers = login(client, "api_user")
+    assert client.get("/api/v1/balance").status_code == 401
+    assert client.get("/api/v1/balance", headers={"Authorization": "Bearer forged"}).status_code == 401
+    assert client.get("/api/v1/balance", headers=headers).get_json() == {"username": "api_user", "balance": 1000}
+
+    casino.find_user("api_user")["password"] = "scrypt:32768:8:1$other$hash"
+    assert client.get("/api/v1/balance", headers=headers).status_code == 401
+
+def test_tip(client):
+    """Test that /api/v1/tip moves coins and reports errors as JSON"""
+    login(client, "bob")
+    headers = login(client, "alice")
+    rv = client.post("/api/v1/tip", json={"to": "bob", "amount": 150}, headers=headers)
+    assert rv.get_json() == {"to": "bob", "amount": 150, "balance": 850}
+    assert casino.find_user("bob")["balance"] == 1150
+    assert client.post("/api/v1/tip", json={"to": "alice", "amount": 1}, headers=headers).get_json() == \
+        {"error": "Cannot tip yourself"}
+    assert client.post("/api/v1/tip", json={"to": "bob", "amount": 5000}, headers=headers).status_code == 400
+
+def test_slots_and_roulette(client, monkeypatch):
+    """Test that the API spins the same engines as the pages and logs the bets"""
+    headers = login(client, "api_user")
+    monkeypatch.setattr(casino.random, "choice", lambda seq: seq[0])  # three cherries, red
+
+    rv = client.post("/api/v1/slots", json={"bet": 10}, headers=headers)
+    assert rv.get_json() == {"message": "Jackpot! Three 🍒! You won 30 coins.", "reels": ["🍒"] * 3,
+                             "balance": 1020, "win": True}
+    rv = client.post("/api/v1/roulette", json={"color": "red", "bet": 20}, headers=headers)
+    assert rv.get_json()["balance"] == 1040 and rv.get_json()["result_color"] == "red"
+    assert [r["type"] for r in casino.balance_history["api_user"]] == ["slots", "roulette"]
+
+    assert client.post("/api/v1/slots", json={"bet": "ten"}, headers=headers).status_code == 400
+    assert client.post("/api/v1/roulette", json={"color": "blue", "bet": 5}, headers=headers).get_json() == \
+        {"error": "Invalid color choice"}
+
+def test_blackjack_flow(client, monkeypatch):
+    """Test that a blackjack round is dealt, played and settled in one request per action"""
+    headers = login(client, "api_user")
+    monkeypatch.setattr(BlackjackRound, "deal",
+                        classmethod(lambda cls, balance, rng=None: cls(stacked("8♠", "8♥", "10♣", "7♦", "3♣", "2♦"), balance)))
+    assert client.post("/api/v1/blackjack/action", json={"action": "hit"}, headers=headers).status_code == 404
+
+    data = client.post("/api/v1/blackjack", json={"bet": 100}, headers=headers).get_json()
+    assert data["state"] == "playing" and data["dealer"] == ["10♣"] and data["balance"] == 900
+    assert data["actions"] == ["hit", "stand", "double", "split"]
+    assert client.post("/api/v1/blackjack", json={"bet": 100}, headers=headers).status_code == 409
+    assert client.get("/api/v1/blackjack", headers=headers).get_json() == data
+
+    data = client.post("/api/v1/blackjack/action", json={"action": "split"}, headers=headers).get_json()
+    assert [h["cards"] for h in data["hands"]] == [["8♠", "3♣"], ["8♥", "2♦"]] and data["balance"] == 800
+    assert "split" not in data["actions"]
+    assert client.post("/api/v1/blackjack/action", json={"action": "split"}, headers=headers).status_code == 409
+
+    client.post("/api/v1/blackjack/action", json={"action": "stand"}, headers=headers)
+    data = client.post("/api/v1/blackjack/action", json={"action": "stand"}, headers=headers).get_json()
+    assert data["state"] == "finished" and data["dealer"][:2] == ["10♣", "7♦"]
+    assert data["payout"] == sum(2 * 100 for o in data["outcomes"] if o in ("win", "dealer_bust"))
+    assert casino.find_user("api_user")["balance"] == 800 + data["payout"]
+    assert casino.balance_history["api_user"][-1]["type"] == "blackjack"
+    assert client.get("/api/v1/blackjack", headers=headers).status_code == 404
+
+def test_blackjack_round_is_saved_after_every_action(client, monkeypatch):
+    """Test that a hit, which moves no coins, still saves the round so a restart cannot replay the deck"""
+    headers = login(client, "api_user")
+    monkeypatch.setattr(BlackjackRound, "deal",
+                        classmethod(lambda cls, balance, rng=None: cls(stacked("8♠", "8♥", "10♣", "7♦", "3♣"), balance)))
+    client.post("/api/v1/blackjack", json={"bet": 100}, headers=headers)
+    data = client.post("/api/v1/blackjack/action", json={"action": "hit"}, headers=headers).get_json()
+    assert data["state"] == "playing" and data["hands"][0]["cards"] == ["8♠", "8♥", "3♣"]
+    assert casino.load_users().get("api_user")["api_blackjack"] == casino.find_user("api_user")["api_blackjack"]
@@ -2,6 +2,7 @@ import pytest
 import json
 import tempfile
 import os
+import app.app as casino
 from app.app import app
 
 @pytest.fixture
@@ -52,4 +53,15 @@ def test_menu_requires_login(client):
 def test_admin_requires_auth(client):
     """Test that admin panel requires authentication"""
     rv = client.get('/admin')
-    assert rv.status_code == 302  # Redirect to admin auth 
\ No newline at end of file
+    assert rv.status_code == 302  # Redirect to admin auth 
+def test_admin_lists_only_the_richest_users(client, make_user, monkeypatch):
+    """Test that the admin table ranks only ADMIN_TABLE_USERS users"""
+    monkeypatch.setattr(casino, "ADMIN_TABLE_USERS", 2)
+    for i, balance in enumerate([5, 50, 500]):
+        make_user(f"ranked{i}", balance)
+    with client.session_transaction() as sess:
+        sess["admin_authenticated"] = True
+    rv = client.get('/admin')
+    assert rv.data.count(b'class="user-row"') == 2
+    assert b'data-username="ranked2"' in rv.data and b'data-username="ranked0"' not in rv.data
+    assert b"Top 2 of 3 users by balance" in rv.data
@@ -0,0 +1,114 @@
+import random
+import pytest
+import app.app as casino
+from app.blackjack import (BlackjackRound, Hand, create_deck, hand_value,
+                           BETTING, PLAYING, DEALER_TURN, FINISHED)
+
+def stacked(*cards):
+    """A deck that deals `cards` first: player, player, dealer, dealer, then draws."""
+    rest = [c for c in create_deck() if c not in cards]
+    return rest + list(reversed(cards))
+
+def test_incremental_value_matches_hand_value():
+    """Test that a Hand's running value equals hand_value for the same cards"""
+    rng = random.Random(7)
+    for _ in range(500):
+        cards = rng.sample(create_deck(), rng.randint(1, 6))
+        assert Hand(cards).value == hand_value(cards)
+
+def test_session_round_trip():
+    """Test that a round survives to_session/from_session unchanged"""
+    rnd = BlackjackRound(stacked("8♠", "8♥", "10♣", "7♦"), 100)
+    rnd.place_bet(10, 90)
+    assert rnd.act("split", 90) == 10
+    copy = BlackjackRound.from_session(rnd.to_session())
+    assert copy.to_session() == rnd.to_session()
+    assert [h.cards for h in copy.hands] == [h.cards for h in rnd.hands]
+    assert copy.hands[1].value == rnd.hands[1].value
+
+def test_legacy_session_dict_is_dropped():
+    """Test that a round stored by the old dict-based route is not loaded"""
+    legacy = {"deck": ["2♠", "3♠"], "player_hand": ["K♠", "9♥"], "dealer_hand": ["10♦", "7♣"],
+              "bet": 20, "balance": 80, "state": "playing"}
+    assert BlackjackRound.from_session(legacy) is None
+
+def test_bust_skips_dealer():
+    """Test that a bust ends the round without the dealer drawing"""
+    rnd = BlackjackRound(stacked("10♠", "6♥", "10♣", "2♦", "K♦"), 100)
+    rnd.place_bet(10, 90)
+    rnd.act("hit", 90)
+    assert rnd.state == FINISHED and rnd.dealer.cards == ["10♣", "2♦"]
+    assert rnd.settle() == (0, [(0, "bust")])
+
+def test_split_then_double_takes_each_stake():
+    """Test that split and double each take one more stake and move through the hands"""
+    rnd = BlackjackRound(stacked("8♠", "8♥", "10♣", "7♦", "3♣", "2♦", "9♠", "Q♦"), 100)
+    rnd.place_bet(10, 90)
+    assert rnd.act("split", 90) == 10
+    assert rnd.hands[0].cards == ["8♠", "3♣"] and rnd.hands[1].cards == ["8♥", "2♦"]
+    assert rnd.act("double", 80) == 10
+    assert rnd.current == 1 and rnd.hands[0].value == 20 and rnd.hands[0].bet == 20
+    assert rnd.act("double", 70) == 10
+    assert rnd.state == DEALER_TURN and rnd.hands[1].bet == 20
+    assert rnd.step() and rnd.state == FINISHED
+    winnings, outcomes = rnd.settle()
+    assert [o for _, o in outcomes] == ["win", "win"] and winnings == 80
+    assert rnd.describe(outcomes) == "Hand 1: Won 40 coins. | Hand 2: Won 40 coins."
+
+def test_actions_ignored_outside_play():
+    """Test that a player action before the bet changes nothing"""
+    rnd = BlackjackRound(stacked("10♠", "6♥", "10♣", "2♦"), 100)
+    assert rnd.act("hit", 100) == 0
+    assert rnd.state == BETTING and len(rnd.hand.cards) == 2
+
+@pytest.fixture
+def player(client, make_user):
+    make_user("dealer_test")
+    with client.session_transaction() as sess:
+        sess["username"] = "dealer_test"
+    return client
+
+def test_route_plays_a_natural(player, monkeypatch):
+    """Test that the route settles a natural blackjack at 3:2 and clears the round"""
+    monkeypatch.setattr(BlackjackRound, "deal",
+                        classmethod(lambda cls, balance, rng=None: cls(stacked("A♠", "K♥", "10♣", "7♦"), balance)))
+    player.get('/blackjack_bet')
+    assert player.post('/blackjack_bet', data={'bet': '10'}).status_code == 302
+    assert casino.find_user("dealer_test")["balance"] == 90
+    assert player.get('/blackjack_bet').status_code == 302  # natural settles without play
+    rv = player.get('/blackjack_bet')
+    assert b"Blackjack! You won 25 coins." in rv.data
+    assert casino.find_user("dealer_test")["balance"] == 115
+    with player.session_transaction() as sess:
+        assert "blackjack" not in sess
+
+def test_replayed_session_is_not_paid_twice(player, monkeypatch):
+    """Test that replaying the cookie of a finished round does not settle it again"""
+    monkeypatch.setattr(BlackjackRound, "deal",
+                        classmethod(lambda cls, balance, rng=None: cls(stacked("A♠", "K♥", "10♣", "7♦"), balance)))
+    player.get('/blackjack_bet')
+    player.post('/blackjack_bet', data={'bet': '10'})
+    player.get('/blackjack_bet')
+    with player.session_transaction() as sess:
+        replay = dict(sess)
+    player.get('/blackjack_bet')
+    assert casino.find_user("dealer_test")["balance"] == 115
+
+    with player.session_transaction() as sess:
+        sess.update(replay)
+    assert player.get('/blackjack_bet').status_code == 302
+    assert casino.find_user("dealer_test")["balance"] == 115
+    with player.session_transaction() as sess:
+        assert "blackjack" not in sess
+
+def test_legacy_cookie_is_not_paid(player):
+    """Test that a finished round from the old dict-based route is refused, replayed or not"""
+    legacy = {"deck": ["2♠", "3♠"], "player_hand": ["K♠", "Q♥"], "dealer_hand": ["10♦", "7♣"],
+              "bet": 100, "balance": 0, "state": "finished"}
+    for _ in range(2):
+        with player.session_transaction() as sess:
+            sess["blackjack"] = legacy
+        assert player.get('/blackjack_bet').status_code == 302
+        assert casino.find_user("dealer_test")["balance"] == 100
+        with player.session_transaction() as sess:
+            assert "blackjack" not in sess
@@ -0,0 +1,69 @@
+import pytest
+import app.app as casino
+from app.app import app
+from app.bulk import BulkFileError, parse_operations, plan_operations
+
+CSV = "username,action,amount\nalice,add,50\nbob,subtract,30\nalice,set,500\n"
+
+@pytest.fixture
+def client(client, make_user):
+    make_user("alice")
+    make_user("bob")
+    with client.session_transaction() as sess:
+        sess["admin_authenticated"] = True
+    return client
+
+def test_parse_reports_bad_rows():
+    """Test that each invalid row gets its own error and valid rows are kept"""
+    text = ('{"username": "a", "action": "add", "amount": 5}\n'
+            'not json\n'
+            '{"username": "a", "action": "give", "amount": 5}\n'
+            '\n'
+            '{"username": "a", "action": "add", "amount": -1}\n')
+    results = parse_operations(text, "ndjson")
+    assert [r["row"] for r in results] == [1, 2, 3, 5]
+    assert [r["status"] for r in results] == ["pending", "error", "error", "error"]
+    with pytest.raises(BulkFileError):
+        parse_operations("user,amount\na,1\n", "csv")
+    with pytest.raises(BulkFileError):
+        parse_operations(CSV, "csv", max_rows=2)
+
+def test_plan_combines_rows_per_user():
+    """Test that rows for one user run against a running balance"""
+    results = parse_operations("username,action,amount\na,add,10\na,subtract,200\na,subtract,110\nb,add,1\n", "csv")
+    balances = plan_operations(results, {"a": 100}.get)
+    assert balances == {"a": 0}
+    assert [r["status"] for r in results] == ["ok", "error", "ok", "error"]
+    assert results[2]["change"] == -110
+
+def test_plan_atomic_applies_nothing_on_error():
+    """Test that one bad row makes an atomic plan skip every row"""
+    results = parse_operations("username,action,amount\na,add,10\nb,add,1\n", "csv")
+    assert plan_operations(results, {"a": 100}.get, atomic=True) == {}
+    assert [r["status"] for r in results] == ["skipped", "error"]
+
+def test_bulk_endpoint_applies_and_logs_once(client, monkeypatch):
+    """Test that a bulk upload updates balances with one ledger and one users write"""
+    writes = []
+    monkeypatch.setattr(casino, "save_balance_history", lambda: writes.append("history"))
+    monkeypatch.setattr(casino, "save_users", lambda: writes.append("users"))
+    rv = client.post('/admin/bulk', data=CSV, content_type="text/csv")
+    report = rv.get_json()
+    assert rv.status_code == 200 and report["applied"] == 3 and report["failed"] == 0
+    assert casino.users.get("alice")["balance"] == 500 and casino.users.get("bob")["balance"] == 70
+    assert writes == ["history", "users"]
+    assert [r["amount"] for r in casino.balance_history["alice"]] == [50, 350]
+
+def test_bulk_endpoint_atomic_rejects(client):
+    """Test that an atomic upload with an unknown user changes nothing"""
+    body = CSV + "carol,add,5\n"
+    rv = client.post('/admin/bulk?atomic=1', data=body, content_type="text/csv")
+    assert rv.status_code == 422
+    assert rv.get_json()["skipped"] == 3
+    assert casino.users.get("alice")["balance"] == 100
+    assert "alice" not in casino.balance_history
+
+def test_bulk_endpoint_requires_admin(client):
+    """Test that the bulk endpoint refuses non-admin sessions"""
+    with app.test_client() as anonymous:
+        assert anonymous.post('/admin/bulk', data=CSV).status_code == 401
@@ -0,0 +1,67 @@
+import gzip
+import pytest
+from prometheus_client import REGISTRY
+import app.app as casino
+from app.app import app
+from app.caching import page_cache
+
+@pytest.fixture
+def client(client, make_user):
+    page_cache.clear()
+    make_user("cached", 500)
+    with client.session_transaction() as sess:
+        sess["username"] = "cached"
+    return client
+
+def cache_count(result):
+    return REGISTRY.get_sample_value("casino_page_cache_total", {"result": result}) or 0
+
+def test_page_cache_is_keyed_on_balance(client):
+    """Test that a cached menu is reused until the balance changes"""
+    hits, misses = cache_count("hit"), cache_count("miss")
+    first = client.get('/menu').data
+    assert client.get('/menu').data == first
+    assert (cache_count("hit") - hits, cache_count("miss") - misses) == (1, 1)
+
+    casino.find_user("cached")["balance"] = 750
+    assert b"750" in client.get('/menu').data
+    assert cache_count("miss") - misses == 2
+
+def test_pending_flashes_bypass_the_cache(client):
+    """Test that a page with a flash message is rendered fresh and shows the message"""
+    client.get('/menu')
+    with client.session_transaction() as sess:
+        sess["_flashes"] = [("message", "Tipped 5 coins to friend")]
+    assert b"Tipped 5 coins to friend" in client.get('/menu').data
+
+def test_conditional_get_returns_304(client):
+    """Test that repeating a GET with the ETag yields 304 without a body"""
+    response = client.get('/slots')
+    etag = response.headers["ETag"]
+    assert "no-cache" in response.headers["Cache-Control"]
+    again = client.get('/slots', headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+
+def test_large_pages_are_gzipped(client):
+    """Test that pages above the size threshold are compressed for clients that accept gzip"""
+    plain = client.get('/slots').data
+    response = client.get('/slots', headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == plain
+
+def test_small_responses_are_not_compressed(client):
+    """Test that tiny responses are sent as is"""
+    response = client.get('/history?format=json', headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+def test_fingerprinted_static_files_are_immutable(client, tmp_path, monkeypatch):
+    """Test that static_url adds a content hash and such URLs are cached for a year"""
+    (tmp_path / "app.css").write_text("body { color: gold; }")
+    monkeypatch.setattr(app, "static_folder", str(tmp_path))
+    with app.test_request_context():
+        url = casino.static_url("app.css")
+    assert "?v=" in url
+    response = client.get(url)
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "max-age=31536000" in response.headers["Cache-Control"]
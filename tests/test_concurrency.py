@@ -0,0 +1,49 @@
+import threading
+import pytest
+from app.app import app
+from app.concurrency import StripedLocks
+
+@pytest.fixture
+def players(make_user):
+    return make_user("tipper", 100), make_user("receiver", 0)
+
+def test_stripes_are_acquired_in_order():
+    """Test that holding several keys takes each stripe once, in ascending order"""
+    locks = StripedLocks(8)
+    with locks.hold("bob", "alice", "bob"):
+        with locks.hold("alice", "bob"):  # reentrant
+            pass
+
+def test_concurrent_tips_never_overdraw(players):
+    """Test that racing tips cannot spend the same coins twice"""
+    tipper, receiver = players
+
+    def send_tip():
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess["username"] = "tipper"
+            client.post('/tip', data={'username': 'receiver', 'amount': '30'})
+
+    threads = [threading.Thread(target=send_tip) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert tipper["balance"] == 10
+    assert receiver["balance"] == 90
+
+def test_blackjack_stake_is_taken_at_bet_time(players):
+    """Test that the blackjack stake leaves the balance before the round is played"""
+    tipper, _ = players
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess["username"] = "tipper"
+        client.get('/blackjack_bet')
+        client.post('/blackjack_bet', data={'bet': '40'})
+        assert tipper["balance"] == 60
+
+        client.post('/blackjack_bet', data={'action': 'stand'})
+        client.get('/blackjack_bet')  # dealer plays
+        client.get('/blackjack_bet')  # settle
+        assert tipper["balance"] in (60, 100, 140, 160)
@@ -0,0 +1,84 @@
+import json
+import pytest
+from flask import session
+import app.app as casino
+from app.app import app
+from app.events import EventHub, RESYNC, HEARTBEAT, REPLACED
+
+@pytest.fixture
+def client(client, make_user, monkeypatch):
+    monkeypatch.setattr(casino, "event_hub", EventHub(max_streams=2))
+    make_user("sender")
+    make_user("listener")
+    with client.session_transaction() as sess:
+        sess["username"] = "sender"
+    return client
+
+def events(subscriber):
+    payloads = []
+    while not subscriber.queue.empty():
+        payloads.append(subscriber.queue.get_nowait())
+    return payloads
+
+def test_tip_pushes_balance_to_receiver(client):
+    """Test that a tip reaches the receiver's open stream with the new balance"""
+    subscriber = casino.event_hub.subscribe("listener")
+    client.post('/tip', data={'username': 'listener', 'amount': '25'})
+    (payload,) = events(subscriber)
+    event, data = payload.decode().strip().split("\n")
+    assert event == "event: balance"
+    assert json.loads(data.removeprefix("data: "))["balance"] == 125
+
+def test_slow_subscriber_gets_resync():
+    """Test that an overflowing queue is replaced by a single resync event"""
+    hub = EventHub(queue_size=2)
+    subscriber = hub.subscribe("p")
+    for balance in range(5):
+        hub.publish("p", "balance", {"balance": balance})
+    assert events(subscriber) == [RESYNC]
+
+def test_stream_sends_heartbeats_and_unsubscribes():
+    """Test that an idle stream emits heartbeats and releases its slot when closed"""
+    hub = EventHub(max_streams=1, heartbeat=0.01, max_age=5)
+    subscriber = hub.subscribe("p")
+    assert hub.subscribe("q") is None
+    body = hub.stream(subscriber)
+    assert next(body).startswith(b"retry:")
+    assert next(body) == HEARTBEAT
+    body.close()
+    assert hub.subscribe("q") is not None
+
+def test_events_requires_login_and_caps_streams(client):
+    """Test that anonymous requests are refused and extra streams get 503"""
+    with app.test_client() as anonymous:
+        assert anonymous.get('/events').status_code == 401
+    casino.event_hub.subscribe("other")
+    casino.event_hub.subscribe("another")
+    response = client.get('/events')
+    assert response.status_code == 503 and response.headers["Retry-After"] == "30"
+
+def test_new_stream_replaces_the_users_old_one():
+    """Test that a user holds one stream: a new subscribe takes the old slot and ends the old stream"""
+    hub = EventHub(max_streams=1, heartbeat=0.01, max_age=5)
+    old = hub.subscribe("p")
+    old_body = hub.stream(old)
+    next(old_body)
+    new = hub.subscribe("p")
+    assert new is not None and hub.subscribe("q") is None
+    assert list(old_body) == [REPLACED]
+
+    hub.publish("p", "balance", {"balance": 1})
+    assert len(events(new)) == 1
+    hub.unsubscribe(old)
+    assert hub.subscribe("q") is None
+
+def test_closing_an_unstarted_response_releases_the_slot(client):
+    """Test that a stream response closed before its body is read still gives its slot back"""
+    casino.event_hub.subscribe("other")
+    with app.test_request_context('/events'):
+        session["username"] = "sender"
+        response = casino.events()
+    assert response.status_code == 200
+    assert casino.event_hub.subscribe("another") is None
+    response.close()
+    assert casino.event_hub.subscribe("another") is not None
@@ -0,0 +1,65 @@
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+import app.app as casino
+import app.hashing as hashing
+
+def test_needs_rehash_compares_parameters(monkeypatch):
+    """Test that hashes made with other parameters are flagged for upgrade"""
+    monkeypatch.setattr(hashing, "PASSWORD_HASH_METHOD", "scrypt")
+    assert not hashing.needs_rehash("scrypt:32768:8:1$salt$hash")
+    assert hashing.needs_rehash("pbkdf2:sha256:600000$salt$hash")
+    assert hashing.needs_rehash("scrypt:16384:8:1$salt$hash")
+
+def test_pool_hash_verifies(monkeypatch):
+    """Test that hashes computed on the process pool verify"""
+    pwhash = hashing.hash_password("secret")
+    assert hashing.verify_password(pwhash, "secret")
+    assert not hashing.verify_password(pwhash, "wrong")
+
+def test_login_upgrades_outdated_hash(client):
+    """Test that a successful login rehashes with the configured method"""
+    casino.users.append({"username": "legacyuser", "password": generate_password_hash("pw", "pbkdf2:sha256:1000"),
+                         "balance": 1000, "is_admin": False})
+    rv = client.post('/', data={'username': 'legacyuser', 'password': 'pw'})
+    assert rv.status_code == 302
+
+    stored = casino.find_user("legacyuser")["password"]
+    assert stored.startswith("scrypt:")
+    assert check_password_hash(stored, "pw")
+
+def test_login_sheds_load_when_queue_full(client, monkeypatch):
+    """Test that logins fail fast with 503 when the hashing queue is full"""
+    monkeypatch.setattr(hashing, "_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(hashing, "HASH_QUEUE_TIMEOUT", 0.01)
+    hashing._slots.acquire()
+
+    rv = client.post('/', data={'username': 'busyuser', 'password': 'pw'})
+    assert rv.status_code == 503
+    assert casino.find_user("busyuser") is None
+
+def test_hashing_runs_outside_the_user_lock(client, monkeypatch):
+    """Test that sign-up and rehash-on-login hash without holding the user's stripe"""
+    free = []
+
+    def stripe_is_free():
+        lock = casino.user_locks._locks[casino.user_locks.stripe("slowhash")]
+        result = []
+
+        def try_lock():
+            result.append(lock.acquire(blocking=False))
+            if result[0]:
+                lock.release()
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def hash_password(password):
+        free.append(stripe_is_free())
+        return generate_password_hash(password, "pbkdf2:sha256:1000")
+
+    monkeypatch.setattr(casino, "hash_password", hash_password)
+    client.post('/', data={'username': 'slowhash', 'password': 'pw'})
+    client.post('/', data={'username': 'slowhash', 'password': 'pw'})
+    assert free == [True, True]
+    assert check_password_hash(casino.find_user("slowhash")["password"], "pw")
@@ -0,0 +1,99 @@
+import json
+import threading
+from datetime import datetime
+import app.app as casino
+from app.history import page, decode_cursor, encode_cursor, iter_ledger
+from app.retention import archive, compact, iter_cold
+
+def stamped(*seconds):
+    return [{"timestamp": f"2025-01-01 00:00:{s:02d}", "amount": i} for i, s in enumerate(seconds)]
+
+def test_cursor_round_trip():
+    """Test that cursors decode to the record's timestamp and its index among equal timestamps"""
+    records = stamped(0, 1, 1, 1, 2)
+    assert decode_cursor(encode_cursor(records, 3)) == ("2025-01-01 00:00:01", 2)
+    assert decode_cursor("not-a-cursor!") is None
+
+def test_pages_are_newest_first_and_stable():
+    """Test that paging walks backwards without skipping or repeating records"""
+    records = [{"amount": i} for i in range(7)]
+    first, cursor = page(records, limit=3)
+    assert [r["amount"] for r in first] == [6, 5, 4]
+
+    records.append({"amount": 7})  # a new bet arrives between page loads
+    second, cursor = page(records, decode_cursor(cursor), limit=3)
+    assert [r["amount"] for r in second] == [3, 2, 1]
+
+    last, cursor = page(records, decode_cursor(cursor), limit=3)
+    assert [r["amount"] for r in last] == [0]
+    assert cursor is None
+
+def test_cursors_survive_compaction(tmp_path):
+    """Test that compaction trimming the front of a history neither shifts page cursors nor breaks exports"""
+    history = {"a": stamped(0, 1, 1, 2, 2, 3, 4)}
+    first, cursor = page(history["a"], limit=3)
+    assert [r["amount"] for r in first] == [6, 5, 4]
+    export = iter_ledger(history)
+    assert next(export)[1]["amount"] == 0
+
+    compact(history, hot_days=0, now=datetime(2025, 1, 1, 0, 0, 2),
+            rollups_file=str(tmp_path / "r.json"), cold_dir=str(tmp_path / "c"))
+    assert [r["amount"] for r in history["a"]] == [3, 4, 5, 6]
+    second, cursor = page(history["a"], decode_cursor(cursor), limit=3)
+    assert [r["amount"] for r in second] == [3] and cursor is None
+    assert [r["amount"] for _, r in export] == [1, 2, 3, 4, 5, 6]
+
+def test_compaction_archives_without_the_store_lock(stores, monkeypatch, tmp_path):
+    """Test that compaction writes cold segments without store_lock, keeping bets made meanwhile"""
+    casino.balance_history["a"] = stamped(0, 1, 2)
+    cold_dir = str(tmp_path / "c")
+    free = []
+
+    def try_lock():
+        free.append(casino.store_lock.acquire(blocking=False))
+        if free[0]:
+            casino.store_lock.release()
+
+    def archive_during_a_bet(expired):
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        casino.append_ledger([("a", {"timestamp": "2099-01-01 00:00:00", "amount": 3})])
+        archive(expired, str(tmp_path / "r.json"), cold_dir)
+
+    monkeypatch.setattr(casino, "archive", archive_during_a_bet)
+    monkeypatch.setattr(casino, "compaction_thread", object())
+    casino.compact_history()
+    assert free == [True]
+    assert [r["amount"] for r in casino.balance_history["a"]] == [3]
+    assert [r["amount"] for _, r in iter_cold(cold_dir=cold_dir)] == [0, 1, 2]
+
+def test_iter_ledger_single_user():
+    """Test that the ledger iterator can be restricted to one user"""
+    history = {"a": [{"amount": 1}], "b": [{"amount": 2}, {"amount": 3}]}
+    assert [r["amount"] for _, r in iter_ledger(history, "b")] == [2, 3]
+    assert len(list(iter_ledger(history))) == 3
+
+def test_history_json_pagination(client):
+    """Test the paginated history endpoint"""
+    client.post('/', data={'username': 'historyuser', 'password': 'pw'})
+    for i in range(5):
+        casino.log_transaction('historyuser', 'slots', i, f"Slots bet: {i} coins", 'won')
+
+    rv = client.get('/history?format=json&limit=2')
+    data = rv.get_json()
+    assert [r["amount"] for r in data["items"]] == [4, 3]
+
+    rv = client.get(f'/history?format=json&limit=2&cursor={data["next_cursor"]}')
+    assert [r["amount"] for r in rv.get_json()["items"]] == [2, 1]
+
+def test_admin_export_streams_ndjson(client):
+    """Test that the admin ledger export streams one JSON object per line"""
+    casino.log_transaction('exportuser', 'roulette', -10, "Roulette bet on red: 10 coins", 'lost')
+    with client.session_transaction() as sess:
+        sess['admin_authenticated'] = True
+
+    rv = client.get('/admin/history/export?format=ndjson&username=exportuser')
+    assert rv.status_code == 200
+    lines = rv.get_data(as_text=True).splitlines()
+    assert json.loads(lines[-1])["type"] == "roulette"
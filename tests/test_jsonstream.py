@@ -0,0 +1,44 @@
+import io
+import json
+import pytest
+import app.jsonstream as jsonstream
+from app.jsonstream import JsonStream
+
+def stream(value, chunk_size=7):
+    return JsonStream(io.BytesIO(json.dumps(value, ensure_ascii=False).encode()), chunk_size)
+
+def test_streams_list_across_small_chunks():
+    """Test that array items split across chunk boundaries decode intact"""
+    users = [{"username": f"üser{i}", "balance": 123456789 + i} for i in range(50)]
+    s = stream(users)
+    assert [v for _, v in s] == users
+    assert s.is_list
+
+def test_streams_object_entries():
+    """Test that top-level object entries come back as (key, value) pairs"""
+    history = {"alice": [{"amount": 5}], "bob": [], "carol": [{"amount": -1}, {"amount": 12}]}
+    s = stream(history, chunk_size=3)
+    assert dict(s) == history
+    assert not s.is_list
+
+def test_top_level_numbers_are_not_truncated():
+    """Test that a number ending on a chunk boundary is not cut short"""
+    assert [v for _, v in stream([1234567, 89], chunk_size=4)] == [1234567, 89]
+
+def test_large_entries_are_decoded_once(monkeypatch):
+    """Test that an entry spanning many chunks is parsed once, not again after every chunk"""
+    history = {"alice": [{"details": 'a "quoted" \\ [bracket] {brace}', "amount": i} for i in range(2000)], "bob": []}
+    calls = []
+    decode = jsonstream._decoder.raw_decode
+    monkeypatch.setattr(jsonstream._decoder, "raw_decode", lambda *args: calls.append(1) or decode(*args))
+    assert dict(stream(history, chunk_size=64)) == history
+    assert len(calls) == 4  # two keys, two values
+
+def test_empty_and_invalid_documents():
+    """Test empty containers and malformed input"""
+    assert list(stream([])) == []
+    assert list(stream({})) == []
+    with pytest.raises(ValueError):
+        list(JsonStream(io.BytesIO(b'[{"a": 1} {"b": 2}]')))
+    with pytest.raises(ValueError):
+        list(JsonStream(io.BytesIO(b'{"a": [1, 2')))
@@ -0,0 +1,100 @@
+import atexit
+import os
+import signal
+import threading
+import time
+import app.app as casino
+from app.blackjack import BlackjackRound, create_deck
+from app.lifecycle import Lifecycle
+
+def test_probes_when_ready(client):
+    """Test that /healthz and /readyz answer 200 without a session cookie"""
+    rv = client.get('/healthz')
+    assert rv.status_code == 200 and rv.data == b"ok\n"
+    assert "Set-Cookie" not in rv.headers
+    rv = client.get('/readyz')
+    assert rv.status_code == 200
+    assert b"storage: ok" in rv.data
+
+def test_readyz_fails_on_check(client, monkeypatch):
+    """Test that a failing readiness check turns /readyz into 503 but leaves /healthz alone"""
+    monkeypatch.setitem(casino.lifecycle.checks, "storage", lambda: False)
+    assert client.get('/readyz').status_code == 503
+    assert client.get('/healthz').status_code == 200
+
+def test_draining_refuses_bets_only(client, monkeypatch):
+    """Test that a draining worker refuses bets but still serves pages"""
+    monkeypatch.setattr(casino.lifecycle, "state", "draining")
+    rv = client.post('/slots', data={'bet': '10'})
+    assert rv.status_code == 503 and rv.headers["Retry-After"] == "1"
+    assert client.get('/readyz').status_code == 503
+    assert client.get('/').status_code == 200
+
+def test_draining_finishes_rounds_in_play(client, make_user, monkeypatch):
+    """Test that a draining worker lets a blackjack round already in play finish but refuses a new one"""
+    cards = ["10♠", "7♥", "10♣", "8♦"]  # player 17, dealer 18
+    deck = [c for c in create_deck() if c not in cards] + cards[::-1]
+    monkeypatch.setattr(BlackjackRound, "deal", classmethod(lambda cls, balance, rng=None: cls(list(deck), balance)))
+    player = make_user("drain_test")
+    with client.session_transaction() as sess:
+        sess["username"] = "drain_test"
+    client.get('/blackjack_bet')
+    client.post('/blackjack_bet', data={'bet': '10'})
+
+    monkeypatch.setattr(casino.lifecycle, "state", "draining")
+    assert client.post('/blackjack_bet', data={'action': 'stand'}).status_code == 302
+    client.get('/blackjack_bet')
+    rv = client.get('/blackjack_bet')
+    assert b"You lose." in rv.data and player["balance"] == 90
+    client.get('/blackjack_bet')
+    rv = client.post('/blackjack_bet', data={'bet': '10'})
+    assert rv.status_code == 503 and rv.headers["Retry-After"] == "1"
+    assert player["balance"] == 90
+
+def test_shutdown_waits_for_bets_then_flushes_once():
+    """Test that shutdown flushes only after running bets finish, and only once"""
+    lifecycle = Lifecycle(drain_timeout=5)
+    flushed = []
+    lifecycle.on_shutdown(lambda: flushed.append(time.monotonic()))
+    lifecycle.enter()
+    finished = []
+
+    def finish_bet():
+        time.sleep(0.05)
+        finished.append(time.monotonic())
+        lifecycle.leave()
+
+    threading.Thread(target=finish_bet).start()
+    lifecycle.shutdown()
+    lifecycle.shutdown()
+    assert len(flushed) == 1 and flushed[0] >= finished[0]
+    assert lifecycle.state == "stopped"
+
+def test_sigterm_drains_then_calls_previous_handler():
+    """Test that SIGTERM marks the worker draining and hands over to the server's handler after the delay"""
+    called = threading.Event()
+    original = signal.signal(signal.SIGTERM, lambda signum, frame: called.set())
+    lifecycle = Lifecycle(drain_delay=0.01)
+    try:
+        lifecycle.mark_ready()
+        lifecycle.install()
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert called.wait(2)
+        assert lifecycle.draining
+    finally:
+        signal.signal(signal.SIGTERM, original)
+        atexit.unregister(lifecycle.shutdown)
+
+def test_flush_writes_only_unsaved_changes(make_user, monkeypatch):
+    """Test that the shutdown flush skips the write unless a last-active time is unsaved"""
+    user = make_user("idle")
+    casino.save_users()
+    saves = []
+    monkeypatch.setattr(casino, "write_store", lambda *args, **kwargs: saves.append(args[1]))
+    casino.flush_stores()
+    assert saves == []
+
+    casino.touch(user)
+    casino.flush_stores()
+    casino.flush_stores()
+    assert saves == [casino.USERS_FILE]
@@ -0,0 +1,68 @@
+import io
+import json
+import logging
+import threading
+import pytest
+from app.logs import configure_logging, flush_logging, DebugSampler, parse_levels
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    configure_logging(level="INFO", levels="app.blackjack=DEBUG", fmt="json", stream=stream)
+    yield stream
+    logging.getLogger("app.blackjack").setLevel(logging.NOTSET)
+    configure_logging()
+
+def read_lines(stream):
+    flush_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_json_records_with_per_module_levels(output):
+    """Test that records are written as JSON and module overrides beat the root level"""
+    logging.getLogger("app.blackjack").debug("hand %s", ["A♠", "K♥"])
+    logging.getLogger("app.admin").debug("hidden")
+    logging.getLogger("app.admin").info("set %s", "alice", extra={"fields": {"amount": 5}})
+
+    lines = read_lines(output)
+    assert [line["message"] for line in lines] == ["hand ['A♠', 'K♥']", "set alice"]
+    assert lines[1]["logger"] == "app.admin"
+    assert lines[1]["amount"] == 5
+
+def test_listener_formats_messages_and_tracebacks(output):
+    """Test that messages are rendered on the listener thread and exceptions keep their traceback"""
+    class ThreadName:
+        def __str__(self):
+            return threading.current_thread().name
+    log = logging.getLogger("app.admin")
+    log.info("rendered on %s", ThreadName())
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.exception("failed")
+
+    lines = read_lines(output)
+    assert lines[0]["message"] != f"rendered on {threading.current_thread().name}"
+    assert lines[1]["message"] == "failed" and "ZeroDivisionError" in lines[1]["exc"]
+
+def test_disabled_debug_never_formats_arguments(output):
+    """Test that arguments to a disabled level are never rendered"""
+    class Exploding:
+        def __str__(self):
+            raise AssertionError("formatted")
+    logging.getLogger("app.admin").debug("value %s", Exploding())
+    assert read_lines(output) == []
+
+def test_debug_sampler_limits_rate():
+    """Test that debug bursts are cut to the bucket size and the next record counts the drops"""
+    sampler = DebugSampler(rate=5)
+    record = lambda: logging.LogRecord("app.blackjack", logging.DEBUG, __file__, 1, "x", None, None)
+    passed = [sampler.filter(record()) for _ in range(20)]
+    assert sum(passed) == 5
+    sampler._buckets["app.blackjack"][0] = 1
+    kept = record()
+    assert sampler.filter(kept)
+    assert kept.fields == {"sampled_out": 15}
+
+def test_parse_levels():
+    """Test that LOG_LEVELS overrides are parsed and blanks ignored"""
+    assert parse_levels("app.blackjack=debug, app.admin=WARNING,,") == {"app.blackjack": "DEBUG", "app.admin": "WARNING"}
@@ -0,0 +1,59 @@
+import threading
+import time
+import pytest
+import app.app as casino
+from app.app import app
+from app.profiler import SamplingProfiler
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess["admin_authenticated"] = True
+    yield client
+    casino.profiler.configure(enabled=False, rate=0, endpoints=[], reset=True)
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def test_samples_only_selected_threads():
+    """Test that stacks are collected for profiled requests and attributed to their endpoint"""
+    profiler = SamplingProfiler(enabled=True, endpoints=["spin"], interval=0.001)
+    assert profiler.should_profile("spin")
+    assert not profiler.should_profile("menu")
+
+    other = threading.Thread(target=busy_wait, args=(0.1,))
+    other.start()
+    profiler.begin("spin")
+    busy_wait(0.1)
+    profiler.end()
+    other.join()
+
+    lines = profiler.collapsed().splitlines()
+    assert lines and all(line.startswith("spin;") for line in lines)
+    assert any("busy_wait" in line for line in lines)
+    assert profiler.top(1)[0]["function"].startswith("busy_wait")
+
+def test_admin_endpoints_toggle_profiling(admin_client):
+    """Test that the profiler is switched on at runtime and reports collapsed stacks"""
+    response = admin_client.post('/admin/profiler', json={"enabled": True, "endpoints": "metrics", "rate": 0,
+                                                             "interval_ms": 1})
+    assert response.json["enabled"] is True
+    assert response.json["endpoints"] == ["metrics"]
+
+    admin_client.get('/metrics')
+    status = admin_client.get('/admin/profiler').json
+    assert status["requests"] == 1
+
+    collapsed = admin_client.get('/admin/profiler/collapsed')
+    assert collapsed.mimetype == "text/plain"
+    assert all(line.startswith("metrics;") for line in collapsed.text.splitlines())
+
+def test_admin_profiler_requires_admin(tmp_path):
+    """Test that profiler endpoints redirect non-admins to the admin login"""
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        assert client.get('/admin/profiler').status_code == 302
+        assert client.post('/admin/profiler', json={"enabled": True}).status_code == 302
+    assert casino.profiler.enabled is False
@@ -0,0 +1,49 @@
+from datetime import datetime
+from app.retention import compact, iter_cold, load_rollups, record_wager
+
+NOW = datetime(2025, 3, 31, 12, 0, 0)
+
+def make_history():
+    return {
+        "alice": [
+            {"timestamp": "2025-01-05 10:00:00", "type": "slots", "details": "Slots bet: 10 coins", "amount": -10, "result": "lost"},
+            {"timestamp": "2025-01-05 11:00:00", "type": "slots", "details": "Slots bet: 20 coins", "amount": 20, "result": "won"},
+            {"timestamp": "2025-03-30 09:00:00", "type": "roulette", "details": "Roulette bet on red: 5 coins", "amount": -5, "result": "lost", "wager": 5},
+        ],
+        "bob": [
+            {"timestamp": "2025-01-06 08:00:00", "type": "tip_received", "details": "Tip received from alice", "amount": 50, "result": "received"},
+        ],
+    }
+
+def test_record_wager_falls_back_to_details():
+    """Test that wagers are recovered from details on records without a wager field"""
+    assert record_wager({"type": "blackjack", "details": "Blackjack split bet: 40 coins (2 hands)"}) == 40
+    assert record_wager({"type": "tip_sent", "details": "Tip sent to bob", "amount": -5}) == 0
+
+def test_compact_moves_expired_records(tmp_path):
+    """Test that old records become rollups and cold segments while recent ones stay hot"""
+    rollups_file = str(tmp_path / "rollups.json")
+    cold_dir = str(tmp_path / "cold")
+    history = make_history()
+
+    stats = compact(history, hot_days=30, now=NOW, rollups_file=rollups_file, cold_dir=cold_dir)
+
+    assert stats["records"] == 3
+    assert [r["type"] for r in history["alice"]] == ["roulette"]
+    assert "bob" not in history
+
+    rollups = load_rollups(rollups_file)
+    assert rollups["alice"]["2025-01-05"]["slots"] == {"count": 2, "wagered": 30, "net": 10}
+    assert rollups["bob"]["2025-01-06"]["tip_received"]["net"] == 50
+
+    archived = list(iter_cold("alice", cold_dir=cold_dir))
+    assert [r["amount"] for _, r in archived] == [-10, 20]
+
+def test_compact_is_incremental(tmp_path):
+    """Test that a second compaction appends to existing rollups and segments"""
+    kwargs = {"hot_days": 30, "now": NOW, "rollups_file": str(tmp_path / "r.json"), "cold_dir": str(tmp_path / "c")}
+    compact(make_history(), **kwargs)
+    compact(make_history(), **kwargs)
+
+    assert load_rollups(kwargs["rollups_file"])["alice"]["2025-01-05"]["slots"]["count"] == 4
+    assert len(list(iter_cold(cold_dir=kwargs["cold_dir"]))) == 6
@@ -0,0 +1,100 @@
+import time
+import pytest
+from flask import Flask, session
+import app.sessions as sessions
+from app.sessions import MemoryStore, ServerSideSessionInterface
+
+@pytest.fixture
+def store():
+    return MemoryStore(ttl=60, max_entries=3, max_bytes=10_000)
+
+@pytest.fixture
+def client(store):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        session["blackjack"] = {"hand": [value]}
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return session.get("blackjack", {})
+
+    @app.route("/login")
+    def login():
+        session.regenerate()
+        session["username"] = "alice"
+        return "hi"
+
+    @app.route("/logout")
+    def logout():
+        session.clear()
+        return "bye"
+
+    with app.test_client() as client:
+        yield client
+
+def session_cookie(client):
+    cookie = client.get_cookie("session")
+    return cookie.value if cookie else None
+
+def test_cookie_holds_only_an_id(client, store):
+    """Test that session data stays on the server and the cookie carries an opaque ID"""
+    client.get("/set/A♠")
+    sid = session_cookie(client)
+    assert "hand" not in sid and len(store) == 1
+    assert client.get("/get").json == {"hand": ["A♠"]}
+
+def test_unknown_ids_are_not_adopted(client, store):
+    """Test that a forged session ID is replaced by a fresh one"""
+    client.set_cookie("session", "attacker-chosen")
+    client.get("/set/K♥")
+    assert session_cookie(client) != "attacker-chosen"
+
+def test_logout_discards_the_stored_session(client, store):
+    """Test that clearing the session removes it from the store and the browser"""
+    client.get("/set/Q♦")
+    old_sid = session_cookie(client)
+    client.get("/logout")
+    assert store.get(old_sid) is None
+    assert session_cookie(client) is None
+
+def test_login_regenerates_the_id(client, store):
+    """Test that regenerating moves the data to a new ID and the pre-login ID stops working"""
+    client.get("/set/J♣")
+    planted = session_cookie(client)
+    client.get("/login")
+    sid = session_cookie(client)
+    assert sid != planted and store.get(planted) is None
+    assert client.get("/get").json == {"hand": ["J♣"]} and len(store) == 1
+
+def test_lru_eviction_by_count_and_bytes(store):
+    """Test that the least recently used sessions go first when a cap is exceeded"""
+    for sid in "abc":
+        store.set(sid, "x" * 10)
+    store.get("a")
+    store.set("d", "x" * 10)
+    assert store.get("b") is None and store.get("a") is not None
+    store.set("e", "x" * 9_995)
+    assert len(store) == 1 and store.get("e") is not None
+
+def test_entries_expire_after_ttl(store):
+    """Test that sessions past their TTL are no longer returned"""
+    store.ttl = 0.01
+    store.set("a", "{}")
+    time.sleep(0.02)
+    assert store.get("a") is None
+
+def test_each_request_pushes_expiry_back(client, monkeypatch):
+    """Test that the TTL counts from the last request, so an active session outlives it"""
+    clock = [1000.0]
+    monkeypatch.setattr(sessions.time, "time", lambda: clock[0])
+    client.get("/set/7")
+    for _ in range(3):
+        clock[0] += 40
+        assert client.get("/get").json == {"hand": ["7"]}
+    clock[0] += 61
+    assert client.get("/get").json == {}
@@ -0,0 +1,55 @@
+import json
+import pytest
+from app.snapshot import LazyMap, open_snapshot, write_store
+from app.usertable import UserTable
+
+def test_snapshot_round_trip(tmp_path):
+    """Test that a written snapshot serves the same records and columns lazily"""
+    path = str(tmp_path / "users.json")
+    users = UserTable.from_dicts([{"username": "bob", "balance": 5}, {"username": "al", "balance": 9}])
+    write_store(users, path, as_list=True, columns=users.columns())
+
+    with open(path) as f:
+        assert [u["username"] for u in json.load(f)] == ["bob", "al"]
+
+    lazy = UserTable(open_snapshot(path))
+    assert lazy._records == {}
+    assert lazy.total_balance() == 14
+    assert lazy.get("al")["balance"] == 9
+    assert list(lazy._records) == [1]
+    assert len(lazy) == 2
+
+def test_stale_snapshot_is_ignored(tmp_path):
+    """Test that editing the JSON file invalidates its snapshot"""
+    path = str(tmp_path / "balance_history.json")
+    write_store(LazyMap(items=[("a", [])]), path, as_list=False)
+    assert open_snapshot(path) is not None
+
+    with open(path, "w") as f:
+        json.dump({"a": [], "b": []}, f)
+    assert open_snapshot(path) is None
+
+def test_mutations_survive_resave(tmp_path):
+    """Test that added, changed and deleted keys are written back correctly"""
+    path = str(tmp_path / "balance_history.json")
+    write_store(LazyMap(items=[("a", [1]), ("b", [2]), ("c", [3])]), path, as_list=False)
+
+    history = LazyMap(open_snapshot(path))
+    history["a"].append(10)
+    del history["b"]
+    history["d"] = [4]
+    write_store(history, path, as_list=False)
+
+    with open(path) as f:
+        assert json.load(f) == {"a": [1, 10], "c": [3], "d": [4]}
+    assert dict(LazyMap(open_snapshot(path)).items()) == {"a": [1, 10], "c": [3], "d": [4]}
+
+def test_failed_write_leaves_no_temp_files(tmp_path):
+    """Test that a failed save removes its uniquely named temp files and keeps the old store"""
+    path = str(tmp_path / "users.json")
+    users = UserTable.from_dicts([{"username": "bob", "balance": 5}])
+    write_store(users, path, as_list=True, columns=users.columns())
+    with pytest.raises(ValueError):
+        write_store(users, path, as_list=True, columns=users.columns()[:1] + [[]])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["users.json", "users.json.snap"]
+    assert UserTable(open_snapshot(path)).get("bob")["balance"] == 5
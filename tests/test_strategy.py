@@ -0,0 +1,98 @@
+import pytest
+import app.app as casino
+from app.blackjack import BlackjackRound, create_deck
+from app.strategy import (StrategyTable, dealer_outcomes, evaluate, load_table, rank_index,
+                          save_table, FULL_DECK)
+
+def counts_of(*ranks):
+    counts = [0] * 10
+    for rank in ranks:
+        counts[rank_index(rank)] += 1
+    return tuple(counts)
+
+def test_rank_index_accepts_cards_and_ranks():
+    """Test that suited cards and bare ranks map to the same index, and junk is rejected"""
+    assert rank_index("A♠") == rank_index("a") == 0
+    assert rank_index("10♥") == rank_index("T") == rank_index("K") == 9
+    assert rank_index("7♦") == 6
+    for bad in ("", "1", "X♠", "11"):
+        with pytest.raises(ValueError):
+            rank_index(bad)
+
+def test_dealer_outcomes_sum_to_one():
+    """Test that the dealer's outcome distribution is a probability distribution"""
+    for up in range(10):
+        deck = list(FULL_DECK)
+        deck[up] -= 1
+        assert sum(dealer_outcomes(up, tuple(deck))) == pytest.approx(1.0)
+
+def test_natural_pays_three_to_two_against_a_six():
+    """Test that a natural against a 6 is worth exactly 1.5 bets, since the dealer cannot make one"""
+    assert evaluate(counts_of("A", "K"), rank_index("6")) == {"stand": pytest.approx(1.5)}
+
+def test_textbook_decisions():
+    """Test a few decisions every basic strategy chart agrees on"""
+    def best(up, *ranks):
+        evs = evaluate(counts_of(*ranks), rank_index(up))
+        return max(evs, key=evs.get)
+    assert best("T", "T", "6") == "hit"
+    assert best("6", "T", "6") == "stand"
+    assert best("6", "6", "5") == "double"
+    assert best("6", "8", "8") == "split"
+    assert best("5", "T", "T") == "stand"
+
+def test_table_round_trip(tmp_path):
+    """Test that a saved table loads back, and a file from another version is ignored"""
+    path = str(tmp_path / "table.json")
+    save_table({"6T|T": {"hit": -0.5, "stand": -0.54}}, path)
+    assert load_table(path) == {"6T|T": {"hit": -0.5, "stand": -0.54}}
+    (tmp_path / "old.json").write_text('{"version": 0, "hands": {}}')
+    assert load_table(str(tmp_path / "old.json")) is None
+    assert load_table(str(tmp_path / "missing.json")) is None
+
+def test_lookup_prefers_the_stored_table(tmp_path):
+    """Test that lookup answers from the stored table and solves hands missing from it"""
+    path = str(tmp_path / "table.json")
+    save_table({"6T|T": {"hit": 0.25, "stand": 0.5}}, path)
+    table = StrategyTable(path)
+    assert table.lookup(["K♠", "6♥"], "Q♦") == {"hit": 0.25, "stand": 0.5}
+    assert set(table.lookup(["9", "2"], "6")) == {"stand", "hit", "double"}
+    with pytest.raises(ValueError):
+        table.lookup(["A", "A", "A", "A", "A"], "2")  # only four aces in a deck
+
+@pytest.fixture
+def player(client, make_user, tmp_path, monkeypatch):
+    make_user("hint_test")
+    table = StrategyTable(str(tmp_path / "table.json"))
+    monkeypatch.setattr(table, "_table", lambda: None)  # solve directly, no background build
+    monkeypatch.setattr(casino, "strategy_table", table)
+    with client.session_transaction() as sess:
+        sess["username"] = "hint_test"
+    return client
+
+def test_hint_for_given_hand(player):
+    """Test that /blackjack/hint rates a hand given as ranks"""
+    response = player.get("/blackjack/hint?hand=8,8&dealer=6")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data["ev"]) == {"stand", "hit", "double", "split"}
+    assert data["best"] == "split"
+
+def test_hint_for_round_in_play(player):
+    """Test that /blackjack/hint rates the hand in play and leaves out unaffordable actions"""
+    deck = [c for c in create_deck() if c not in ("8♠", "8♥", "10♣", "7♦")] + ["7♦", "10♣", "8♥", "8♠"]
+    rnd = BlackjackRound(deck, 100)
+    rnd.place_bet(150, 0)
+    with player.session_transaction() as sess:
+        sess["blackjack"] = rnd.to_session()
+    data = player.get("/blackjack/hint").get_json()
+    assert data["hand"] == ["8♠", "8♥"] and data["dealer"] == "10♣"
+    assert set(data["ev"]) == {"stand", "hit"}  # a balance of 100 does not cover a second 150
+
+def test_hint_errors(player):
+    """Test that /blackjack/hint rejects bad hands, missing rounds and anonymous users"""
+    assert player.get("/blackjack/hint?hand=8,X&dealer=T").status_code == 400
+    assert player.get("/blackjack/hint").status_code == 404
+    with player.session_transaction() as sess:
+        sess.clear()
+    assert player.get("/blackjack/hint?hand=8,8&dealer=T").status_code == 401
@@ -0,0 +1,41 @@
+import time
+import pytest
+from app.timing import RequestTiming, span, _current
+
+@pytest.fixture
+def client(client, make_user):
+    make_user("timer")
+    with client.session_transaction() as sess:
+        sess["username"] = "timer"
+    return client
+
+def phases(header):
+    return {part.split(";")[0].strip() for part in header.split(",")}
+
+def test_nested_spans_report_their_own_time():
+    """Test that an outer span excludes the time spent in spans nested inside it"""
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        with span("outer"):
+            time.sleep(0.02)
+            with span("inner"):
+                time.sleep(0.1)
+    finally:
+        _current.reset(token)
+    assert timing.phases["inner"] >= 0.1
+    # Had inner been counted, outer would exceed it; the margin absorbs scheduler delays
+    assert 0.02 <= timing.phases["outer"] < timing.phases["inner"]
+
+def test_bet_response_has_server_timing(client):
+    """Test that a slots bet reports every phase it went through"""
+    response = client.post('/slots', data={'bet': '10'})
+    assert response.status_code == 200
+    assert phases(response.headers["Server-Timing"]) >= {
+        "session-decode", "lookup", "logic", "save-users", "log-transaction", "render", "session-encode", "total"}
+
+def test_spans_are_free_outside_requests():
+    """Test that storage functions work without a request timing in scope"""
+    assert _current.get() is None
+    with span("lookup"):
+        pass
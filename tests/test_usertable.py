@@ -0,0 +1,54 @@
+import json
+import time
+from app.snapshot import open_snapshot, write_store
+from app.usertable import UserTable
+
+def save(table, path):
+    write_store(table, path, as_list=True, columns=table.columns())
+
+def test_records_behave_like_user_dicts():
+    """Test that records support the dict operations the routes rely on"""
+    table = UserTable.from_dicts([{"username": "ann", "password": "h", "balance": 100, "is_admin": False, "email": "a@x"}])
+    user = table.get("ann")
+    user["balance"] -= 30
+    assert user.balance == 70 and table.balances[user.id] == 70
+    assert user.get("last_active", 0) == 0 and "last_active" not in user
+    user["last_active"] = 123.0
+    assert user.to_dict() == {"username": "ann", "password": "h", "balance": 70, "is_admin": False,
+                              "last_active": 123.0, "email": "a@x"}
+
+def test_aggregates_read_the_columns():
+    """Test that totals, admin and active counts and rankings come from the arrays"""
+    now = time.time()
+    table = UserTable.from_dicts([
+        {"username": "a", "balance": 10, "last_active": now},
+        {"username": "b", "balance": 50, "is_admin": True},
+        {"username": "c", "balance": 30, "last_active": now - 7200},
+    ])
+    assert table.total_balance() == 90
+    assert table.admin_count() == 1
+    assert table.active_since(now - 3600) == 1
+    assert [u.username for u in table.ranked()] == ["b", "c", "a"]
+    assert [u.username for u in table.ranked(limit=1)] == ["b"]
+    assert sorted(table.balances_by_username()) == [("a", 10), ("b", 50), ("c", 30)]
+
+def test_ids_stay_stable_across_saves(tmp_path):
+    """Test that users added between saves keep their IDs and the store reloads intact"""
+    path = str(tmp_path / "users.json")
+    table = UserTable.from_dicts([{"username": "zed", "balance": 1}, {"username": "amy", "balance": 2}])
+    save(table, path)
+    table = UserTable(open_snapshot(path))
+
+    held = table.get("zed")
+    bea = table.append({"username": "bea", "balance": 3})
+    save(table, path)
+    held["balance"] += 10
+    assert (held.id, bea.id) == (0, 2)
+    assert table.get("bea") is bea and table.get("zed").balance == 11
+    assert table.usernames() == ["amy", "bea", "zed"]
+
+    save(table, path)
+    reloaded = UserTable(open_snapshot(path))
+    assert [reloaded.get(n).balance for n in ("zed", "amy", "bea")] == [11, 2, 3]
+    with open(path) as f:
+        assert [u["username"] for u in json.load(f)] == ["zed", "amy", "bea"]